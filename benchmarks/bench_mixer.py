@@ -0,0 +1,40 @@
+"""ミキサーの合成コストを同時再生数ごとに計測する
+
+使い方: python -m benchmarks.bench_mixer [--frames 2000]
+"""
+import argparse
+import time
+import numpy as np
+from modules.audio_mixer import MixingAudioSource
+from modules.audio_sources import FRAME_SIZE
+
+# 1フレーム（20ms）あたりの処理時間の目安。これを超えると再生が途切れる
+FRAME_BUDGET_US = 20000
+
+def bench_mix_frames(source_count: int, frames: int) -> float:
+    """source_count個の音声を合成したときの1フレームあたりの処理時間（マイクロ秒）を返す"""
+    rng = np.random.default_rng(0)
+    pcm_frames = [
+        rng.integers(-20000, 20000, FRAME_SIZE // 2, dtype=np.int16).astype("<i2").tobytes()
+        for _ in range(source_count)
+    ]
+    # 優先度付きの読み上げにダッキングがかかった状態を想定する
+    gains = [1.0] + [0.35] * (source_count - 1)
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        MixingAudioSource.mix_frames(pcm_frames, gains)
+    return (time.perf_counter() - start) / frames * 1_000_000
+
+def main():
+    parser = argparse.ArgumentParser(description="ミキサーの合成コストを計測します。")
+    parser.add_argument("--frames", type=int, default=2000, help="計測するフレーム数")
+    args = parser.parse_args()
+
+    print(f"{'同時再生数':>8} {'1フレームあたり(us)':>20} {'20ms枠に占める割合':>18}")
+    for source_count in (1, 2, 4, 8, 16, 32):
+        per_frame = bench_mix_frames(source_count, args.frames)
+        print(f"{source_count:>8} {per_frame:>20.1f} {per_frame / FRAME_BUDGET_US:>17.2%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""合成プロファイルごとの合成時間・音声の長さ・読み上げ完了までの時間・エンコード負荷を計測する
+
+VOICEVOXを初期化できない環境では、負荷試験用の代替実装（合成時間は音声の長さに比例）で計測する。
+
+使い方: python -m benchmarks.bench_synthesis_profiles [--repeat 3] [--fake]
+"""
+import argparse
+import asyncio
+import time
+import discord
+from modules.audio_sources import encode_opus_packets
+from modules.synthesis_profile import pcm_seconds
+from modules.voicevox import VoiceVoxHandler
+
+# 長めの読み上げを想定したセグメント（/ask の応答を読み上げ用に分割したものに近い長さ）
+SAMPLE_SEGMENTS = [
+    "こんにちは、春日部つむぎです。",
+    "今日はいい天気ですね、お出かけ日和だと思います！",
+    "えっと、質問の答えなんですけど、いくつかポイントがあります。",
+    "まず一つ目は、毎日少しずつ続けることです。",
+    "二つ目は、分からないところをそのままにしないことですね。",
+    "最後に、楽しみながらやるのがいちばん大事だと思います！",
+]
+
+async def create_handler(use_fake: bool) -> tuple[VoiceVoxHandler, str]:
+    handler = VoiceVoxHandler()
+    if not use_fake and await handler.initialize():
+        return handler, "VOICEVOX"
+
+    from loadtest.backends import FakeSynthesizer, LatencyModel
+
+    handler.synthesizer = FakeSynthesizer(LatencyModel("fixed:0.0"), realtime_factor=0.1)
+    return handler, "代替実装"
+
+async def bench_profile(handler: VoiceVoxHandler, profile, repeat: int) -> dict:
+    """プロファイルで全セグメントを repeat 回合成し、1回あたりの平均値を返す"""
+    synth_seconds = audio_seconds = encode_seconds = 0.0
+    for _ in range(repeat):
+        for segment in SAMPLE_SEGMENTS:
+            start = time.perf_counter()
+            pcm_data = await handler.synthesize_pcm(segment, profile=profile)
+            synth_seconds += time.perf_counter() - start
+            if not pcm_data:
+                raise RuntimeError(f"合成に失敗しました: {segment}")
+            audio_seconds += pcm_seconds(pcm_data)
+
+            if discord.opus.is_loaded():
+                start = time.perf_counter()
+                encode_opus_packets(pcm_data)
+                encode_seconds += time.perf_counter() - start
+
+    audio_seconds /= repeat
+    return {
+        "synth": synth_seconds / repeat,
+        "audio": audio_seconds,
+        # セグメント間の間隔を含めた、読み上げが終わるまでの時間
+        "readout": audio_seconds + profile.segment_gap * (len(SAMPLE_SEGMENTS) - 1),
+        "encode": encode_seconds / repeat,
+    }
+
+async def main_async(args: argparse.Namespace):
+    handler, backend = await create_handler(args.fake)
+    print(f"合成: {backend} / セグメント {len(SAMPLE_SEGMENTS)}件 / {args.repeat}回の平均")
+    if not discord.opus.is_loaded():
+        print("libopusが読み込まれていないため、エンコード時間は計測しません。")
+
+    results = {name: await bench_profile(handler, profile, args.repeat) for name, profile in handler.profiles.items()}
+    baseline = results[handler.default_profile.name]["readout"]
+
+    print(f"\n{'プロファイル':<12}{'合成(秒)':>10}{'音声(秒)':>10}{'読み上げ(秒)':>14}{'エンコード(ms)':>16}{'既定比':>8}")
+    for name, result in results.items():
+        print(
+            f"{name:<12}{result['synth']:>10.2f}{result['audio']:>10.2f}{result['readout']:>14.2f}"
+            f"{result['encode'] * 1000:>16.1f}{result['readout'] / baseline:>8.0%}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="合成プロファイルごとの合成コストと読み上げ時間を計測します。")
+    parser.add_argument("--repeat", type=int, default=3, help="計測の繰り返し回数")
+    parser.add_argument("--fake", action="store_true", help="VOICEVOXを使わず代替実装で計測する")
+    asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""起動時のimportにかかる時間を `python -X importtime` の出力から集計する
+
+使い方: python -m benchmarks.importtime_report [--module main] [--top 20]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple
+
+class ImportRecord(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int  # importのネストの深さ（0が最上位）
+
+def parse_importtime(output: str) -> List[ImportRecord]:
+    """-X importtime の出力（"import time: self [us] | cumulative | imported package"）を解析する"""
+    records = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # 見出し行
+        name = fields[2].rstrip()
+        stripped = name.lstrip()
+        records.append(ImportRecord(
+            module=stripped,
+            self_us=int(fields[0]),
+            cumulative_us=int(fields[1]),
+            depth=(len(name) - len(stripped) - 1) // 2,
+        ))
+    return records
+
+def measure(module: str) -> str:
+    """別プロセスで module をimportし、-X importtime の出力を返す"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env,
+    )
+    if result.returncode != 0:
+        # 途中で失敗しても、それまでのimport時間は集計する
+        print(f"警告: {module} のimportに失敗しました:\n{result.stderr.splitlines()[-1]}")
+    return result.stderr
+
+def summarize_packages(records: List[ImportRecord]) -> Dict[str, int]:
+    """最上位パッケージごとのimport時間（self の合計, マイクロ秒）"""
+    totals: Dict[str, int] = {}
+    for record in records:
+        package = record.module.split(".")[0]
+        totals[package] = totals.get(package, 0) + record.self_us
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="起動時のimport時間を集計します。")
+    parser.add_argument("--module", default="main", help="importするモジュール")
+    parser.add_argument("--top", type=int, default=20, help="表示する件数")
+    args = parser.parse_args()
+
+    records = parse_importtime(measure(args.module))
+    if not records:
+        print("import時間を取得できませんでした。")
+        return
+
+    total_us = sum(record.self_us for record in records)
+    print(f"{args.module} のimport: {len(records)}モジュール / 合計 {total_us / 1000:.1f}ms")
+
+    print(f"\n最上位パッケージ別（上位{args.top}件）")
+    print(f"{'パッケージ':<32}{'時間(ms)':>10}{'割合':>8}")
+    packages = sorted(summarize_packages(records).items(), key=lambda item: item[1], reverse=True)
+    for package, self_us in packages[:args.top]:
+        print(f"{package:<32}{self_us / 1000:>10.1f}{self_us / total_us:>8.1%}")
+
+    print(f"\n{args.module} が直接importしているモジュール（累計時間の上位{args.top}件）")
+    print(f"{'モジュール':<48}{'累計(ms)':>10}")
+    direct = sorted((r for r in records if r.depth == 1), key=lambda r: r.cumulative_us, reverse=True)
+    for record in direct[:args.top]:
+        print(f"{record.module:<48}{record.cumulative_us / 1000:>10.1f}")
+
+if __name__ == "__main__":
+    main()
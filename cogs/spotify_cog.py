@@ -1,14 +1,26 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
 import os
 from discord import ui # uiモジュールをインポート
+from modules.spotify_results import SpotifyResultStore, TrackRecord
+from utils.state_store import StateStore
+from config import SPOTIFY_RESULT_MAX_MESSAGES, SPOTIFY_RESULT_PENDING_SECONDS, SPOTIFY_RESULT_TTL
+
+def component_layout(view: ui.View) -> ui.View:
+    """ボタンの配置だけを送るために、ビューを停止済みにして返す
+
+    停止していないビューを送信するとメッセージごとにクライアントに保持されるため、
+    ボタンの処理は register_views で登録した永続ビューに任せる。
+    """
+    view.stop()
+    return view
 
 class DeleteMessageView(ui.View):
-    def __init__(self, timeout=180):
-        super().__init__(timeout=timeout)
+    """メッセージを削除するボタン（永続ビュー。再起動後も押せる）"""
+
+    def __init__(self):
+        super().__init__(timeout=None)
         delete_button = ui.Button(label="削除", style=discord.ButtonStyle.danger, custom_id="delete_preview_message")
         delete_button.callback = self.delete_message
         self.add_item(delete_button)
@@ -17,72 +29,101 @@ class DeleteMessageView(ui.View):
         await interaction.message.delete()
 
 class SpotifyTrackView(ui.View):
-    def __init__(self, tracks, visible_to_others: bool, timeout=180):
-        super().__init__(timeout=timeout)
-        self.tracks = tracks
-        self.visible_to_others = visible_to_others # 表示設定を保持
-        self.url_button = ui.Button(label="プレビューで表示", style=discord.ButtonStyle.green)
+    """検索結果のURLを表示するボタン（永続ビュー）
+
+    ビュー自体は曲の情報を持たず、押されたメッセージのIDで検索結果のストアから状態を取得する。
+    """
+
+    def __init__(self, results: SpotifyResultStore, disabled: bool = False):
+        super().__init__(timeout=None)
+        self.results = results
+        self.url_button = ui.Button(
+            label="プレビューで表示", style=discord.ButtonStyle.green, custom_id="spotify_show_urls", disabled=disabled
+        )
         self.url_button.callback = self.show_urls
         self.add_item(self.url_button)
 
     async def show_urls(self, interaction: discord.Interaction):
-        if not self.tracks:
-            await interaction.response.send_message("表示するプレビューがありません。", ephemeral=True)
+        result = await self.results.get(interaction.message.id) if interaction.message else None
+        if not result or not result.tracks:
+            if interaction.message and (discord.utils.utcnow() - interaction.message.created_at).total_seconds() < SPOTIFY_RESULT_PENDING_SECONDS:
+                # 送信直後で、検索結果をまだ保存し終えていない
+                await interaction.response.send_message("検索結果を準備しています。少し待ってからもう一度押してください。", ephemeral=True)
+            else:
+                await interaction.response.send_message("表示するプレビューがありません（検索結果の有効期限が切れています）。", ephemeral=True)
             return
 
         # 元のメッセージの「プレビューで表示」ボタンを無効化
-        self.url_button.disabled = True
-        if interaction.message: # interaction.messageが存在することを確認
-            try:
-                await interaction.message.edit(view=self)
-            except discord.NotFound:
-                # メッセージが既に削除されているなどの理由で編集できない場合
-                pass 
-            except discord.Forbidden:
-                # 権限がない場合
-                pass # またはログ出力など
-
-        urls = "\n".join([track['external_urls']['spotify'] for track in self.tracks])
-
-        if self.visible_to_others:
+        try:
+            await interaction.message.edit(view=component_layout(SpotifyTrackView(self.results, disabled=True)))
+        except discord.NotFound:
+            # メッセージが既に削除されているなどの理由で編集できない場合
+            pass 
+        except discord.Forbidden:
+            # 権限がない場合
+            pass # またはログ出力など
+
+        urls = "\n".join(track.url for track in result.tracks)
+
+        if result.visible_to_others:
             # 他の人にも見える場合は削除ボタン付きのViewでメッセージを送信
-            delete_view = DeleteMessageView()
-            await interaction.response.send_message(f"**検索結果のSpotify URL:**\n{urls}", view=delete_view, ephemeral=False)
+            await interaction.response.send_message(f"**検索結果のSpotify URL:**\n{urls}", view=component_layout(DeleteMessageView()), ephemeral=False)
         else:
             # ephemeralなメッセージの場合は削除ボタン不要
             await interaction.response.send_message(f"**検索結果のSpotify URL:**\n{urls}", ephemeral=True)
 
 
 class SpotifyCog(commands.Cog):
-    def __init__(self, bot):
+    def __init__(self, bot, state_store: StateStore | None = None):
         self.bot = bot
-        client_id = os.getenv("SPOTIPY_CLIENT_ID")
-        client_secret = os.getenv("SPOTIPY_CLIENT_SECRET")
+        # 検索結果はメッセージIDごとに曲ID・曲名・アーティスト・URLだけを保持する
+        self.results = SpotifyResultStore(state_store, max_messages=SPOTIFY_RESULT_MAX_MESSAGES, ttl=SPOTIFY_RESULT_TTL)
+        self.client_id = os.getenv("SPOTIPY_CLIENT_ID")
+        self.client_secret = os.getenv("SPOTIPY_CLIENT_SECRET")
+        # spotipyは読み込みに時間がかかるため、クライアントは最初の検索時に作成する
+        self.sp = None
         
-        if not client_id or not client_secret:
+        if not self.client_id or not self.client_secret:
             print("エラー: Spotifyの認証情報が設定されていません。")
+
+    def get_client(self):
+        """Spotifyクライアントを返す（初回のみ作成し、認証情報がない・作成に失敗した場合はNone）"""
+        if self.sp is not None or not self.client_id or not self.client_secret:
+            return self.sp
+
+        try:
+            import spotipy
+            from spotipy.oauth2 import SpotifyClientCredentials
+
+            auth_manager = SpotifyClientCredentials(client_id=self.client_id, client_secret=self.client_secret)
+            self.sp = spotipy.Spotify(auth_manager=auth_manager)
+            print("Spotify APIの初期化に成功しました。")
+        except Exception as e:
+            print(f"Spotify APIの初期化中にエラーが発生しました: {e}")
             self.sp = None
-        else:
-            try:
-                auth_manager = SpotifyClientCredentials(client_id=client_id, client_secret=client_secret)
-                self.sp = spotipy.Spotify(auth_manager=auth_manager)
-                print("Spotify APIの初期化に成功しました。")
-            except Exception as e:
-                print(f"Spotify APIの初期化中にエラーが発生しました: {e}")
-                self.sp = None
+        return self.sp
+
+    def register_views(self):
+        """ボタンが再起動後も動作するよう、永続ビューをクライアントに登録する"""
+        self.bot.add_view(SpotifyTrackView(self.results))
+        self.bot.add_view(DeleteMessageView())
 
     @app_commands.command(name="search_spotify", description="Spotifyで曲を検索します。")
     @app_commands.describe(query="検索する曲名やアーティスト名")
     @app_commands.describe(visible_to_others="結果を他の人にも表示するかどうか (デフォルト: True)")
     async def search_spotify(self, interaction: discord.Interaction, query: str, visible_to_others: bool = True):
-        if not self.sp:
+        sp = self.get_client()
+        if not sp:
             await interaction.response.send_message("Spotify APIが初期化されていません。管理者にお問い合わせください。", ephemeral=True)
             return
 
         await interaction.response.defer(ephemeral=not visible_to_others)
 
+        # 例外クラスを参照するためのもの（get_clientで読み込み済み）
+        from spotipy import SpotifyException
+
         try:
-            results = self.sp.search(q=query, limit=5, type='track', market='JP')
+            results = sp.search(q=query, limit=5, type='track', market='JP')
             tracks = results['tracks']['items']
 
             if not tracks:
@@ -101,10 +142,12 @@ class SpotifyCog(commands.Cog):
                                       f"[Spotifyで聴く]({track_url})",
                                 inline=False)
             
-            view = SpotifyTrackView(tracks, visible_to_others=visible_to_others) # 表示設定をViewに渡す
-            await interaction.followup.send(embed=embed, view=view, ephemeral=not visible_to_others)
+            view = component_layout(SpotifyTrackView(self.results))
+            message = await interaction.followup.send(embed=embed, view=view, ephemeral=not visible_to_others, wait=True)
+            # 表示設定と曲の情報は送信したメッセージのIDで保存する
+            self.results.put(message.id, [TrackRecord.from_api(track) for track in tracks], visible_to_others)
 
-        except spotipy.SpotifyException as e:
+        except SpotifyException as e:
             print(f"Spotify API検索エラー: {e}")
             await interaction.followup.send("Spotifyでの検索中にエラーが発生しました。", ephemeral=True)
         except Exception as e:
@@ -115,6 +158,7 @@ class SpotifyCog(commands.Cog):
 async def setup(bot: commands.Bot):
     cog = SpotifyCog(bot)
     await bot.add_cog(cog)
+    cog.register_views()
     # グローバルコマンドとして登録する場合は、treeへの追加もここで行うか、
     # main.py側でtree.add_command(cog.search_spotify, guild=None) のようにする
     # ここではCogのロードのみに留め、コマンドの同期はmain.pyに任せるのが一般的
@@ -1,17 +1,55 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
-from youtube_transcript_api.formatters import TextFormatter
+import asyncio
 import re
 from modules.gemini_api import GeminiHandler
+from modules.token_accounting import estimate_tokens
+from modules.transcript_compactor import TranscriptCompactor
+from modules.transcript_prefetch import TranscriptCache, TranscriptPrefetcher, TranscriptResult
+from utils.message_renderer import MessageRenderer
+from utils.state_store import StateStore
 from utils.url_validator import URLValidator
+from config import GEMINI_COMPACT_PERSONA, TRANSCRIPT_TIMESTAMP_INTERVAL, VOICE_BUDGET_MODE
+from config import (
+    TRANSCRIPT_CACHE_MAX_BYTES, TRANSCRIPT_CACHE_TTL,
+    YOUTUBE_PREFETCH_MAX_CONCURRENCY, YOUTUBE_PREFETCH_MAX_LINKS, YOUTUBE_PREFETCH_MAX_PENDING,
+)
+
+# 字幕から要約するときのプロンプト（{transcript} に圧縮した字幕が入る）
+TRANSCRIPT_SUMMARY_PROMPT = """以下のYouTube動画の字幕を日本語で要約してください。
+字幕は[分:秒]の目印ごとにまとめてあり、「…（中略）」は省略した箇所です。
+
+要約の要件:
+- 主要なポイントを3-5つの箇条書きで整理
+- 各ポイントは簡潔で分かりやすく
+- 動画の内容を的確に表現
+- 日本語で出力
+
+字幕内容:
+{transcript}"""
 
 class YouTubeCog(commands.Cog):
-    def __init__(self, bot, gemini_handler: GeminiHandler, voice_handler=None):
+    # メッセージ中のURLの候補（YouTubeのURLかどうかはURLValidatorで判定する）
+    URL_PATTERN = re.compile(r'https?://\S+')
+    # 字幕の先読みを有効にしているかどうかのギルド設定
+    PREFETCH_SETTING = "youtube_prefetch"
+
+    def __init__(self, bot, gemini_handler: GeminiHandler, voice_handler=None, phrase_bank=None, state_store: StateStore | None = None):
         self.bot = bot
         self.gemini_handler = gemini_handler
         self.voice_handler = voice_handler
+        self.phrase_bank = phrase_bank
+        self.state_store = state_store
+        self.transcript_compactor = TranscriptCompactor(timestamp_interval=TRANSCRIPT_TIMESTAMP_INTERVAL)
+        self.transcript_api = None  # 字幕取得に使うクラス（未設定ならYouTubeTranscriptApi）
+        self.transcript_cache = TranscriptCache(max_bytes=TRANSCRIPT_CACHE_MAX_BYTES, ttl=TRANSCRIPT_CACHE_TTL)
+        self.prefetcher = TranscriptPrefetcher(
+            self._load_transcript,
+            self.transcript_cache,
+            max_concurrency=YOUTUBE_PREFETCH_MAX_CONCURRENCY,
+            max_pending=YOUTUBE_PREFETCH_MAX_PENDING,
+        )
         
     def extract_video_id(self, url: str) -> str:
         """YouTube URLから動画IDを抽出する（検証強化版）"""
@@ -27,35 +65,95 @@ class YouTubeCog(commands.Cog):
         # 利用できない場合は自動的に標準画質（hqdefault）にフォールバック
         return f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg"
     
-    async def get_transcript(self, video_id: str) -> tuple[bool, str]:
-        """YouTube動画の字幕を取得する"""
+    def transcript_token_budget(self) -> int:
+        """字幕に使える入力トークン数（プロンプトとキャラクター設定の分を差し引く）"""
+        overhead = estimate_tokens(
+            self.gemini_handler.build_prompt(TRANSCRIPT_SUMMARY_PROMPT.format(transcript=""), GEMINI_COMPACT_PERSONA)
+        )
+        # 推定の誤差を見込んで少し余裕を持たせる
+        return int((self.gemini_handler.token_budget("youtube") - overhead) * 0.95)
+
+    @staticmethod
+    def _fetch_transcript_list(transcript_api, video_id: str, no_transcript_error) -> list:
+        """字幕を取得する（通信を待つ同期処理のため、別スレッドで実行する）"""
+        # まず日本語字幕を試す
         try:
-            # まず日本語字幕を試す
-            try:
-                transcript_list = YouTubeTranscriptApi.get_transcript(video_id, languages=['ja'])
-            except NoTranscriptFound:
-                # 日本語字幕がない場合は英語を試す
-                try:
-                    transcript_list = YouTubeTranscriptApi.get_transcript(video_id, languages=['en'])
-                except NoTranscriptFound:
-                    # 英語もない場合は利用可能な任意の言語を使用
-                    transcript_list = YouTubeTranscriptApi.get_transcript(video_id)
-                    
-            formatter = TextFormatter()
-            transcript_text = formatter.format_transcript(transcript_list)
-            
-            # 長すぎる場合は切り詰める（50分程度の動画まで対応: 300,000文字）
-            if len(transcript_text) > 300000:
-                transcript_text = transcript_text[:300000] + "...(以下省略)"
-                
-            return True, transcript_text
-            
+            return transcript_api.get_transcript(video_id, languages=['ja'])
+        except no_transcript_error:
+            pass
+        # 日本語字幕がない場合は英語を試す
+        try:
+            return transcript_api.get_transcript(video_id, languages=['en'])
+        except no_transcript_error:
+            # 英語もない場合は利用可能な任意の言語を使用
+            return transcript_api.get_transcript(video_id)
+
+    async def _load_transcript(self, video_id: str) -> TranscriptResult:
+        """字幕を取得して圧縮する（通信エラーなど一時的な失敗は例外を送出する）"""
+        # youtube_transcript_apiは読み込みに時間がかかるため、最初の字幕取得時に読み込む
+        from youtube_transcript_api import NoTranscriptFound, TranscriptsDisabled, YouTubeTranscriptApi
+
+        transcript_api = self.transcript_api or YouTubeTranscriptApi
+        try:
+            transcript_list = await asyncio.to_thread(
+                self._fetch_transcript_list, transcript_api, video_id, NoTranscriptFound
+            )
         except TranscriptsDisabled:
             return False, "この動画は字幕が無効になっています。"
         except NoTranscriptFound:
             return False, "この動画には字幕が見つかりませんでした。"
+
+        # 重複行・つなぎ言葉・行ごとの時刻を取り除き、長すぎる場合は動画全体から均等に省略する
+        transcript_text = self.transcript_compactor.compact(
+            transcript_list, max_tokens=self.transcript_token_budget()
+        )
+        if not transcript_text:
+            return False, "この動画の字幕は空でした。"
+        return True, transcript_text
+
+    async def get_transcript(self, video_id: str) -> TranscriptResult:
+        """YouTube動画の字幕を取得し、トークンの上限に収まるよう圧縮する
+
+        先読み済み（または先読み中）の動画は、字幕を取得し直さずにその結果を使う。
+        """
+        result = await self.prefetcher.get(video_id)
+        if result is not None:
+            print(f"先読みした字幕を使用します（動画ID: {video_id}）")
+            return result
+
+        try:
+            result = await self._load_transcript(video_id)
         except Exception as e:
             return False, f"字幕の取得中にエラーが発生しました: {str(e)}"
+        self.transcript_cache.put(video_id, result)
+        return result
+
+    def prefetch_enabled(self, guild_id: int) -> bool:
+        return bool(self.state_store and self.state_store.get_guild_setting(guild_id, self.PREFETCH_SETTING, False))
+
+    async def on_message(self, message: discord.Message):
+        """先読みを有効にしているギルドでYouTubeのリンクが投稿されたら、字幕の取得を始めておく"""
+        if message.author.bot or not message.guild or not self.prefetch_enabled(message.guild.id):
+            return
+
+        for url in self.URL_PATTERN.findall(message.content)[:YOUTUBE_PREFETCH_MAX_LINKS]:
+            video_id = self.extract_video_id(url)
+            if video_id and self.prefetcher.schedule(video_id):
+                print(f"字幕の先読みを開始しました（動画ID: {video_id}）")
+
+    @app_commands.command(name="youtube_prefetch", description="YouTubeのリンクが投稿されたときに字幕を先読みするかどうかを設定します。")
+    @app_commands.describe(enabled="先読みを有効にするかどうか")
+    @app_commands.default_permissions(manage_guild=True)
+    async def youtube_prefetch(self, interaction: discord.Interaction, enabled: bool):
+        if not self.state_store:
+            await interaction.response.send_message("設定を保存できません。", ephemeral=True)
+            return
+
+        self.state_store.set_guild_setting(interaction.guild.id, self.PREFETCH_SETTING, enabled)
+        message = f"字幕の先読みを{'有効' if enabled else '無効'}にしました。"
+        if enabled and self.bot and not self.bot.intents.message_content:
+            message += "\n（Botのメッセージ内容のインテントが無効なため、管理者が有効にするまで先読みは行われません）"
+        await interaction.response.send_message(message, ephemeral=True)
     
     @app_commands.command(name="summarize_youtube", description="YouTube動画のリンクから要約を生成します。")
     @app_commands.describe(url="要約するYouTube動画のURL")
@@ -96,30 +194,23 @@ class YouTubeCog(commands.Cog):
             
             if transcript_success:
                 # 字幕が取得できた場合は従来の方法で要約
-                summary_prompt = f"""以下のYouTube動画の字幕を日本語で要約してください。
+                summary_prompt = TRANSCRIPT_SUMMARY_PROMPT.format(transcript=transcript)
 
-                要約の要件:
-                - 主要なポイントを3-5つの箇条書きで整理
-                - 各ポイントは簡潔で分かりやすく
-                - 動画の内容を的確に表現
-                - 日本語で出力
-
-                字幕内容:
-                {transcript}"""
-
-                success, summary = await self.gemini_handler.generate_response(summary_prompt)
+                # 長い入力では短いキャラクター設定を使う
+                success, summary = await self.gemini_handler.generate_response(
+                    summary_prompt, command="youtube", guild_id=interaction.guild.id, persona=GEMINI_COMPACT_PERSONA
+                )
                 summary_method = "字幕"
             else:
                 # 字幕が取得できない場合はYouTube URLを直接使用
                 print(f"字幕取得失敗、URL直接処理に切り替え: {transcript}")
-                success, summary = await self.gemini_handler.generate_youtube_summary(url)
+                success, summary = await self.gemini_handler.generate_youtube_summary(url, guild_id=interaction.guild.id)
                 summary_method = "動画"
             
             if success and summary:
                 # 応答をテキストで送信
                 embed = discord.Embed(
                     title="YouTube動画要約(動画リンク)",
-                    description=summary,
                     color=discord.Color.red(),
                     url=url
                 )
@@ -128,55 +219,36 @@ class YouTubeCog(commands.Cog):
                 embed.set_image(url=thumbnail_url)
                 embed.set_footer(text=f"動画ID: {video_id} | 要約方法: {summary_method}ベース")
                 
-                max_length = 4096  # Discord embedの制限
-                if len(summary) > max_length:
-                    # 長すぎる場合は分割
-                    chunks = [summary[i:i + max_length] for i in range(0, len(summary), max_length)]
-                    embed.description = chunks[0]
-                    
-                    # Interactionが有効かチェックして送信
-                    try:
-                        await interaction.followup.send(embed=embed)
-                    except discord.errors.NotFound:
-                        # Interactionが無効な場合は直接チャンネルに送信
-                        await interaction.channel.send(embed=embed)
-                    
-                    # レート制限回避のため間隔を空けて送信
-                    import asyncio
-                    for chunk in chunks[1:]:
-                        await asyncio.sleep(1)  # 1秒間隔で送信
-                        await interaction.channel.send(chunk)
-                else:
-                    # Interactionが有効かチェックして送信
-                    try:
-                        await interaction.followup.send(embed=embed)
-                    except discord.errors.NotFound:
-                        # Interactionが無効な場合は直接チャンネルに送信
-                        await interaction.channel.send(embed=embed)
+                # 長い要約は続きのEmbedに分け、できるだけ1つのメッセージにまとめて送信する
+                await MessageRenderer.send(interaction, summary, embed=embed)
                     
                 # ボイスチャンネルに参加していれば、要約を読み上げる
                 if interaction.guild.voice_client and interaction.guild.voice_client.is_connected() and self.voice_handler:
-                    speech_segments = self.gemini_handler.split_text_for_speech(summary)
+                    speech_text = summary
+                    if VOICE_BUDGET_MODE == "speech_summary":
+                        # 字幕全体を再送しないよう、生成済みの要約から読み上げ用の短い文章を作る
+                        speech_success, speech_result = await self.gemini_handler.generate_speech_response(
+                            f"次のYouTube動画の要約を、読み上げ用に短くまとめてください。\n\n{summary}",
+                            guild_id=interaction.guild.id,
+                        )
+                        if speech_success and speech_result:
+                            speech_text = speech_result
+
+                    speech_segments = self.gemini_handler.split_text_for_speech(speech_text)
+                    # 読み上げ時間の上限内に収まるセグメントだけを、ギルドで選択されている合成プロファイルで合成する
+                    profile = self.voice_handler.profile_for(interaction.guild.id)
+                    planned_segments = self.voice_handler.plan_speech(speech_segments, profile=profile)
                     
-                    for segment in speech_segments:
-                        if not interaction.guild.voice_client or not interaction.guild.voice_client.is_connected():
-                            break
-                            
-                        if interaction.guild.voice_client.is_playing():
-                            import asyncio
-                            await asyncio.sleep(1)  # レート制限考慮で少し長めに待機
-                            continue
-                            
-                        audio_data = await self.voice_handler.synthesize_voice(segment)
-                        if audio_data:
-                            await self.voice_handler.play_audio_in_vc(interaction.guild.voice_client, audio_data)
-                            await asyncio.sleep(0.5)  # 音声セグメント間に間隔を設ける
+                    # 先頭の文から再生を始め、再生中に次のセグメントを準備・合成しながら順に読み上げる
+                    await self.voice_handler.speak_segments(interaction.guild, planned_segments, profile=profile)
                             
             else:
                 try:
                     await interaction.followup.send("要約の生成に失敗しました。")
                 except discord.errors.NotFound:
                     await interaction.channel.send("要約の生成に失敗しました。")
+                if self.phrase_bank:
+                    await self.phrase_bank.play(interaction.guild.voice_client, "summary_failed")
                 
         except Exception as e:
             print(f"YouTube要約処理中にエラーが発生しました: {e}")
@@ -194,4 +266,6 @@ class YouTubeCog(commands.Cog):
             try:
                 await interaction.followup.send(error_message)
             except discord.errors.NotFound:
-                await interaction.channel.send(error_message)
\ No newline at end of file
+                await interaction.channel.send(error_message)
+            if self.phrase_bank:
+                await self.phrase_bank.play(interaction.guild.voice_client, "error")
\ No newline at end of file
@@ -48,3 +48,167 @@ if (value < 0) {
 }
 ```
 """
+
+# ボイスチャンネル自動切断
+AUTO_DISCONNECT_GRACE_SECONDS = 30.0  # Botだけになってから自動切断するまでの猶予時間（秒）
+
+# ボイス接続
+VOICE_CONNECT_TIMEOUT = 10.0  # 1回の接続（ハンドシェイク）の待ち時間の上限（秒）
+VOICE_CONNECT_ATTEMPTS = 3  # 接続を試みる回数
+VOICE_CONNECT_RETRY_BACKOFF = 1.0  # 再試行までの待ち時間（秒。試行回数に比例して伸ばす）
+VOICE_RECONNECT_WAIT = 15.0  # 読み上げ中にdiscord.pyが再接続している場合に、復帰を待って続きを読み上げる時間の上限（秒）
+
+# 読み上げ前処理
+READING_DICT_CHECK_INTERVAL = 5.0  # 読み辞書ファイルの更新を確認する間隔（秒）
+
+# 読み上げ時間の上限
+VOICE_MAX_SPEECH_SECONDS = 30.0  # 1回の応答で読み上げる最大時間（秒）
+VOICE_BUDGET_MODE = "truncate"  # "truncate": 文末で打ち切る / "speech_summary": 読み上げ用の短い応答を別途生成する
+VOICE_SPEECH_SUMMARY_MAX_CHARS = 100  # 読み上げ用応答の目安文字数
+
+# 状態ストア（キャッシュ・ギルド設定の永続化）
+STATE_DB_PATH = "data/state.db"  # SQLiteデータベースのパス（作業ディレクトリからの相対パス）
+STATE_FLUSH_INTERVAL = 1.0  # 書き込みをまとめて反映する間隔（秒）
+STATE_BATCH_SIZE = 200  # この件数に達したら間隔を待たずに反映する
+
+# 停止処理
+SHUTDOWN_DRAIN_TIMEOUT = 8.0  # 停止時に実行中の処理を待つ最大時間（秒）。docker stopの猶予（10秒）より短くする
+
+# フレーズバンク（起動時にあらかじめ合成しておく定型文）
+PHRASE_BANK_PATH = "data/phrase_bank.bin"
+PHRASE_BANK = {
+    "hello": "こんにちは！つむぎです。",
+    "no_response": "つむぎから応答がありませんでした。",
+    "error": "申し訳ありません、処理中にエラーが発生しました。",
+    "summary_failed": "要約の生成に失敗しました。",
+}
+
+# 合成プロファイル（ギルドごとに /voice_profile で選択する。無音の長さ・話速を短くするほど早く読み終わり、合成・エンコードの負荷も減る）
+SYNTHESIS_PROFILES = {
+    "standard": {  # VOICEVOXの既定値
+        "speed_scale": 1.0,
+        "pre_phoneme_length": 0.1,
+        "post_phoneme_length": 0.1,
+        "pause_length_scale": 1.0,
+        "segment_gap": 0.5,
+    },
+    "quick": {
+        "speed_scale": 1.15,
+        "pre_phoneme_length": 0.05,
+        "post_phoneme_length": 0.05,
+        "pause_length_scale": 0.7,
+        "segment_gap": 0.25,
+    },
+    "fast": {  # 長い読み上げ向け（前後の無音も取り除く）
+        "speed_scale": 1.3,
+        "pre_phoneme_length": 0.0,
+        "post_phoneme_length": 0.0,
+        "pause_length_scale": 0.5,
+        "segment_gap": 0.1,
+        "trim_silence": True,
+    },
+}
+SYNTHESIS_DEFAULT_PROFILE = "standard"
+SYNTHESIS_SILENCE_THRESHOLD = 256  # 無音とみなす振幅（16bit PCM）
+
+# ストリーミング合成（先頭のチャンクができた時点で再生を開始する）
+VOICEVOX_STREAMING = True
+VOICEVOX_STREAM_FIRST_CHUNK_FRAMES = 24  # 最初のチャンクのフレーム数（約93.75フレーム/秒）。小さいほど早く再生が始まる
+VOICEVOX_STREAM_CHUNK_FRAMES = 94  # 2つ目以降のチャンクのフレーム数（約1秒）
+
+# ミキサー（複数の音声を重ねて再生する）
+MIXER_DUCK_GAIN = 0.35  # 優先度の高い音声の再生中に、低い優先度の音声にかける音量倍率
+
+# 合成済み音声のキャッシュ（Opusパケットとして保持し、再生時のエンコードを省く）
+OPUS_CACHE_MAX_BYTES = 8 * 1024 * 1024  # キャッシュの上限サイズ（バイト）
+
+# Spotify検索結果（ボタンの処理に使う曲の情報をメッセージIDごとに保持する）
+SPOTIFY_RESULT_MAX_MESSAGES = 1000  # メモリ上に保持する検索結果の件数
+SPOTIFY_RESULT_TTL = 7 * 24 * 3600  # 状態ストアに保存した検索結果の有効期間（秒）。これより古いボタンは応答しない
+SPOTIFY_RESULT_PENDING_SECONDS = 5.0  # 送信からこの秒数以内に検索結果が見つからない場合は「準備中」として扱う
+
+# YouTube字幕の先読み（リンクが投稿された時点で字幕を取得しておく。ギルドごとに /youtube_prefetch で有効にする）
+YOUTUBE_PREFETCH_ENABLED = False  # メッセージ内容のインテント（特権インテント。Developer Portalで有効にしておくこと）を使うか
+YOUTUBE_PREFETCH_MAX_CONCURRENCY = 2  # 同時に取得する字幕の数
+YOUTUBE_PREFETCH_MAX_PENDING = 20  # 取得中・待機中の件数の上限（超えたリンクは先読みしない）
+YOUTUBE_PREFETCH_MAX_LINKS = 3  # 1つのメッセージから先読みするリンクの数
+TRANSCRIPT_CACHE_MAX_BYTES = 4 * 1024 * 1024  # 取得した字幕を保持する合計サイズの上限（バイト）
+TRANSCRIPT_CACHE_TTL = 3600.0  # 取得した字幕を再利用する期間（秒）
+
+# Geminiのトークン管理
+GEMINI_TOKEN_BUDGETS = {  # コマンドごとの入力トークンの上限
+    "ask": 8000,
+    "speech": 8000,
+    # 字幕は整形・間引きしてこの範囲に収める（以前の30万文字の上限より小さく、1回で1分あたりの上限を使い切らない）
+    "youtube": 120000,
+    "default": 16000,
+}
+GEMINI_EXACT_COUNT_RATIO = 0.8  # 推定値が上限のこの割合を超えたらcount_tokensで正確に数える
+TRANSCRIPT_TIMESTAMP_INTERVAL = 300  # 字幕に時刻の目印を入れる間隔（秒）。行ごとの時刻はまとめる
+
+# 長い入力（YouTube字幕など）に付ける短いキャラクター設定
+GEMINI_COMPACT_PERSONA = """
+あなたは「つむぎ」。埼玉の高校に通う明るいギャルで、一人称は「あーし」、相手は「君」と呼ぶ。
+軽めのノリだけど「ですます調」で、分かりやすく正確に答える。
+"""
+
+# Gemini APIのリクエスト制御
+GEMINI_MAX_CONCURRENCY = 4  # 同時に実行するリクエストの最大数
+GEMINI_REQUESTS_PER_MINUTE = 10  # 1分あたりに開始するリクエストの最大数（APIのクォータに合わせる）
+GEMINI_MAX_QUEUE_WAIT = 14 * 60  # 待機時間の上限（秒）。インタラクションの有効期限（15分）内に応答できるようにする
+GEMINI_COMMAND_PRIORITIES = {  # 0: 対話的なリクエスト（優先） / 1: 大きなリクエスト
+    "ask": 0,
+    "speech": 0,
+    "youtube": 1,
+}
+
+# Geminiモデルの振り分け（先頭のモデルを優先し、遅い・制限中の場合は次のモデルを使う）
+GEMINI_FAST_MODEL_NAME = "gemini-2.5-flash-lite"  # 短い会話向けの高速なモデル
+GEMINI_MODEL_ROUTES = {
+    "chat": {  # キャラクターとしての短い返答（80文字程度）
+        "models": [GEMINI_FAST_MODEL_NAME, GEMINI_MODEL_NAME],
+        "max_output_tokens": 512,  # 80文字より余裕を持たせる
+        "temperature": 0.9,
+        "max_input_tokens": 4000,  # これを超える入力は "long" で処理する
+        "timeout": 20.0,
+        "slow_seconds": 8.0,  # 平均応答時間がこれを超えたら次のモデルを優先する
+    },
+    "speech": {  # 読み上げ用の短い返答
+        "models": [GEMINI_FAST_MODEL_NAME, GEMINI_MODEL_NAME],
+        "max_output_tokens": 256,
+        "temperature": 0.7,
+        "max_input_tokens": 4000,
+        "timeout": 15.0,
+        "slow_seconds": 6.0,
+    },
+    "long": {  # 字幕・動画の要約など大きな入力
+        "models": [GEMINI_MODEL_NAME, GEMINI_FAST_MODEL_NAME],
+        "max_output_tokens": 2048,
+        "temperature": 0.4,
+        "timeout": 120.0,
+        "slow_seconds": 60.0,
+    },
+}
+# 思考モデルは思考トークンも max_output_tokens に含まれ、ルートの上限では本文を出す前に打ち切られることがある
+# google-generativeai では思考予算を指定できないため、モデルごとの上限（Noneは上限なし）をルートの上限より優先する
+GEMINI_MODEL_MAX_OUTPUT_TOKENS = {GEMINI_MODEL_NAME: None}
+GEMINI_COMMAND_ROUTES = {"ask": "chat", "speech": "speech", "youtube": "long"}
+GEMINI_LONG_ROUTE = "long"  # 入力が大きい場合や未登録のコマンドに使うルート
+GEMINI_THROTTLE_COOLDOWN = 60.0  # 429を返したモデルを後回しにする時間（秒）
+
+# /askの意味キャッシュ（言い換えられた同じ質問にはGeminiを呼ばずに以前の回答を返す）
+SEMANTIC_CACHE_ENABLED = True
+SEMANTIC_CACHE_BACKEND = "gemini"  # "gemini": Geminiの埋め込みモデル / "hashing": ローカルの内容語のハッシュ（APIを使わない）
+SEMANTIC_CACHE_GEMINI_MODEL = "models/text-embedding-004"
+# 埋め込みのリクエストは応答の生成とは別の枠で制限する（埋め込みモデルの上限に合わせる）
+SEMANTIC_CACHE_EMBED_CONCURRENCY = 4
+SEMANTIC_CACHE_EMBED_RPM = 1500
+SEMANTIC_CACHE_EMBED_MAX_WAIT = 2.0  # 埋め込みの待ち時間がこれを超えそうなら、キャッシュを使わずに応答を生成する
+SEMANTIC_CACHE_THRESHOLDS = {  # 同じ質問とみなすコサイン類似度（埋め込みの種類ごと）
+    "gemini": 0.9,
+    "hashing": 0.85,  # 内容語が同じ言い換えは0.95以上、内容語が違う質問（「好きな」と「嫌いな」など）は0.7未満になる
+}
+SEMANTIC_CACHE_TTL = 24 * 3600  # 回答を再利用する期間（秒）
+SEMANTIC_CACHE_MAX_ENTRIES = 500  # ギルドごとのエントリ数の上限（超えたら最も使われていないものから削除）
+SEMANTIC_CACHE_COMMANDS = ("ask",)  # キャッシュするコマンド（読み上げ用の応答や要約は対象外）
+SEMANTIC_CACHE_IGNORED_WORDS = ("つむぎちゃん", "つむぎ", "つっむ")  # 比較時に取り除く呼びかけ
@@ -0,0 +1,187 @@
+"""負荷試験用のGemini・Spotify・字幕取得・VOICEVOXの代替実装
+
+どれも実際のAPIと同じ呼び出し方（同期・非同期の区別を含む）で、指定した分布の遅延を入れて応答する。
+"""
+import asyncio
+import io
+import math
+import random
+import time
+import wave
+from types import SimpleNamespace
+
+class LatencyModel:
+    """遅延の分布（"fixed:0.5" / "uniform:0.2:1.0" / "lognormal:中央値:sigma" の形式で指定する）"""
+
+    def __init__(self, spec: str, rng: random.Random | None = None):
+        self.spec = spec
+        self.rng = rng or random.Random()
+        kind, *params = spec.split(":")
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2}
+        if kind not in expected or len(self.params) != expected[kind]:
+            raise ValueError(f"遅延の指定が不正です: {spec}")
+
+    def sample(self) -> float:
+        """遅延（秒）を1つ返す"""
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return self.rng.uniform(*self.params)
+        median, sigma = self.params
+        return self.rng.lognormvariate(math.log(median), sigma)
+
+    def __str__(self) -> str:
+        return self.spec
+
+
+class FakeGeminiModel:
+    """GenerativeModelの代替（generate_content_async / count_tokens_async）"""
+
+    def __init__(self, latency: LatencyModel, reply_chars: int = 120, error_rate: float = 0.0):
+        self.latency = latency
+        self.reply_chars = reply_chars
+        self.error_rate = error_rate
+        self.calls = 0
+
+    async def generate_content_async(self, contents):
+        self.calls += 1
+        await asyncio.sleep(self.latency.sample())
+        if self.error_rate and self.latency.rng.random() < self.error_rate:
+            raise RuntimeError("429 Resource has been exhausted (負荷試験で発生させたエラー)")
+
+        prompt = contents if isinstance(contents, str) else str(contents[0])
+        text = ("あーしが答えますね！いい感じです✨ " * (self.reply_chars // 18 + 1))[:self.reply_chars]
+        candidate = SimpleNamespace(
+            content=SimpleNamespace(parts=[SimpleNamespace(text=text)]),
+            finish_reason=SimpleNamespace(name="STOP"),
+        )
+        return SimpleNamespace(
+            text=text,
+            candidates=[candidate],
+            prompt_feedback=None,
+            usage_metadata=SimpleNamespace(prompt_token_count=len(prompt), candidates_token_count=len(text)),
+        )
+
+    async def count_tokens_async(self, contents):
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(total_tokens=len(str(contents)))
+
+
+class FakeSpotify:
+    """spotipy.Spotifyの代替（実物と同じく同期的に待つため、イベントループを止める）"""
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+
+    def search(self, q: str, limit: int = 5, type: str = "track", market: str = "JP"):
+        time.sleep(self.latency.sample())
+        items = [
+            {
+                "name": f"{q} {i + 1}",
+                "artists": [{"name": "春日部つむぎ"}],
+                "album": {"name": "負荷試験"},
+                "external_urls": {"spotify": f"https://open.spotify.com/track/loadtest{i}"},
+            }
+            for i in range(limit)
+        ]
+        return {"tracks": {"items": items}}
+
+
+class FakeTranscriptApi:
+    """YouTubeTranscriptApiの代替（実物と同じく同期的に待つ）"""
+
+    latency: LatencyModel = LatencyModel("fixed:0.5")
+    lines = 600  # 10分程度の動画の字幕行数
+
+    @classmethod
+    def get_transcript(cls, video_id: str, languages=None):
+        time.sleep(cls.latency.sample())
+        return [
+            {"text": f"今日は動画{video_id}の{i // 3}番目の話題について話します", "start": i * 1.0, "duration": 1.0}
+            for i in range(cls.lines)
+        ]
+
+
+class FakeSynthesizer:
+    """VOICEVOXのSynthesizerの代替（合成時間は文字数に比例させ、無音に近いPCMを返す）"""
+
+    FRAME_RATE = 93.75  # VOICEVOXの音響特徴量のフレームレート
+    SECONDS_PER_CHAR = 0.12  # 1文字あたりの読み上げ時間
+
+    def __init__(self, latency: LatencyModel, realtime_factor: float = 0.1):
+        """
+        Args:
+            latency: AudioQuery作成などの固定的な遅延
+            realtime_factor: 音声1秒あたりの合成時間（秒）
+        """
+        self.latency = latency
+        self.realtime_factor = realtime_factor
+
+    async def create_audio_query(self, text: str, style_id: int):
+        await asyncio.sleep(self.latency.sample())
+        mora = SimpleNamespace(consonant_length=0.04, vowel_length=self.SECONDS_PER_CHAR - 0.04)
+        return SimpleNamespace(
+            accent_phrases=[SimpleNamespace(moras=[mora] * len(text), pause_mora=None)],
+            speed_scale=1.0,
+            pre_phoneme_length=0.1,
+            post_phoneme_length=0.1,
+            pause_length_scale=1.0,
+            output_sampling_rate=24000,
+            output_stereo=False,
+        )
+
+    @staticmethod
+    def _voiced_seconds(audio_query) -> float:
+        """前後の無音を除いた、話している部分の長さ（話速を反映する）"""
+        moras = sum(len(phrase.moras) for phrase in audio_query.accent_phrases)
+        return moras * FakeSynthesizer.SECONDS_PER_CHAR / (audio_query.speed_scale or 1.0)
+
+    @staticmethod
+    def _duration(audio_query) -> float:
+        return (FakeSynthesizer._voiced_seconds(audio_query)
+                + audio_query.pre_phoneme_length + audio_query.post_phoneme_length)
+
+    @staticmethod
+    def _wav(seconds: float, sampling_rate: int, stereo: bool, silence_before: float = 0.0,
+             silence_after: float = 0.0) -> bytes:
+        """前後に無音を置いた、小さな振幅の矩形波のWAVデータを返す"""
+        channels = 2 if stereo else 1
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(channels)
+            wav.setsampwidth(2)
+            wav.setframerate(sampling_rate)
+            wav.writeframes(b"\x00\x00" * channels * int(silence_before * sampling_rate))
+            wav.writeframes((b"\xe8\x03" * channels + b"\x18\xfc" * channels) * int(seconds * sampling_rate / 2))
+            wav.writeframes(b"\x00\x00" * channels * int(silence_after * sampling_rate))
+        return buffer.getvalue()
+
+    async def synthesis(self, audio_query, style_id: int) -> bytes:
+        await asyncio.sleep(self._duration(audio_query) * self.realtime_factor)
+        return self._wav(
+            self._voiced_seconds(audio_query),
+            audio_query.output_sampling_rate,
+            audio_query.output_stereo,
+            silence_before=audio_query.pre_phoneme_length,
+            silence_after=audio_query.post_phoneme_length,
+        )
+
+
+class FakeStreamingSynthesizer(FakeSynthesizer):
+    """分割レンダリング（precompute_render/render）にも対応したSynthesizerの代替"""
+
+    async def precompute_render(self, audio_query, style_id: int):
+        await asyncio.sleep(self.latency.sample())
+        seconds = self._duration(audio_query)
+        return SimpleNamespace(
+            frame_length=int(seconds * self.FRAME_RATE),
+            sampling_rate=audio_query.output_sampling_rate,
+            stereo=audio_query.output_stereo,
+        )
+
+    async def render(self, audio_feature, start: int, stop: int) -> bytes:
+        seconds = (stop - start) / self.FRAME_RATE
+        await asyncio.sleep(seconds * self.realtime_factor)
+        return self._wav(seconds, audio_feature.sampling_rate, audio_feature.stereo)
@@ -0,0 +1,191 @@
+"""負荷試験用のDiscordオブジェクト（Interaction・VoiceClient・チャンネルなど）の代替実装
+
+Cogのコマンドが使う属性・メソッドだけを実装し、送信されたメッセージと応答までの時間を記録する。
+"""
+import asyncio
+import datetime
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+from typing import List, Optional
+import discord
+
+# 送信されたメッセージにこれらが含まれていれば失敗として数える
+ERROR_MARKERS = ("エラー", "失敗", "混み合って", "長すぎます", "見つかりません", "初期化されていません")
+
+_ids = itertools.count(10_000)
+
+def _message_text(content=None, embed=None, embeds=None) -> str:
+    parts = [content or ""]
+    for item in ([embed] if embed else []) + list(embeds or []):
+        parts.append(item.description or "")
+    return "\n".join(parts)
+
+
+class FakeVoiceClient:
+    """VoiceClientの代替（AudioPlayerと同じく別スレッドで20msごとにフレームを読み出す）"""
+
+    FRAME_INTERVAL = 0.02
+
+    def __init__(self, guild: "FakeGuild", channel: "FakeVoiceChannel"):
+        self.guild = guild
+        self.channel = channel
+        self.source: Optional[discord.AudioSource] = None
+        self._connected = True
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.frames_played = 0
+        self.underruns = 0  # 再生スレッドが20msの枠に間に合わなかった回数
+        self._encoder = None
+        if discord.opus.is_loaded():
+            # 実際の再生と同じCPU負荷にするため、PCMはOpusにエンコードする
+            self._encoder = discord.opus.Encoder()
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def is_playing(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    def play(self, source: discord.AudioSource, *, after=None, **kwargs):
+        if self.is_playing():
+            raise discord.ClientException("Already playing audio.")
+        self.source = source
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(source, after, self._stop), daemon=True)
+        self._thread.start()
+
+    def _run(self, source: discord.AudioSource, after, stop: threading.Event):
+        error = None
+        next_frame = time.perf_counter()
+        try:
+            while not stop.is_set():
+                data = source.read()
+                if not data:
+                    break
+                if self._encoder and not source.is_opus():
+                    self._encoder.encode(data, discord.opus.Encoder.SAMPLES_PER_FRAME)
+                self.frames_played += 1
+                next_frame += self.FRAME_INTERVAL
+                delay = next_frame - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    self.underruns += 1
+        except Exception as e:
+            error = e
+        finally:
+            stop.set()
+            source.cleanup()
+            if after:
+                after(error)
+
+    def stop(self):
+        self._stop.set()
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self, force: bool = False):
+        self.stop()
+        self._connected = False
+        self.guild.voice_client = None
+
+
+class FakeVoiceChannel:
+    connect_latency = None  # 接続（ハンドシェイク）の遅延（LatencyModel）
+    rtc_region = None
+
+    def __init__(self, guild: "FakeGuild"):
+        self.id = next(_ids)
+        self.name = f"ボイス{self.id}"
+        self.guild = guild
+        self.members = []
+
+    async def connect(self, **kwargs) -> FakeVoiceClient:
+        if self.connect_latency:
+            await asyncio.sleep(self.connect_latency.sample())
+        self.guild.voice_client = FakeVoiceClient(self.guild, self)
+        return self.guild.voice_client
+
+
+class FakeTextChannel:
+    def __init__(self, recorder: "FakeInteraction | None" = None):
+        self.id = next(_ids)
+        self.recorder = recorder
+        self.sent: List[str] = []
+
+    async def send(self, content=None, *, embed=None, embeds=None, **kwargs):
+        text = _message_text(content, embed, embeds)
+        self.sent.append(text)
+        if self.recorder:
+            self.recorder.record(text)
+
+
+class FakeGuild:
+    def __init__(self, connect_voice: bool = True):
+        self.id = next(_ids)
+        self.voice_channel = FakeVoiceChannel(self)
+        self.voice_client: Optional[FakeVoiceClient] = None
+        if connect_voice:
+            self.voice_client = FakeVoiceClient(self, self.voice_channel)
+
+
+class FakeInteractionResponse:
+    def __init__(self, interaction: "FakeInteraction"):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def defer(self, **kwargs):
+        self._done = True
+        self._interaction.acknowledged_at = time.perf_counter()
+
+    async def send_message(self, content=None, *, embed=None, embeds=None, **kwargs):
+        self._done = True
+        self._interaction.acknowledged_at = time.perf_counter()
+        self._interaction.record(_message_text(content, embed, embeds))
+
+
+class FakeFollowup:
+    def __init__(self, interaction: "FakeInteraction"):
+        self._interaction = interaction
+
+    async def send(self, content=None, *, embed=None, embeds=None, **kwargs):
+        self._interaction.record(_message_text(content, embed, embeds))
+        return SimpleNamespace(id=next(_ids))
+
+
+class FakeInteraction:
+    """Interactionの代替（最初の応答・最初のメッセージまでの時間と、送信内容を記録する）"""
+
+    def __init__(self, guild: FakeGuild, user_name: str = "loadtest"):
+        self.id = next(_ids)
+        self.guild = guild
+        self.guild_id = guild.id
+        self.channel = FakeTextChannel(recorder=self)
+        self.user = SimpleNamespace(id=next(_ids), name=user_name, voice=SimpleNamespace(channel=guild.voice_channel))
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.message = None
+        self.response = FakeInteractionResponse(self)
+        self.followup = FakeFollowup(self)
+        self.started_at = time.perf_counter()
+        self.acknowledged_at: Optional[float] = None
+        self.first_message_at: Optional[float] = None
+        self.messages: List[str] = []
+
+    def record(self, text: str):
+        if self.first_message_at is None:
+            self.first_message_at = time.perf_counter()
+        self.messages.append(text)
+
+    async def edit_original_response(self, content=None, *, embed=None, embeds=None, **kwargs):
+        self.record(_message_text(content, embed, embeds))
+
+    @property
+    def failed(self) -> bool:
+        """エラーを示すメッセージが送信されたか"""
+        return any(marker in message for message in self.messages for marker in ERROR_MARKERS)
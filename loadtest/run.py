@@ -0,0 +1,273 @@
+"""Discordに接続せずに、実際のCogのコマンドへ一定のリクエストレートで負荷をかける
+
+Gemini・Spotify・字幕取得・VOICEVOXは指定した遅延分布で応答する代替実装に差し替え、
+スループット・応答時間のパーセンタイル・イベントループの遅延・メモリ増加量を出力する。
+
+使い方: python -m loadtest.run [--rps 2] [--duration 60] [--mix ask=5,speak=3,spotify=1,youtube=1,join=1]
+"""
+import argparse
+import asyncio
+import gc
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Dict
+from cogs.spotify_cog import SpotifyCog
+from cogs.youtube_cog import YouTubeCog
+from modules.bot_commands import AICommandsCog, BasicCommandsCog, VoiceCommandsCog
+from modules.gemini_api import GeminiHandler
+from modules.phrase_bank import PhraseBank
+from modules.semantic_cache import HashingEmbedder, SemanticCache
+from modules.voice_session import VoiceSessionManager
+from modules.voicevox import VoiceVoxHandler
+from utils.metrics import Metric
+from utils.state_store import StateStore
+from loadtest.backends import (
+    FakeGeminiModel,
+    FakeSpotify,
+    FakeStreamingSynthesizer,
+    FakeSynthesizer,
+    FakeTranscriptApi,
+    LatencyModel,
+)
+from loadtest.fakes import FakeGuild, FakeInteraction, FakeVoiceChannel
+from config import SEMANTIC_CACHE_THRESHOLDS, SYNTHESIS_DEFAULT_PROFILE, SYNTHESIS_PROFILES
+
+QUERIES = [
+    "今日のおすすめの晩ごはんは？",
+    "Pythonでリストを逆順にする方法を教えて",
+    "埼玉のいいところを3つ教えて！",
+    "asyncioのタスクとスレッドの違いは？",
+]
+SPEAK_TEXTS = ["こんにちは！", "今日もいい感じです✨", "負荷試験中です。しばらくお待ちください。"]
+SEARCH_QUERIES = ["カレー", "埼玉", "春日部"]
+LOOP_LAG_INTERVAL = 0.05  # イベントループの遅延を計測する間隔（秒）
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """"ask=5,speak=3" の形式のコマンド比率を読み込む"""
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"ask", "speak", "spotify", "youtube", "join"}
+    if unknown:
+        raise ValueError(f"未対応のコマンドです: {', '.join(sorted(unknown))}")
+    return mix
+
+
+class LoadTestHarness:
+    """代替バックエンドで組み立てたCogに、ポアソン到着でリクエストを送るクラス"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.latency: Dict[str, Metric] = {}
+        self.first_message: Dict[str, Metric] = {}
+        self.errors: Dict[str, int] = {}
+        self.loop_lag = Metric(window=1_000_000)
+        self._pending: set = set()
+
+    async def setup(self):
+        """実際のハンドラーとCogを作成し、外部APIだけを代替実装に差し替える"""
+        args = self.args
+        self._temp_dir = tempfile.TemporaryDirectory(prefix="tsumugi-loadtest-")
+        self.state_store = StateStore(f"{self._temp_dir.name}/state.db")
+        await self.state_store.open()
+
+        self.voice_handler = VoiceVoxHandler()
+        synthesizer_class = FakeStreamingSynthesizer if args.streaming else FakeSynthesizer
+        self.voice_handler.synthesizer = synthesizer_class(
+            LatencyModel(args.voicevox_latency, self.rng), realtime_factor=args.voicevox_rtf
+        )
+
+        self.gemini_handler = GeminiHandler()
+        gemini_model = FakeGeminiModel(
+            LatencyModel(args.gemini_latency, self.rng), reply_chars=args.reply_chars, error_rate=args.gemini_error_rate
+        )
+        self.gemini_handler.model = gemini_model
+        self.gemini_handler.initialized = True
+        self.gemini_handler.router._models = {
+            (route_name, model_name): gemini_model
+            for route_name, route in self.gemini_handler.router.routes.items()
+            for model_name in route["models"]
+        }
+        if args.gemini_rpm:
+            self.gemini_handler.scheduler.requests_per_minute = args.gemini_rpm
+        if args.semantic_cache:
+            self.gemini_handler.semantic_cache = SemanticCache(
+                HashingEmbedder(), self.state_store, threshold=SEMANTIC_CACHE_THRESHOLDS["hashing"]
+            )
+
+        FakeTranscriptApi.latency = LatencyModel(args.transcript_latency, self.rng)
+
+        phrase_bank = PhraseBank(self.voice_handler, f"{self._temp_dir.name}/phrase_bank.bin")
+        FakeVoiceChannel.connect_latency = LatencyModel(args.connect_latency, self.rng)
+        self.voice_sessions = VoiceSessionManager()
+        self.voice_handler.voice_sessions = self.voice_sessions
+        self.voice_handler.default_profile = self.voice_handler.profiles[args.profile]
+        self.basic_cog = BasicCommandsCog(None, self.state_store, phrase_bank, self.voice_sessions)
+        self.voice_cog = VoiceCommandsCog(None, self.voice_handler, self.state_store)
+        self.ai_cog = AICommandsCog(None, self.gemini_handler, self.voice_handler, self.state_store, phrase_bank)
+        self.spotify_cog = SpotifyCog(None, self.state_store)
+        self.spotify_cog.sp = FakeSpotify(LatencyModel(args.spotify_latency, self.rng))
+        self.youtube_cog = YouTubeCog(None, self.gemini_handler, self.voice_handler, phrase_bank, self.state_store)
+        self.youtube_cog.transcript_api = FakeTranscriptApi
+
+        self.guilds = [FakeGuild(connect_voice=self.rng.random() < args.voice_ratio) for _ in range(args.guilds)]
+        self.voice_guilds = [guild for guild in self.guilds if guild.voice_client] or self.guilds
+
+    async def teardown(self):
+        await self.state_store.close()
+        for guild in self.guilds:
+            if guild.voice_client:
+                await guild.voice_client.disconnect()
+        self._temp_dir.cleanup()
+
+    async def invoke(self, command: str, interaction: FakeInteraction):
+        """コマンドのコールバックを実際のCogメソッドとして呼び出す"""
+        if command == "ask":
+            await self.ai_cog.ask_command.callback(self.ai_cog, interaction, self.rng.choice(QUERIES))
+        elif command == "speak":
+            await self.voice_cog.speak_command.callback(self.voice_cog, interaction, self.rng.choice(SPEAK_TEXTS))
+        elif command == "join":
+            await self.basic_cog.join_command.callback(self.basic_cog, interaction)
+        elif command == "spotify":
+            await self.spotify_cog.search_spotify.callback(self.spotify_cog, interaction, self.rng.choice(SEARCH_QUERIES))
+        elif command == "youtube":
+            video_id = "".join(self.rng.choice("abcdefghijkLMNOP0123456789") for _ in range(11))
+            await self.youtube_cog.summarize_youtube.callback(
+                self.youtube_cog, interaction, f"https://www.youtube.com/watch?v={video_id}"
+            )
+
+    async def run_request(self, command: str):
+        # /speak はボイスチャンネルに接続しているギルドに送る
+        interaction = FakeInteraction(self.rng.choice(self.voice_guilds if command == "speak" else self.guilds))
+        failed = False
+        try:
+            await self.invoke(command, interaction)
+        except Exception as e:
+            print(f"{command} の実行中に例外が発生しました: {e!r}")
+            failed = True
+        finished_at = time.perf_counter()
+
+        self.latency.setdefault(command, Metric(window=1_000_000)).observe(finished_at - interaction.started_at)
+        if interaction.first_message_at is not None:
+            self.first_message.setdefault(command, Metric(window=1_000_000)).observe(
+                interaction.first_message_at - interaction.started_at
+            )
+        if failed or interaction.failed:
+            self.errors[command] = self.errors.get(command, 0) + 1
+
+    async def monitor_loop_lag(self):
+        """一定間隔で眠り、予定より遅れて起きた時間をイベントループの遅延として記録する"""
+        while True:
+            expected = time.perf_counter() + LOOP_LAG_INTERVAL
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.loop_lag.observe(max(0.0, time.perf_counter() - expected))
+
+    async def run(self) -> float:
+        """指定した時間だけリクエストを送り、完了を待ってから経過時間を返す"""
+        args = self.args
+        mix = parse_mix(args.mix)
+        commands, weights = list(mix), list(mix.values())
+        monitor = asyncio.create_task(self.monitor_loop_lag())
+
+        started_at = time.perf_counter()
+        deadline = started_at + args.duration
+        next_arrival = started_at
+        while next_arrival < deadline:
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+            command = self.rng.choices(commands, weights)[0]
+            task = asyncio.create_task(self.run_request(command))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+            # ポアソン到着（指数分布の間隔）
+            next_arrival += self.rng.expovariate(args.rps)
+
+        if self._pending:
+            print(f"送信を終了しました。実行中の {len(self._pending)}件の完了を待っています...")
+            _, still_pending = await asyncio.wait(set(self._pending), timeout=args.drain_timeout)
+            for task in still_pending:
+                task.cancel()
+        elapsed = time.perf_counter() - started_at
+        monitor.cancel()
+        return elapsed
+
+    def report(self, elapsed: float):
+        total = sum(metric.count for metric in self.latency.values())
+        errors = sum(self.errors.values())
+        print()
+        print(f"経過時間 {elapsed:.1f}秒 / 完了 {total}件 / 失敗 {errors}件 / スループット {total / elapsed:.2f}件/秒")
+        print(f"{'コマンド':<10}{'件数':>6}{'失敗':>6}{'p50(秒)':>10}{'p95(秒)':>10}{'p99(秒)':>10}{'最初の送信p50':>16}")
+        for command, metric in sorted(self.latency.items()):
+            first = self.first_message.get(command)
+            print(
+                f"{command:<10}{metric.count:>6}{self.errors.get(command, 0):>6}"
+                f"{metric.percentile(0.5):>10.2f}{metric.percentile(0.95):>10.2f}{metric.percentile(0.99):>10.2f}"
+                f"{(first.percentile(0.5) if first else 0.0):>16.2f}"
+            )
+        print(
+            f"イベントループの遅延: p50 {self.loop_lag.percentile(0.5) * 1000:.1f}ms / "
+            f"p99 {self.loop_lag.percentile(0.99) * 1000:.1f}ms / 最大 {self.loop_lag.max * 1000:.1f}ms"
+        )
+        voice_clients = [guild.voice_client for guild in self.guilds if guild.voice_client]
+        if voice_clients:
+            frames = sum(vc.frames_played for vc in voice_clients)
+            underruns = sum(vc.underruns for vc in voice_clients)
+            print(f"再生フレーム {frames}件 / 20ms枠に間に合わなかったフレーム {underruns}件")
+        cache = self.gemini_handler.semantic_cache
+        if cache:
+            print(f"意味キャッシュ: 一致 {cache.hits}件 / 不一致 {cache.misses}件")
+
+
+async def main_async(args: argparse.Namespace):
+    if args.tracemalloc:
+        tracemalloc.start(10)
+    harness = LoadTestHarness(args)
+    await harness.setup()
+
+    gc.collect()
+    baseline = tracemalloc.take_snapshot() if args.tracemalloc else None
+    print(f"{args.duration}秒間、{args.rps}件/秒でリクエストを送信します（{args.mix}）...")
+    elapsed = await harness.run()
+    harness.report(elapsed)
+
+    if baseline is not None:
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot()
+        stats = snapshot.compare_to(baseline, "lineno")
+        growth = sum(stat.size_diff for stat in stats)
+        print(f"メモリ増加量: {growth / 1024:.1f}KiB（tracemalloc）")
+        for stat in stats[:args.top_allocations]:
+            print(f"  {stat}")
+    await harness.teardown()
+
+def main():
+    parser = argparse.ArgumentParser(description="実際のCogのコマンドに負荷をかけ、応答時間などを計測します。")
+    parser.add_argument("--rps", type=float, default=2.0, help="1秒あたりのリクエスト数（平均）")
+    parser.add_argument("--duration", type=float, default=60.0, help="リクエストを送信する時間（秒）")
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="送信終了後に完了を待つ最大時間（秒）")
+    parser.add_argument("--mix", default="ask=5,speak=3,spotify=1,youtube=1", help="コマンドの比率")
+    parser.add_argument("--guilds", type=int, default=20, help="ギルド数")
+    parser.add_argument("--voice-ratio", type=float, default=0.5, help="ボイスチャンネルに接続しているギルドの割合")
+    parser.add_argument("--gemini-latency", default="lognormal:1.5:0.5", help="Geminiの応答遅延の分布")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="Geminiが429を返す割合")
+    parser.add_argument("--gemini-rpm", type=int, default=0, help="1分あたりのリクエスト数の上限（0なら設定値）")
+    parser.add_argument("--reply-chars", type=int, default=120, help="Geminiの応答の文字数")
+    parser.add_argument("--spotify-latency", default="lognormal:0.3:0.4", help="Spotify検索の遅延の分布")
+    parser.add_argument("--transcript-latency", default="lognormal:0.8:0.5", help="字幕取得の遅延の分布")
+    parser.add_argument("--connect-latency", default="lognormal:1.5:0.6", help="ボイス接続（/join）の遅延の分布")
+    parser.add_argument("--voicevox-latency", default="fixed:0.05", help="AudioQuery作成などの遅延の分布")
+    parser.add_argument("--voicevox-rtf", type=float, default=0.1, help="音声1秒あたりの合成時間（秒）")
+    parser.add_argument("--semantic-cache", action="store_true", help="/askの意味キャッシュ（ローカルの埋め込み）を使う")
+    parser.add_argument("--profile", default=SYNTHESIS_DEFAULT_PROFILE, choices=sorted(SYNTHESIS_PROFILES),
+                        help="読み上げに使う合成プロファイル")
+    parser.add_argument("--no-streaming", dest="streaming", action="store_false", help="ストリーミング合成を使わない")
+    parser.add_argument("--no-tracemalloc", dest="tracemalloc", action="store_false", help="メモリ計測を行わない")
+    parser.add_argument("--top-allocations", type=int, default=5, help="メモリ増加の内訳を表示する件数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,29 @@
 import discord
 from discord import app_commands
 import os
+import asyncio
 from dotenv import load_dotenv
 from modules.voicevox import VoiceVoxHandler
 from modules.gemini_api import GeminiHandler
 from modules.bot_commands import setup_cogs
 from modules.bot_events import BotEventHandler
+from modules.lifecycle import LifecycleManager
+from modules.phrase_bank import PhraseBank
+from modules.voice_session import VoiceSessionManager
+from modules.gemini_scheduler import GeminiScheduler
+from modules.semantic_cache import GeminiEmbedder, HashingEmbedder, SemanticCache
+from utils.metrics import metrics
+from utils.state_store import StateStore
+from config import STATE_DB_PATH, STATE_FLUSH_INTERVAL, STATE_BATCH_SIZE, PHRASE_BANK, PHRASE_BANK_PATH
+from config import (
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_BACKEND, SEMANTIC_CACHE_GEMINI_MODEL, SEMANTIC_CACHE_THRESHOLDS,
+    SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_IGNORED_WORDS,
+    SEMANTIC_CACHE_EMBED_CONCURRENCY, SEMANTIC_CACHE_EMBED_RPM, SEMANTIC_CACHE_EMBED_MAX_WAIT,
+)
+from config import (
+    VOICE_CONNECT_TIMEOUT, VOICE_CONNECT_ATTEMPTS, VOICE_CONNECT_RETRY_BACKOFF, VOICE_RECONNECT_WAIT,
+)
+from config import YOUTUBE_PREFETCH_ENABLED
 
 # .envファイルから環境変数を読み込む
 load_dotenv()
@@ -15,13 +33,43 @@ DISCORD_BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
 # Discord Botのクライアントを作成
 intents = discord.Intents.default()
 intents.voice_states = True  # on_voice_state_updateを使用するために必要
+# YouTubeのリンクを検出して字幕を先読みするには、メッセージ内容の（特権）インテントが必要
+intents.message_content = os.getenv("YOUTUBE_PREFETCH_ENABLED", str(YOUTUBE_PREFETCH_ENABLED)).lower() in ("1", "true")
 client = discord.Client(intents=intents)
 tree = app_commands.CommandTree(client)
 
 # ハンドラーの初期化
+state_store = StateStore(
+    os.getenv("STATE_DB_PATH", STATE_DB_PATH),
+    flush_interval=STATE_FLUSH_INTERVAL,
+    batch_size=STATE_BATCH_SIZE,
+)
 voice_handler = VoiceVoxHandler()
+phrase_bank = PhraseBank(voice_handler, os.getenv("PHRASE_BANK_PATH", PHRASE_BANK_PATH))
 gemini_handler = GeminiHandler()
-event_handler = BotEventHandler(client)
+voice_sessions = VoiceSessionManager(
+    connect_timeout=VOICE_CONNECT_TIMEOUT,
+    connect_attempts=VOICE_CONNECT_ATTEMPTS,
+    retry_backoff=VOICE_CONNECT_RETRY_BACKOFF,
+    reconnect_wait=VOICE_RECONNECT_WAIT,
+)
+# 読み上げ中にdiscord.pyが再接続している場合は、復帰を待って続きを読み上げる
+voice_handler.voice_sessions = voice_sessions
+# ギルドごとに選択された合成プロファイルを使う
+voice_handler.state_store = state_store
+event_handler = BotEventHandler(client, state_store, voice_sessions)
+lifecycle = LifecycleManager(client, voice_sessions=voice_sessions)
+
+# 停止処理中は新しいコマンドを受け付けず、実行中のコマンドを追跡する
+tree.interaction_check = lifecycle.interaction_check
+lifecycle.add_shutdown_hook(state_store.close)
+lifecycle.add_shutdown_hook(phrase_bank.close)
+lifecycle.add_shutdown_hook(metrics.flush)
+
+@client.event
+async def setup_hook():
+    # on_readyは再接続のたびに呼ばれるため、状態ストアはログイン時に一度だけ開く
+    await state_store.open()
 
 @client.event
 async def on_ready():
@@ -35,12 +83,36 @@ async def on_ready():
     initialized = await voice_handler.initialize()
     if initialized:
         print("VOICEVOXの初期化に成功しました。")
+        # 定型文の合成はログイン処理を妨げないようバックグラウンドで行う
+        phrase_bank.start_build(PHRASE_BANK)
     else:
         print("VOICEVOXの初期化に失敗しました。")
     
     # Gemini APIの初期化
     if gemini_handler.initialize():
         print("Gemini APIの初期化に成功しました。")
+        if SEMANTIC_CACHE_ENABLED:
+            backend = os.getenv("SEMANTIC_CACHE_BACKEND", SEMANTIC_CACHE_BACKEND)
+            # 埋め込みのリクエストは応答の生成の枠を使わず、専用のスケジューラで制限する
+            # （混み合っていれば待たずに失敗し、キャッシュを使わずに応答を生成する）
+            embed_scheduler = GeminiScheduler(
+                max_concurrency=SEMANTIC_CACHE_EMBED_CONCURRENCY,
+                requests_per_minute=SEMANTIC_CACHE_EMBED_RPM,
+                max_wait=SEMANTIC_CACHE_EMBED_MAX_WAIT,
+            )
+            embedder = (
+                GeminiEmbedder(SEMANTIC_CACHE_GEMINI_MODEL, scheduler=embed_scheduler)
+                if backend == "gemini" else HashingEmbedder()
+            )
+            gemini_handler.semantic_cache = SemanticCache(
+                embedder,
+                state_store,
+                threshold=SEMANTIC_CACHE_THRESHOLDS.get(backend, SEMANTIC_CACHE_THRESHOLDS["gemini"]),
+                ttl=SEMANTIC_CACHE_TTL,
+                max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                ignored_words=SEMANTIC_CACHE_IGNORED_WORDS,
+            )
+            print(f"/askの意味キャッシュを有効にしました（埋め込み: {embedder.name}）。")
     else:
         print("Gemini APIの初期化に失敗しました。")
     
@@ -50,7 +122,7 @@ async def on_ready():
     try:
         # コマンドの設定
         print("コマンドを設定しています...")
-        setup_cogs(client, voice_handler, gemini_handler, tree)
+        setup_cogs(client, voice_handler, gemini_handler, tree, state_store, phrase_bank, voice_sessions)
         
         # コマンドツリーの状態を確認
         commands = tree.get_commands()
@@ -94,6 +166,16 @@ def validate_environment():
     
     return errors
 
+async def main():
+    """Botを起動し、SIGTERM/SIGINTで安全に停止できるようにする"""
+    async with client:
+        lifecycle.install_signal_handlers()
+        try:
+            await client.start(DISCORD_BOT_TOKEN)
+        finally:
+            # シグナル以外の理由で終了した場合も未反映の書き込みを残さない
+            await state_store.close()
+
 if __name__ == "__main__":
     # 環境変数の検証
     validation_errors = validate_environment()
@@ -104,8 +186,9 @@ if __name__ == "__main__":
         print("\n.envファイルを確認してください。")
         exit(1)
     
+    discord.utils.setup_logging()
     try:
-        client.run(DISCORD_BOT_TOKEN)
+        asyncio.run(main())
     except discord.LoginFailure:
         print("エラー: Discord Botトークンが無効です。正しいトークンを設定してください。")
         exit(1)
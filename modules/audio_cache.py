@@ -0,0 +1,47 @@
+from collections import OrderedDict
+from typing import List, Optional
+
+class OpusPacketCache:
+    """合成済み音声をOpusパケットとして保持するLRUキャッシュ
+
+    同じ文章を再び読み上げるときは、合成も再生スレッドでのエンコードも行わずにパケットを送るだけで済む。
+    """
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: 保持するパケットの合計サイズの上限（バイト）
+        """
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, List[bytes]]" = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[List[bytes]]:
+        packets = self._entries.get(key)
+        if packets is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return packets
+
+    def put(self, key: str, packets: List[bytes]):
+        size = sum(len(packet) for packet in packets)
+        if size > self.max_bytes:
+            return
+
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._total_bytes -= sum(len(packet) for packet in old)
+
+        self._entries[key] = packets
+        self._total_bytes += size
+        # 上限を超えた分は古いものから削除する
+        while self._total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._total_bytes -= sum(len(packet) for packet in evicted)
+
+    def __len__(self) -> int:
+        return len(self._entries)
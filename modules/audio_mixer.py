@@ -0,0 +1,203 @@
+import asyncio
+import threading
+from typing import Callable, List, Optional
+import discord
+from modules.audio_sources import FRAME_SIZE
+
+# 優先度（大きいほど優先され、再生中はそれより低い優先度の音声を小さくする）
+PRIORITY_READOUT = 0  # 長い応答・要約の読み上げ
+PRIORITY_SPEECH = 1  # /speak の読み上げ
+PRIORITY_NOTIFICATION = 2  # 挨拶・エラーなどの短い通知
+
+class MixerTrack:
+    """ミキサーで再生中の1つの音声"""
+
+    def __init__(self, source: discord.AudioSource, gain: float = 1.0, priority: int = PRIORITY_READOUT,
+                 after: Optional[Callable[[], None]] = None):
+        self.source = source
+        # 1つの音声の待ち時間で他の音声が止まらないよう、待たずに読める場合はそちらを使う
+        self.read = getattr(source, "read_nowait", source.read)
+        self.gain = gain
+        self.priority = priority
+        self._after = after
+        self._loop = asyncio.get_running_loop()
+        self._done = self._loop.create_future()
+        self._finished = False
+        self._decoder = None  # Opus音声を他の音声と合成するときだけ作成する
+
+    def decode(self, packet: bytes) -> bytes:
+        """Opusパケットを合成用のPCMフレームにデコードする"""
+        if self._decoder is None:
+            self._decoder = discord.opus.Decoder()
+        return self._decoder.decode(packet, fec=False)
+
+    def finish(self):
+        """再生終了時の後処理（再生スレッドから呼ばれる）"""
+        if self._finished:
+            return
+        self._finished = True
+        try:
+            self.source.cleanup()
+            if self._after:
+                self._after()
+        except Exception as e:
+            print(f'リソースクリーンアップエラー: {e}')
+        self._loop.call_soon_threadsafe(self._set_done)
+
+    def _set_done(self):
+        if not self._done.done():
+            self._done.set_result(None)
+
+    def done(self) -> bool:
+        return self._done.done()
+
+    async def wait(self):
+        """再生が終わるまで待つ"""
+        await asyncio.shield(self._done)
+
+
+class MixingAudioSource(discord.AudioSource):
+    """複数のPCM音声を20msフレームごとに合成するAudioSource
+
+    各音声のフレームを1つの行列にまとめ、ゲインとの内積で一度に合成してからクリッピングする。
+    より高い優先度の音声が再生中の間は、低い優先度の音声を duck_gain 倍に下げる。
+    Opus音声が1つだけ再生中のときはパケットをそのまま返し（is_opus()がTrueになる）、
+    他の音声と重なったときだけデコードして合成する。
+    """
+
+    def __init__(self, duck_gain: float = 0.35):
+        # numpyは起動時ではなく最初の再生時に読み込む（再生スレッドで読み込むと音が途切れるため、ここで読み込んでおく）
+        import numpy  # noqa: F401
+
+        self.duck_gain = duck_gain
+        self._tracks: List[MixerTrack] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._last_is_opus = False  # 直前のread()がOpusパケットを返したか
+
+    def add(self, track: MixerTrack) -> bool:
+        """音声を追加する（ミキサーが既に終了していればFalse）"""
+        with self._lock:
+            if self._closed:
+                return False
+            self._tracks.append(track)
+            return True
+
+    @property
+    def track_count(self) -> int:
+        return len(self._tracks)
+
+    def read(self) -> bytes:
+        with self._lock:
+            tracks = list(self._tracks)
+
+        frames = []
+        active = []
+        for track in tracks:
+            data = track.read()
+            if not data:
+                self._remove(track)
+                continue
+            frames.append(data)
+            active.append(track)
+
+        if not active:
+            self._last_is_opus = False
+            with self._lock:
+                if self._tracks:
+                    # 読み込み中に新しい音声が追加された
+                    return b"\x00" * FRAME_SIZE
+                self._closed = True
+            return b""
+
+        top_priority = max(track.priority for track in active)
+        gains = [
+            track.gain if track.priority >= top_priority else track.gain * self.duck_gain
+            for track in active
+        ]
+
+        # 音声が1つでゲインが1倍なら合成は不要（Opusならエンコード済みのパケットをそのまま送る）
+        if len(frames) == 1 and gains[0] == 1.0:
+            self._last_is_opus = active[0].source.is_opus()
+            if not self._last_is_opus and len(frames[0]) < FRAME_SIZE:
+                return frames[0] + b"\x00" * (FRAME_SIZE - len(frames[0]))
+            return frames[0]
+
+        self._last_is_opus = False
+        for i, track in enumerate(active):
+            if track.source.is_opus():
+                frames[i] = track.decode(frames[i])
+            if len(frames[i]) < FRAME_SIZE:
+                frames[i] += b"\x00" * (FRAME_SIZE - len(frames[i]))
+        return self.mix_frames(frames, gains)
+
+    @staticmethod
+    def mix_frames(frames: List[bytes], gains: List[float]) -> bytes:
+        """16bit PCMフレームをゲイン付きで合成し、範囲外の値をクリッピングする"""
+        import numpy as np
+
+        samples = np.frombuffer(b"".join(frames), dtype="<i2").reshape(len(frames), -1)
+        mixed = np.asarray(gains, dtype=np.float32) @ samples.astype(np.float32)
+        np.clip(mixed, -32768, 32767, out=mixed)
+        return mixed.astype("<i2").tobytes()
+
+    def _remove(self, track: MixerTrack):
+        with self._lock:
+            if track in self._tracks:
+                self._tracks.remove(track)
+        track.finish()
+
+    def is_opus(self) -> bool:
+        # 再生スレッドはread()の直後にフレームごとに確認するため、直前のフレームの形式を返す
+        return self._last_is_opus
+
+    def cleanup(self):
+        with self._lock:
+            self._closed = True
+            tracks, self._tracks = self._tracks, []
+        for track in tracks:
+            track.finish()
+
+
+class VoiceMixer:
+    """ボイスクライアントごとのミキサーを管理し、再生中でも音声を重ねて再生できるようにするクラス"""
+
+    def __init__(self, duck_gain: float = 0.35):
+        self.duck_gain = duck_gain
+
+    async def play(self, voice_client: discord.VoiceClient, source: discord.AudioSource, gain: float = 1.0,
+                   priority: int = PRIORITY_READOUT, after: Optional[Callable[[], None]] = None) -> Optional[MixerTrack]:
+        """音声を再生する（再生中の音声があれば重ねて再生する）"""
+        track = MixerTrack(source, gain=gain, priority=priority, after=after)
+        if not voice_client or not voice_client.is_connected():
+            track.finish()
+            return None
+
+        current = voice_client.source if voice_client.is_playing() else None
+        if isinstance(current, MixingAudioSource) and current.add(track):
+            return track
+
+        # 終了直前のミキサーや、ミキサー以外の音声が再生中なら終わるまで少し待つ
+        for _ in range(25):
+            if not voice_client.is_playing():
+                break
+            await asyncio.sleep(0.02)
+        else:
+            print("現在他の音声を再生中のため、音声を再生できませんでした。")
+            track.finish()
+            return None
+
+        mixer = MixingAudioSource(duck_gain=self.duck_gain)
+        mixer.add(track)
+
+        def after_playing(error):
+            if error:
+                print(f'再生エラー: {error}')
+
+        try:
+            voice_client.play(mixer, after=after_playing)
+        except Exception as e:
+            print(f"音声再生中にエラーが発生しました: {e}")
+            mixer.cleanup()
+            return None
+        return track
@@ -0,0 +1,169 @@
+import threading
+from typing import List, Sequence
+import discord
+
+# Discordの音声フレーム（20ms・48kHz・ステレオ・16bit）のバイト数
+FRAME_SIZE = discord.opus.Encoder.FRAME_SIZE
+
+class PCMBufferAudio(discord.AudioSource):
+    """メモリ上（mmapを含む）のPCMデータをそのまま再生するAudioSource
+
+    FFmpegのプロセスを起動せず、バッファを20msずつ切り出して返す。
+    """
+
+    def __init__(self, pcm_data):
+        self._buffer = memoryview(pcm_data)
+        self._position = 0
+
+    def read(self) -> bytes:
+        start = self._position
+        if start >= len(self._buffer):
+            return b""
+
+        self._position = start + FRAME_SIZE
+        frame = self._buffer[start:self._position]
+        if len(frame) < FRAME_SIZE:
+            # 最後のフレームは無音で埋めて長さを揃える
+            return bytes(frame) + b"\x00" * (FRAME_SIZE - len(frame))
+        return bytes(frame)
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        # mmapを閉じられるよう、バッファへの参照を解放する
+        self._buffer.release()
+
+
+class StreamingPCMAudio(discord.AudioSource):
+    """合成済みのPCMを順次追加しながら再生するAudioSource
+
+    最初のチャンクが届いた時点で再生を開始できるため、先頭が聞こえるまでの時間がセグメント長に依存しない。
+    read()はDiscordの再生スレッドから直接呼ばれ、データが足りない間は少し待ってから無音を返す。
+    ミキサー経由では他の音声を止めないよう、待たずに無音を返す read_nowait() を使う。
+    """
+
+    # 消費済みの領域がこれを超えたらバッファを詰める
+    _COMPACT_THRESHOLD = FRAME_SIZE * 256
+
+    def __init__(self, underrun_timeout: float = 0.1):
+        self.underrun_timeout = underrun_timeout
+        self._buffer = bytearray()
+        self._position = 0
+        self._finished = False
+        self._closed = False
+        self._condition = threading.Condition()
+
+    @property
+    def closed(self) -> bool:
+        """再生が終了・中断されたか（供給側はこれを見て合成を打ち切る）"""
+        return self._closed
+
+    def feed(self, pcm_data: bytes):
+        """PCMデータを末尾に追加する"""
+        with self._condition:
+            if self._closed:
+                return
+            self._buffer.extend(pcm_data)
+            self._condition.notify_all()
+
+    def finish(self):
+        """これ以上データが追加されないことを通知する"""
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+
+    def read(self) -> bytes:
+        return self._read_frame(self.underrun_timeout)
+
+    def read_nowait(self) -> bytes:
+        """データが足りなければ待たずに無音を返すread()"""
+        return self._read_frame(0)
+
+    def _read_frame(self, timeout: float) -> bytes:
+        with self._condition:
+            if timeout > 0:
+                self._condition.wait_for(
+                    lambda: len(self._buffer) - self._position >= FRAME_SIZE or self._finished or self._closed,
+                    timeout=timeout,
+                )
+            if self._closed:
+                return b""
+
+            available = len(self._buffer) - self._position
+            if available >= FRAME_SIZE:
+                frame = bytes(self._buffer[self._position:self._position + FRAME_SIZE])
+                self._position += FRAME_SIZE
+                if self._position >= self._COMPACT_THRESHOLD:
+                    del self._buffer[:self._position]
+                    self._position = 0
+                return frame
+
+            if self._finished:
+                if available <= 0:
+                    return b""
+                # 最後のフレームは無音で埋めて長さを揃える
+                frame = bytes(self._buffer[self._position:]) + b"\x00" * (FRAME_SIZE - available)
+                self._position = len(self._buffer)
+                return frame
+
+            # 合成が再生に追いついていない間は無音でつなぐ
+            return b"\x00" * FRAME_SIZE
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        with self._condition:
+            self._closed = True
+            self._buffer = bytearray()
+            self._position = 0
+            self._condition.notify_all()
+
+
+class OpusPacketAudio(discord.AudioSource):
+    """エンコード済みのOpusパケットをそのまま再生するAudioSource
+
+    is_opus()がTrueのため、再生スレッドでのエンコードが不要になる。
+    """
+
+    def __init__(self, packets: Sequence[bytes]):
+        self._packets = packets
+        self._index = 0
+
+    def read(self) -> bytes:
+        if self._index >= len(self._packets):
+            return b""
+        packet = self._packets[self._index]
+        self._index += 1
+        return bytes(packet)
+
+    def is_opus(self) -> bool:
+        return True
+
+
+def opus_available() -> bool:
+    """libopusが使えるか（未読み込みなら、discord.pyと同じ方法で読み込みを試みる）"""
+    if discord.opus.is_loaded():
+        return True
+    try:
+        discord.opus.Encoder.get_opus_version()
+    except discord.opus.OpusNotLoaded:
+        return False
+    return discord.opus.is_loaded()
+
+
+def encode_opus_packets(pcm_data: bytes) -> List[bytes]:
+    """48kHz・ステレオ・16bitのPCMを20msごとのOpusパケットにエンコードする
+
+    CPU負荷が高いため、イベントループではなく asyncio.to_thread などで呼び出す。
+    libopusが読み込めない場合は discord.opus.OpusNotLoaded を送出するため、事前に opus_available() で確認する。
+    """
+    encoder = discord.opus.Encoder()
+    packets = []
+    for start in range(0, len(pcm_data), FRAME_SIZE):
+        frame = pcm_data[start:start + FRAME_SIZE]
+        if len(frame) < FRAME_SIZE:
+            frame = bytes(frame) + b"\x00" * (FRAME_SIZE - len(frame))
+        packets.append(encoder.encode(frame, discord.opus.Encoder.SAMPLES_PER_FRAME))
+    return packets
@@ -4,41 +4,61 @@ from discord.ext import commands
 import asyncio
 from modules.voicevox import VoiceVoxHandler
 from modules.gemini_api import GeminiHandler
+from modules.phrase_bank import PhraseBank
+from modules.audio_mixer import PRIORITY_SPEECH
+from modules.voice_session import VoiceConnectError, VoiceSessionManager
 from cogs.spotify_cog import SpotifyCog
 from cogs.youtube_cog import YouTubeCog
-from utils.rate_limiter import discord_message_limiter
+from utils.message_renderer import MessageRenderer
+from utils.state_store import StateStore
+from config import SYNTHESIS_PROFILES, VOICE_BUDGET_MODE
 
 class BasicCommandsCog(commands.Cog):
-    def __init__(self, bot: discord.Client):
+    def __init__(self, bot: discord.Client, state_store: StateStore, phrase_bank: PhraseBank, voice_sessions: VoiceSessionManager):
         self.bot = bot
+        self.state_store = state_store
+        self.phrase_bank = phrase_bank
+        self.voice_sessions = voice_sessions
         
     @app_commands.command(name="hello", description="つむぎが挨拶を返します。")
     async def hello_command(self, interaction: discord.Interaction):
         await interaction.response.send_message(f'こんにちは、{interaction.user.name}さん！')
+        # ボイスチャンネルに参加していれば、合成済みの挨拶を再生する
+        await self.phrase_bank.play(interaction.guild.voice_client, "hello")
         
     @app_commands.command(name="join", description="つむぎをボイスチャンネルに参加させます。")
     async def join_command(self, interaction: discord.Interaction):
-        if interaction.user.voice:
-            channel = interaction.user.voice.channel
-            voice_client = interaction.guild.voice_client
-            if voice_client:
-                if voice_client.channel != channel:
-                    await voice_client.move_to(channel)
-                    await interaction.response.send_message(f'{channel.name} に移動しました。')
-                else:
-                    await interaction.response.send_message(f'既に {channel.name} に接続しています。', ephemeral=True)
-            else:
-                vc = await channel.connect()
-                # 自動切断メッセージ用にチャンネルを保存する属性を設定
-                setattr(vc, "last_interaction_channel", interaction.channel)
-                await interaction.response.send_message(f'{channel.name} に接続しました。')
-        else:
+        if not interaction.user.voice:
             await interaction.response.send_message("あなたが先にボイスチャンネルに参加してください。", ephemeral=True)
+            return
+
+        channel = interaction.user.voice.channel
+        voice_client = interaction.guild.voice_client
+        if voice_client and voice_client.is_connected() and voice_client.channel == channel:
+            await interaction.response.send_message(f'既に {channel.name} に接続しています。', ephemeral=True)
+            return
+
+        # 接続（ハンドシェイク）は3秒以上かかることがあるため、先に応答を保留する
+        await interaction.response.defer()
+        try:
+            _, action = await self.voice_sessions.join(channel)
+        except VoiceConnectError as e:
+            print(f"ボイスチャンネルへの接続に失敗しました: {e}")
+            await interaction.followup.send(f'{channel.name} に接続できませんでした。しばらくしてから再度お試しください。')
+            return
+
+        # 自動切断メッセージ用にチャンネルを保存
+        self.state_store.set_guild_setting(interaction.guild.id, "last_interaction_channel_id", interaction.channel.id)
+        if action == "moved":
+            await interaction.followup.send(f'{channel.name} に移動しました。')
+        elif action == "already":
+            await interaction.followup.send(f'既に {channel.name} に接続しています。')
+        else:
+            await interaction.followup.send(f'{channel.name} に接続しました。')
             
     @app_commands.command(name="leave", description="つむぎをボイスチャンネルから切断します。")
     async def leave_command(self, interaction: discord.Interaction):
-        if interaction.guild.voice_client:
-            await interaction.guild.voice_client.disconnect()
+        if await self.voice_sessions.leave(interaction.guild):
             await interaction.response.send_message("ボイスチャンネルから切断しました。")
         else:
             await interaction.response.send_message("つむぎはボイスチャンネルに参加していません。", ephemeral=True)
@@ -56,6 +76,7 @@ class BasicCommandsCog(commands.Cog):
         # VoiceCommandsCog
         embed.add_field(name="音声コマンド", value=" ", inline=False)
         embed.add_field(name="`/speak [テキスト]`", value="指定されたテキストを読み上げます。", inline=True)
+        embed.add_field(name="`/voice_profile [プロファイル]`", value="読み上げの速さ（standard / quick / fast）を設定します。", inline=True)
         
         # AICommandsCog
         embed.add_field(name="質問コマンド", value=" ", inline=False)
@@ -68,14 +89,16 @@ class BasicCommandsCog(commands.Cog):
         # YouTubeCog
         embed.add_field(name="YouTube要約コマンド", value=" ", inline=False)
         embed.add_field(name="`/summarize_youtube [URL]`", value="YouTube動画のリンクから要約を生成します。", inline=True)
+        embed.add_field(name="`/youtube_prefetch [enabled]`", value="リンクが投稿された時点で字幕を先読みし、要約を速くします（サーバー管理者向け）。", inline=True)
         
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
 
 class VoiceCommandsCog(commands.Cog):
-    def __init__(self, bot: discord.Client, voice_handler: VoiceVoxHandler):
+    def __init__(self, bot: discord.Client, voice_handler: VoiceVoxHandler, state_store: StateStore):
         self.bot = bot
         self.voice_handler = voice_handler
+        self.state_store = state_store
         
     @app_commands.command(name="speak", description="指定されたテキストを読み上げます。")
     @app_commands.describe(text_to_speak="読み上げるテキスト")
@@ -92,43 +115,42 @@ class VoiceCommandsCog(commands.Cog):
         # 応答を保留 (thinking...)
         await interaction.response.defer()
 
-        audio_data = await self.voice_handler.synthesize_voice(text_to_speak)
-        if audio_data:
-            if voice_client.is_playing():
-                await interaction.followup.send("現在他の音声を再生中です。少し待ってから再度お試しください。")
-                return
-                
-            # 自動切断メッセージ用にチャンネルを保存
-            setattr(voice_client, "last_interaction_channel", interaction.channel)
+        # 自動切断メッセージ用にチャンネルを保存
+        self.state_store.set_guild_setting(interaction.guild.id, "last_interaction_channel_id", interaction.channel.id)
+
+        # 他の音声を再生中でも、読み上げ中の要約などの音量を下げて重ねて再生する
+        # （同じ文章はキャッシュ済みのOpusパケットを再生するため合成しない）
+        track = await self.voice_handler.speak_text(
+            voice_client, text_to_speak, priority=PRIORITY_SPEECH, profile=self.voice_handler.profile_for(interaction.guild.id)
+        )
+        if track:
             await interaction.followup.send(f'「{text_to_speak}」を読み上げます...')
-            success = await self.voice_handler.play_audio_in_vc(voice_client, audio_data)
-            if not success:
-                await interaction.followup.send("音声の再生に失敗しました。")
         else:
-            await interaction.followup.send("音声の生成に失敗しました。")
+            await interaction.followup.send("音声の生成または再生に失敗しました。")
+
+    @app_commands.command(name="voice_profile", description="読み上げの速さ（合成プロファイル）を設定します。")
+    @app_commands.describe(profile="standard: 通常 / quick: やや速い / fast: 速い（間と前後の無音を詰める）")
+    @app_commands.choices(profile=[app_commands.Choice(name=name, value=name) for name in SYNTHESIS_PROFILES])
+    @app_commands.default_permissions(manage_guild=True)
+    async def voice_profile_command(self, interaction: discord.Interaction, profile: app_commands.Choice[str]):
+        self.state_store.set_guild_setting(interaction.guild.id, self.voice_handler.PROFILE_SETTING, profile.value)
+        selected = self.voice_handler.profiles[profile.value]
+        await interaction.response.send_message(
+            f"読み上げを「{selected.name}」（話速 {selected.speed_scale}倍・セグメント間 {selected.segment_gap}秒）に設定しました。"
+        )
 
 
 class AICommandsCog(commands.Cog):
-    def __init__(self, bot: discord.Client, gemini_handler: GeminiHandler, voice_handler: VoiceVoxHandler):
+    def __init__(self, bot: discord.Client, gemini_handler: GeminiHandler, voice_handler: VoiceVoxHandler, state_store: StateStore, phrase_bank: PhraseBank):
         self.bot = bot
         self.gemini_handler = gemini_handler
         self.voice_handler = voice_handler
+        self.state_store = state_store
+        self.phrase_bank = phrase_bank
         
     async def _send_text_response(self, interaction: discord.Interaction, response_text: str):
-        """レスポンステキストを適切に分割して送信する"""
-        max_length = 2000
-        chunks = [response_text[i:i + max_length] for i in range(0, len(response_text), max_length)]
-        first_chunk = True
-        
-        for chunk in chunks:
-            # レート制限を適用
-            await discord_message_limiter.acquire()
-            
-            if first_chunk:
-                await interaction.followup.send(chunk)  # 最初のメッセージはfollowupで
-                first_chunk = False
-            else:
-                await interaction.channel.send(chunk)  # 2つ目以降の長いメッセージはchannel.send
+        """レスポンステキストをできるだけ少ないメッセージにまとめて送信する（最初のメッセージは保留中の応答を編集する）"""
+        await MessageRenderer.send(interaction, response_text)
     
     async def _handle_voice_synthesis(self, interaction: discord.Interaction, response_text: str):
         """音声合成と再生を処理する"""
@@ -137,40 +159,15 @@ class AICommandsCog(commands.Cog):
             return
         
         speech_segments = self.gemini_handler.split_text_for_speech(response_text)
-        
-        for i, segment in enumerate(speech_segments):
-            # ボイス接続状態を再確認
-            if not voice_client or not voice_client.is_connected():
-                print("読み上げ中にボイスチャンネルから切断されました。")
-                break
-            
-            # 再生中かチェック
-            if voice_client.is_playing():
-                print("現在他の音声を再生中です。このセグメントの読み上げをスキップします。")
-                await asyncio.sleep(1)  # 少し待つ
-                continue
-
-            # 音声合成と再生
-            success = await self._synthesize_and_play_segment(interaction, segment, voice_client)
-            if not success:
-                break
-                
-            # セグメント間の待機時間
-            if i < len(speech_segments) - 1:
-                await asyncio.sleep(0.5)
-    
-    async def _synthesize_and_play_segment(self, interaction: discord.Interaction, segment: str, voice_client) -> bool:
-        """個別セグメントの音声合成と再生"""
-        audio_data = await self.voice_handler.synthesize_voice(segment)
-        if audio_data:
-            success = await self.voice_handler.play_audio_in_vc(voice_client, audio_data)
-            if not success:
-                await interaction.channel.send(f"セグメント「{segment[:20]}...」の音声再生に失敗しました。")
-                return False
-            return True
-        else:
-            await interaction.channel.send(f"セグメント「{segment[:20]}...」の音声生成に失敗しました。")
-            return False
+        # 読み上げ時間の上限内に収まるセグメントだけを、ギルドで選択されている合成プロファイルで合成する
+        profile = self.voice_handler.profile_for(interaction.guild.id)
+        planned_segments = self.voice_handler.plan_speech(speech_segments, profile=profile)
+
+        async def notify_failure(segment: str, reason: str):
+            await interaction.channel.send(f"セグメント「{segment[:20]}...」の{reason}に失敗しました。")
+
+        # 先頭の文から再生を始め、再生中に次のセグメントを準備・合成しながら順に読み上げる
+        await self.voice_handler.speak_segments(interaction.guild, planned_segments, on_failure=notify_failure, profile=profile)
 
     @app_commands.command(name="ask", description="つむぎに質問し、応答をテキストと音声で返します。")
     @app_commands.describe(query="つむぎへの質問内容")
@@ -181,19 +178,35 @@ class AICommandsCog(commands.Cog):
 
         await interaction.response.defer()  # Geminiからの応答待ちのため、応答を保留
 
+        speech_task = None
         try:
+            # 読み上げ用の短い応答は、テキスト応答と並行して生成する
+            voice_client = interaction.guild.voice_client
+            if VOICE_BUDGET_MODE == "speech_summary" and voice_client and voice_client.is_connected():
+                speech_task = asyncio.create_task(self.gemini_handler.generate_speech_response(query, guild_id=interaction.guild.id))
+
             # AI応答を生成
-            success, response_text = await self.gemini_handler.generate_response(query)
+            success, response_text = await self.gemini_handler.generate_response(
+                query, command="ask", guild_id=interaction.guild.id
+            )
             
             if not response_text:
                 await interaction.followup.send("つむぎから応答がありませんでした。")
+                await self.phrase_bank.play(interaction.guild.voice_client, "no_response")
                 return
             
             # テキスト応答を送信
             await self._send_text_response(interaction, response_text)
-            
+
+            # 読み上げ用の応答が得られなければテキスト応答を読み上げる
+            speech_text = response_text
+            if speech_task:
+                speech_success, speech_result = await speech_task
+                if speech_success and speech_result:
+                    speech_text = speech_result
+
             # 音声合成と再生（ボイスチャンネルに接続している場合）
-            await self._handle_voice_synthesis(interaction, response_text)
+            await self._handle_voice_synthesis(interaction, speech_text)
 
         except Exception as e:
             print(f"Gemini APIリクエストまたは音声合成中にエラーが発生しました: {e}")
@@ -201,18 +214,22 @@ class AICommandsCog(commands.Cog):
                 await interaction.response.send_message("申し訳ありません、処理中にエラーが発生しました。", ephemeral=True)
             else:
                 await interaction.followup.send("申し訳ありません、処理中にエラーが発生しました。")
+            await self.phrase_bank.play(interaction.guild.voice_client, "error")
+        finally:
+            if speech_task and not speech_task.done():
+                speech_task.cancel()
 
 
-def setup_cogs(bot: discord.Client, voice_handler: VoiceVoxHandler, gemini_handler: GeminiHandler, tree: app_commands.CommandTree):
+def setup_cogs(bot: discord.Client, voice_handler: VoiceVoxHandler, gemini_handler: GeminiHandler, tree: app_commands.CommandTree, state_store: StateStore, phrase_bank: PhraseBank, voice_sessions: VoiceSessionManager):
     """コマンドツリーにCogを登録する"""
     # 一度コマンドツリーをクリアする（同じコマンドが重複登録されないように）
     tree.clear_commands(guild=None)
     
-    basic_cog = BasicCommandsCog(bot)
-    voice_cog = VoiceCommandsCog(bot, voice_handler)
-    ai_cog = AICommandsCog(bot, gemini_handler, voice_handler)
-    spotify_cog = SpotifyCog(bot)
-    youtube_cog = YouTubeCog(bot, gemini_handler, voice_handler)
+    basic_cog = BasicCommandsCog(bot, state_store, phrase_bank, voice_sessions)
+    voice_cog = VoiceCommandsCog(bot, voice_handler, state_store)
+    ai_cog = AICommandsCog(bot, gemini_handler, voice_handler, state_store, phrase_bank)
+    spotify_cog = SpotifyCog(bot, state_store)
+    youtube_cog = YouTubeCog(bot, gemini_handler, voice_handler, phrase_bank, state_store)
 
     # BasicCommandsCogのコマンドを追加
     print("BasicCommandsCogのコマンドを追加中...")
@@ -224,6 +241,7 @@ def setup_cogs(bot: discord.Client, voice_handler: VoiceVoxHandler, gemini_handl
     # VoiceCommandsCogのコマンドを追加
     print("VoiceCommandsCogのコマンドを追加中...")
     tree.add_command(voice_cog.speak_command)
+    tree.add_command(voice_cog.voice_profile_command)
     
     # AICommandsCogのコマンドを追加
     print("AICommandsCogのコマンドを追加中...")
@@ -232,9 +250,14 @@ def setup_cogs(bot: discord.Client, voice_handler: VoiceVoxHandler, gemini_handl
     # SpotifyCogのコマンドを追加
     print("SpotifyCogのコマンドを追加中...")
     tree.add_command(spotify_cog.search_spotify)
+    spotify_cog.register_views()
     
     # YouTubeCogのコマンドを追加
     print("YouTubeCogのコマンドを追加中...")
     tree.add_command(youtube_cog.summarize_youtube)
+    tree.add_command(youtube_cog.youtube_prefetch)
+    if bot.intents.message_content:
+        # 投稿されたYouTubeのリンクの字幕を先読みする（ギルドごとに有効にする）
+        bot.event(youtube_cog.on_message)
     
     print("すべてのコマンドをコマンドツリーに追加しました。") 
\ No newline at end of file
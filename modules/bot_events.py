@@ -1,56 +1,155 @@
 import discord
 import asyncio
+from typing import Dict
+from config import AUTO_DISCONNECT_GRACE_SECONDS
+from modules.voice_session import VoiceSessionManager
+from utils.state_store import StateStore
 
 class BotEventHandler:
-    def __init__(self, bot: discord.Client):
+    def __init__(self, bot: discord.Client, state_store: StateStore, voice_sessions: VoiceSessionManager | None = None,
+                 grace_period: float = AUTO_DISCONNECT_GRACE_SECONDS):
         self.bot = bot
-        self._disconnect_lock = asyncio.Lock()  # 競合状態を防ぐためのロック
-        
+        self.state_store = state_store
+        self.voice_sessions = voice_sessions
+        self.grace_period = grace_period
+        self._guild_locks: Dict[int, asyncio.Lock] = {}  # ギルドごとのロック（他ギルドと競合しない）
+        self._tracked_channels: Dict[int, int] = {}  # ギルドID -> Botが接続しているチャンネルID
+        self._human_counts: Dict[int, int] = {}  # ギルドID -> 接続チャンネル内のBot以外の人数
+        self._disconnect_tasks: Dict[int, asyncio.Task] = {}  # ギルドID -> 保留中の自動切断タスク
+
     async def setup_event_handlers(self):
         """ボットのイベントハンドラを設定する"""
         # on_readyイベントはmain.pyで処理する必要があるため、ここでは他のイベントのみ設定
         self.bot.event(self.on_voice_state_update)
-        
+
+    def _get_guild_lock(self, guild_id: int) -> asyncio.Lock:
+        """ギルド専用のロックを取得する（なければ作成）"""
+        lock = self._guild_locks.get(guild_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._guild_locks[guild_id] = lock
+        return lock
+
+    def _seed_channel(self, guild_id: int, channel) -> None:
+        """接続チャンネルの人数を一度だけ数えて追跡を開始する"""
+        self._tracked_channels[guild_id] = channel.id
+        self._human_counts[guild_id] = sum(1 for m in channel.members if not m.bot)
+
+    def _forget_guild(self, guild_id: int) -> None:
+        """ギルドの追跡状態を破棄する"""
+        self._tracked_channels.pop(guild_id, None)
+        self._human_counts.pop(guild_id, None)
+        self._cancel_disconnect(guild_id)
+
+    def _cancel_disconnect(self, guild_id: int) -> None:
+        """保留中の自動切断をキャンセルする"""
+        task = self._disconnect_tasks.pop(guild_id, None)
+        if task and not task.done():
+            task.cancel()
+
+    def _schedule_disconnect(self, guild_id: int) -> None:
+        """猶予時間後の自動切断を予約する（既に予約済みなら何もしない）"""
+        task = self._disconnect_tasks.get(guild_id)
+        if task and not task.done():
+            return
+        self._disconnect_tasks[guild_id] = asyncio.create_task(self._delayed_disconnect(guild_id))
+
+    def _update_schedule(self, guild_id: int, human_left: bool) -> None:
+        """人がいれば自動切断をキャンセルし、人が退出してBotだけになった場合のみ自動切断を予約する"""
+        if self._human_counts.get(guild_id, 0) > 0:
+            self._cancel_disconnect(guild_id)
+        elif human_left:
+            self._schedule_disconnect(guild_id)
+
     async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
         """ボイスチャンネルの状態が変化したときに呼び出されるイベント"""
-        # Bot自身の状態変化は無視
+        guild_id = member.guild.id
+
+        # Bot自身の状態変化（接続・移動・切断）では追跡対象のチャンネルを更新する
         if member.id == self.bot.user.id:
+            async with self._get_guild_lock(guild_id):
+                if after.channel is None:
+                    self._forget_guild(guild_id)
+                    if self.voice_sessions:
+                        # キック・チャンネル削除を含め、切断されたら再接続しない
+                        self.voice_sessions.on_disconnected(member.guild)
+                elif before.channel is None or before.channel.id != after.channel.id:
+                    # 誰もいないチャンネルに参加・移動しただけでは切断しない（人が退出したときに予約する）
+                    self._seed_channel(guild_id, after.channel)
+                    self._cancel_disconnect(guild_id)
+                    if self.voice_sessions:
+                        self.voice_sessions.on_moved(guild_id, after.channel.id)
+            return
+
+        # ミュート・デフン等、チャンネルが変わらない変化やBotの変化は人数に影響しない
+        before_id = before.channel.id if before.channel else None
+        after_id = after.channel.id if after.channel else None
+        if before_id == after_id or member.bot:
             return
 
-        # 複数の音声状態変化が同時に発生する場合の競合状態を防ぐ
-        async with self._disconnect_lock:
+        async with self._get_guild_lock(guild_id):
             voice_client = member.guild.voice_client
-            
+
             # ボイスクライアントが存在し、接続されているかチェック
-            if not voice_client or not voice_client.is_connected():
+            if not voice_client or not voice_client.is_connected() or not voice_client.channel:
+                self._forget_guild(guild_id)
                 return
-            
-            # Botが接続しているチャンネルを取得
+
             connected_channel = voice_client.channel
-            if not connected_channel:
+            tracked_id = self._tracked_channels.get(guild_id)
+            if tracked_id != connected_channel.id:
+                # 追跡開始前の接続やイベントの取りこぼしがあった場合のみ数え直す
+                self._seed_channel(guild_id, connected_channel)
+                human_left = before_id == connected_channel.id
+            elif before_id == tracked_id:
+                self._human_counts[guild_id] -= 1
+                human_left = True
+            elif after_id == tracked_id:
+                self._human_counts[guild_id] += 1
+                human_left = False
+            else:
+                return  # 別のチャンネルでの出入り
+
+            self._update_schedule(guild_id, human_left)
+
+    async def _delayed_disconnect(self, guild_id: int):
+        """猶予時間が経過してもBotしかいなければ切断する"""
+        try:
+            await asyncio.sleep(self.grace_period)
+        except asyncio.CancelledError:
+            return
+
+        async with self._get_guild_lock(guild_id):
+            # 自分自身の参照を解除（以降の _forget_guild で自分をキャンセルしないように）
+            if self._disconnect_tasks.get(guild_id) is asyncio.current_task():
+                self._disconnect_tasks.pop(guild_id, None)
+
+            guild = self.bot.get_guild(guild_id)
+            voice_client = guild.voice_client if guild else None
+            if not voice_client or not voice_client.is_connected() or not voice_client.channel:
+                self._forget_guild(guild_id)
+                return
+
+            if self._human_counts.get(guild_id, 0) > 0:
                 return
-            
-            # チャンネルにBot以外のユーザーが残っているか確認
+
             try:
-                # Bot以外のメンバーのリストを作成（再度接続状態をチェック）
-                human_members = [m for m in connected_channel.members if not m.bot]
-                
-                if not human_members:  # Botしか残っていない場合
-                    print(f"{connected_channel.name} にBotしかいないため、自動切断します。")
-                    
-                    # 切断前に再度接続状態を確認
-                    if voice_client.is_connected():
-                        await voice_client.disconnect()
-                        
-                        # テキストチャンネルに通知メッセージを送信する
-                        await self._send_disconnect_notification(voice_client)
-                        
+                connected_channel = voice_client.channel
+                print(f"{connected_channel.name} にBotしかいないため、自動切断します。")
+                if self.voice_sessions:
+                    self.voice_sessions.release(guild_id)
+                await voice_client.disconnect()
+                self._forget_guild(guild_id)
+
+                # テキストチャンネルに通知メッセージを送信する
+                await self._send_disconnect_notification(guild_id)
             except Exception as e:
-                print(f"ボイス状態更新処理中にエラーが発生しました: {e}")
-    
-    async def _send_disconnect_notification(self, voice_client):
+                print(f"自動切断処理中にエラーが発生しました: {e}")
+
+    async def _send_disconnect_notification(self, guild_id: int):
         """自動切断の通知メッセージを送信する"""
-        last_interaction_channel = getattr(voice_client, "last_interaction_channel", None)
+        channel_id = self.state_store.get_guild_setting(guild_id, "last_interaction_channel_id")
+        last_interaction_channel = self.bot.get_channel(channel_id) if channel_id else None
         if last_interaction_channel:
             try:
                 await last_interaction_channel.send("ボイスチャンネルに誰もいなくなったため、自動的に切断しました。")
@@ -59,4 +158,4 @@ class BotEventHandler:
             except discord.errors.HTTPException as e:
                 print(f"自動切断メッセージ送信中にHTTPエラー: {e}")
             except Exception as e:
-                print(f"自動切断メッセージ送信中に予期せぬエラー: {e}") 
\ No newline at end of file
+                print(f"自動切断メッセージ送信中に予期せぬエラー: {e}")
@@ -1,12 +1,44 @@
 import os
-import google.generativeai as genai
-from config import GEMINI_DEFAULT_PERSONA, GEMINI_MODEL_NAME
+from modules.gemini_router import GeminiRouter, ModelRouteError
+from modules.gemini_scheduler import GeminiQueueFullError, GeminiScheduler, PRIORITY_BULK
+from modules.token_accounting import TokenUsageTracker, estimate_tokens
+from config import (
+    GEMINI_COMMAND_PRIORITIES,
+    GEMINI_COMMAND_ROUTES,
+    GEMINI_DEFAULT_PERSONA,
+    GEMINI_EXACT_COUNT_RATIO,
+    GEMINI_LONG_ROUTE,
+    GEMINI_MAX_CONCURRENCY,
+    GEMINI_MAX_QUEUE_WAIT,
+    GEMINI_MODEL_MAX_OUTPUT_TOKENS,
+    GEMINI_MODEL_NAME,
+    GEMINI_MODEL_ROUTES,
+    GEMINI_REQUESTS_PER_MINUTE,
+    GEMINI_THROTTLE_COOLDOWN,
+    GEMINI_TOKEN_BUDGETS,
+    SEMANTIC_CACHE_COMMANDS,
+    VOICE_SPEECH_SUMMARY_MAX_CHARS,
+)
 
 class GeminiHandler:
     def __init__(self):
         self.api_key = os.getenv("GEMINI_API_KEY")
         self.model = None
         self.initialized = False
+        self.usage = TokenUsageTracker()
+        self.scheduler = GeminiScheduler(
+            max_concurrency=GEMINI_MAX_CONCURRENCY,
+            requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+            max_wait=GEMINI_MAX_QUEUE_WAIT,
+        )
+        self.router = GeminiRouter(
+            GEMINI_MODEL_ROUTES,
+            GEMINI_COMMAND_ROUTES,
+            long_route=GEMINI_LONG_ROUTE,
+            throttle_cooldown=GEMINI_THROTTLE_COOLDOWN,
+            model_max_output_tokens=GEMINI_MODEL_MAX_OUTPUT_TOKENS,
+        )
+        self.semantic_cache = None  # SemanticCache（設定されていれば /ask の回答を再利用する）
         
     def initialize(self):
         """Gemini APIを初期化する"""
@@ -15,39 +47,141 @@ class GeminiHandler:
             return False
             
         try:
+            # google.generativeaiは読み込みに時間がかかるため、APIキーが設定されている場合だけ読み込む
+            import google.generativeai as genai
+
             genai.configure(api_key=self.api_key)
             self.model = genai.GenerativeModel(GEMINI_MODEL_NAME) 
+            # 応答の生成はコマンドごとのルートで選んだモデルで行う（self.modelはトークン数の計測用）
+            self.router.initialize()
             self.initialized = True
             return True
         except Exception as e:
             print(f"Gemini APIの初期化中にエラーが発生しました: {e}")
             return False
     
-    async def generate_response(self, query: str):
-        """ユーザーの質問に対してGemini APIを使用して応答を生成する"""
+    def token_budget(self, command: str) -> int:
+        """コマンドごとの入力トークンの上限"""
+        return GEMINI_TOKEN_BUDGETS.get(command, GEMINI_TOKEN_BUDGETS["default"])
+
+    def command_priority(self, command: str) -> int:
+        """コマンドの実行優先度（未登録のコマンドは大きなリクエストとして扱う）"""
+        return GEMINI_COMMAND_PRIORITIES.get(command, PRIORITY_BULK)
+
+    @staticmethod
+    def _busy_message(error: Exception) -> str:
+        print(f"Gemini APIが混み合っているため、リクエストを処理できませんでした: {error}")
+        return "現在つむぎへのリクエストが混み合っています。時間をおいて再度お試しください。"
+
+    def build_prompt(self, query: str, persona: str = GEMINI_DEFAULT_PERSONA) -> str:
+        """キャラクター設定を付けたプロンプトを作る"""
+        return f"{persona}\n\nユーザーからの質問:\n{query}"
+
+    async def count_tokens(self, prompt: str, budget: int | None = None) -> int:
+        """プロンプトのトークン数を返す
+
+        通常はローカルで推定し、上限に近い場合だけcount_tokensで正確に数える（API呼び出しを減らすため）。
+        """
+        estimated = estimate_tokens(prompt)
+        if budget is None or estimated < budget * GEMINI_EXACT_COUNT_RATIO or not self.model:
+            return estimated
+        try:
+            result = await self.model.count_tokens_async(prompt)
+            return result.total_tokens
+        except Exception as e:
+            print(f"トークン数の取得に失敗したため推定値を使用します: {e}")
+            return estimated
+
+    @staticmethod
+    def _response_text(response):
+        """応答の本文と終了理由（"MAX_TOKENS" など）を返す
+
+        本文のパートがない応答で .text を参照すると例外になるため、候補のパートを確認してから取り出す。
+        """
+        candidates = getattr(response, "candidates", None) or []
+        if not candidates:
+            return None, None
+        candidate = candidates[0]
+        finish_reason = getattr(candidate.finish_reason, "name", None) or str(candidate.finish_reason)
+        content = getattr(candidate, "content", None)
+        parts = content.parts if content else []
+        text = "".join(getattr(part, "text", "") or "" for part in parts)
+        return text or None, finish_reason
+
+    def _record_usage(self, guild_id: int | None, command: str, response, input_tokens: int):
+        """応答のusage_metadataから入力・出力トークン数を記録する"""
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or input_tokens
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        self.usage.record(guild_id, command, prompt_tokens, output_tokens)
+
+    async def generate_response(self, query: str, command: str = "ask", guild_id: int | None = None,
+                                persona: str = GEMINI_DEFAULT_PERSONA):
+        """ユーザーの質問に対してGemini APIを使用して応答を生成する
+
+        command ごとの入力トークンの上限を超える場合はリクエストを送らずに失敗を返す。
+        意味キャッシュの対象コマンドで、意味の近い質問の回答があればそれを返す。
+        """
         if not self.initialized or not self.model:
             print("Gemini APIが初期化されていません。")
             return None, "Gemini APIが設定されていません。"
+
+        use_cache = self.semantic_cache is not None and guild_id is not None and command in SEMANTIC_CACHE_COMMANDS
+        if use_cache:
+            # 一致しなかった場合は、回答の保存に同じ埋め込みを使う（埋め込みが混み合っていて得られなければ保存しない）
+            cached, query_vector = await self.semantic_cache.lookup(guild_id, query)
+            if cached is not None:
+                return True, cached
             
         try:
             # キャラクター設定をconfig.pyから読み込む
-            prompt_with_personality = f"{GEMINI_DEFAULT_PERSONA}\n\nユーザーからの質問:\n{query}"
-            gemini_response = await self.model.generate_content_async(prompt_with_personality)
+            prompt_with_personality = self.build_prompt(query, persona)
+            budget = self.token_budget(command)
+            input_tokens = await self.count_tokens(prompt_with_personality, budget)
+            if input_tokens > budget:
+                print(f"入力トークン数が上限を超えています (コマンド: {command}): {input_tokens} > {budget}")
+                return False, f"入力が長すぎます（約{input_tokens}トークン、上限{budget}トークン）。短くして再度お試しください。"
+
+            # 同時実行数・1分あたりのリクエスト数の上限内で、優先度順に実行する
+            # コマンドと入力サイズに合ったモデルを使い、遅い・制限中の場合は別のモデルに切り替える
+            async with self.scheduler.slot(self.command_priority(command)):
+                gemini_response, model_name = await self.router.generate(
+                    command, prompt_with_personality, input_tokens=input_tokens
+                )
+            self._record_usage(guild_id, f"{command} ({model_name})", gemini_response, input_tokens)
             
-            if gemini_response.text:
-                return True, gemini_response.text
+            text, finish_reason = self._response_text(gemini_response)
+            if text:
+                if use_cache and query_vector is not None:
+                    await self.semantic_cache.store(guild_id, query, text, vector=query_vector)
+                return True, text
             elif gemini_response.prompt_feedback and gemini_response.prompt_feedback.block_reason:
                 error_message = f"つむぎからの応答がブロックされました。理由: {gemini_response.prompt_feedback.block_reason}"
                 return False, error_message
+            elif finish_reason == "MAX_TOKENS":
+                print(f"出力トークンの上限に達し、応答の本文がありませんでした (コマンド: {command}, モデル: {model_name})")
+                return False, "つむぎの応答が長くなりすぎたため、途中で止まってしまいました。質問を短くして再度お試しください。"
             else:
                 error_message = "つむぎから有効な応答がありませんでした。"
                 return False, error_message
                 
+        except (GeminiQueueFullError, ModelRouteError) as e:
+            return False, self._busy_message(e)
         except Exception as e:
             print(f"Gemini APIリクエスト中にエラーが発生しました: {e}")
             return False, "申し訳ありません、処理中にエラーが発生しました。"
     
-    async def generate_youtube_summary(self, youtube_url: str):
+    async def generate_speech_response(self, query: str, guild_id: int | None = None):
+        """読み上げ用の短い応答を生成する（テキスト応答の生成と並行して呼び出す想定）"""
+        speech_query = (
+            f"以下の内容に、音声で読み上げるための短い返答をしてください。\n"
+            f"- {VOICE_SPEECH_SUMMARY_MAX_CHARS}文字以内の話し言葉\n"
+            f"- URL・コード・記号・箇条書きは使わない\n\n"
+            f"{query}"
+        )
+        return await self.generate_response(speech_query, command="speech", guild_id=guild_id)
+
+    async def generate_youtube_summary(self, youtube_url: str, guild_id: int | None = None):
         """YouTube URLを使用してGemini APIで動画要約を生成する"""
         if not self.initialized or not self.model:
             print("Gemini APIが初期化されていません。")
@@ -69,17 +203,26 @@ class GeminiHandler:
                 {"file_data": {"file_uri": youtube_url}}
             ]
             
-            response = await self.model.generate_content_async(content)
+            async with self.scheduler.slot(self.command_priority("youtube")):
+                response, model_name = await self.router.generate("youtube", content)
+            # 動画のトークン数は事前に分からないため、usage_metadataの値だけを記録する
+            self._record_usage(guild_id, f"youtube ({model_name})", response, 0)
             
-            if response.text:
-                return True, response.text
+            text, finish_reason = self._response_text(response)
+            if text:
+                return True, text
             elif response.prompt_feedback and response.prompt_feedback.block_reason:
                 error_message = f"応答がブロックされました。理由: {response.prompt_feedback.block_reason}"
                 return False, error_message
+            elif finish_reason == "MAX_TOKENS":
+                print(f"出力トークンの上限に達し、要約の本文がありませんでした (モデル: {model_name})")
+                return False, "要約が長くなりすぎたため、途中で止まってしまいました。"
             else:
                 error_message = "有効な応答がありませんでした。"
                 return False, error_message
                 
+        except (GeminiQueueFullError, ModelRouteError) as e:
+            return False, self._busy_message(e)
         except Exception as e:
             print(f"YouTube動画要約中にエラーが発生しました: {e}")
             return False, "YouTube動画の処理中にエラーが発生しました。"
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from utils.metrics import metrics
+
+class ModelRouteError(Exception):
+    """ルート内のすべてのモデルが遅延・制限で応答できなかったことを表す例外"""
+
+
+class GeminiRouter:
+    """コマンド・入力サイズ・応答時間に応じてGeminiモデルを選ぶクラス
+
+    ルートごとにモデルの候補と生成設定（max_output_tokens など）を持ち、
+    先頭のモデルが遅い・429で制限中の場合は次の候補を使う。
+    """
+
+    def __init__(self, routes: Dict[str, dict], command_routes: Dict[str, str], long_route: str,
+                 throttle_cooldown: float = 60.0, model_max_output_tokens: Optional[Dict[str, Optional[int]]] = None):
+        """
+        Args:
+            routes: ルート名から設定（models, max_output_tokens, temperature, max_input_tokens, timeout, slow_seconds）
+            command_routes: コマンド名からルート名
+            long_route: 入力が大きい場合や未登録のコマンドに使うルート名
+            throttle_cooldown: 429を返したモデルを後回しにする時間（秒）
+            model_max_output_tokens: モデル名からルートの設定より優先する max_output_tokens（Noneは上限なし。思考モデル用）
+        """
+        self.routes = routes
+        self.command_routes = command_routes
+        self.long_route = long_route
+        self.throttle_cooldown = throttle_cooldown
+        self.model_max_output_tokens = model_max_output_tokens or {}
+        self._models: Dict[Tuple[str, str], Any] = {}  # (ルート名, モデル名) から GenerativeModel
+        self._latency: Dict[str, float] = {}  # モデルごとの応答時間の移動平均（秒）
+        self._latency_updated_at: Dict[str, float] = {}
+        self._throttled_until: Dict[str, float] = {}
+
+    def initialize(self):
+        """ルートとモデルの組み合わせごとにGenerativeModelを作成する（genai.configure後に呼ぶ）"""
+        import google.generativeai as genai
+
+        for route_name, route in self.routes.items():
+            for model_name in route["models"]:
+                max_output_tokens = route.get("max_output_tokens")
+                if model_name in self.model_max_output_tokens:
+                    # 思考トークンで上限を使い切って本文が空にならないよう、モデルごとの上限を使う
+                    max_output_tokens = self.model_max_output_tokens[model_name]
+                generation_config = genai.GenerationConfig(
+                    max_output_tokens=max_output_tokens,
+                    temperature=route.get("temperature"),
+                )
+                self._models[(route_name, model_name)] = genai.GenerativeModel(
+                    model_name, generation_config=generation_config
+                )
+
+    def select_route(self, command: str, input_tokens: int = 0) -> str:
+        """コマンドと入力トークン数からルートを選ぶ"""
+        route_name = self.command_routes.get(command, self.long_route)
+        max_input = self.routes[route_name].get("max_input_tokens")
+        if max_input is not None and input_tokens > max_input:
+            return self.long_route
+        return route_name
+
+    def candidates(self, route_name: str) -> List[str]:
+        """試す順に並べたモデル名（遅いモデルは後ろ、制限中のモデルは最後）"""
+        route = self.routes[route_name]
+        models = list(route["models"])
+        primary = models[0]
+        slow_seconds = route.get("slow_seconds")
+        now = time.monotonic()
+        # 遅いと判定してからしばらく経ったモデルは、回復しているか確かめるため再び優先する
+        recently_measured = now - self._latency_updated_at.get(primary, 0.0) < self.throttle_cooldown
+        if slow_seconds is not None and recently_measured and self._latency.get(primary, 0.0) > slow_seconds:
+            faster = [name for name in models[1:] if self._latency.get(name, 0.0) < self._latency[primary]]
+            if faster:
+                models.remove(faster[0])
+                models.insert(0, faster[0])
+
+        available = [name for name in models if self._throttled_until.get(name, 0.0) <= now]
+        throttled = [name for name in models if name not in available]
+        return available + throttled
+
+    def record_latency(self, model_name: str, seconds: float):
+        previous = self._latency.get(model_name)
+        self._latency[model_name] = seconds if previous is None else previous * 0.7 + seconds * 0.3
+        self._latency_updated_at[model_name] = time.monotonic()
+        metrics.observe(f"gemini.latency.{model_name}", seconds)
+
+    @staticmethod
+    def _is_throttled(error: Exception) -> bool:
+        """429（ResourceExhausted）かどうか"""
+        return (
+            getattr(error, "code", None) == 429
+            or type(error).__name__ == "ResourceExhausted"
+            or "429" in str(error)
+        )
+
+    async def generate(self, command: str, contents, input_tokens: int = 0):
+        """ルートのモデルで応答を生成し、(応答, 使用したモデル名) を返す
+
+        タイムアウト・429の場合は次の候補のモデルで再試行し、すべて失敗したら ModelRouteError を送出する。
+        """
+        route_name = self.select_route(command, input_tokens)
+        timeout = self.routes[route_name].get("timeout")
+        last_error = None
+        for model_name in self.candidates(route_name):
+            model = self._models[(route_name, model_name)]
+            started_at = time.monotonic()
+            try:
+                response = await asyncio.wait_for(model.generate_content_async(contents), timeout=timeout)
+            except asyncio.TimeoutError as e:
+                print(f"Geminiモデル {model_name} が{timeout}秒以内に応答しなかったため、次のモデルを試します。")
+                self.record_latency(model_name, time.monotonic() - started_at)
+                last_error = e
+                continue
+            except Exception as e:
+                if not self._is_throttled(e):
+                    raise
+                print(f"Geminiモデル {model_name} がレート制限中のため、次のモデルを試します: {e}")
+                self._throttled_until[model_name] = time.monotonic() + self.throttle_cooldown
+                last_error = e
+                continue
+
+            self.record_latency(model_name, time.monotonic() - started_at)
+            return response, model_name
+
+        raise ModelRouteError(f"ルート {route_name} のモデルがすべて応答できませんでした: {last_error}")
@@ -0,0 +1,151 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, List, Tuple
+from utils.metrics import metrics
+
+# 優先度（小さいほど先に実行する）
+PRIORITY_INTERACTIVE = 0  # /ask など、ユーザーが応答を待っているリクエスト
+PRIORITY_BULK = 1  # YouTube要約など、時間がかかっても良い大きなリクエスト
+
+class GeminiQueueFullError(Exception):
+    """待ち時間が上限を超えるため、リクエストを受け付けられないことを表す例外"""
+
+    def __init__(self, estimated_wait: float):
+        super().__init__(f"推定待ち時間 {estimated_wait:.0f}秒")
+        self.estimated_wait = estimated_wait
+
+
+class GeminiScheduler:
+    """Gemini APIへのリクエストの同時実行数と1分あたりのリクエスト数を制限するクラス
+
+    上限に達している間は優先度順（同じ優先度なら到着順）に待機させる。
+    待ち時間がDiscordのインタラクションの有効期限を超えそうな場合は、待たずに GeminiQueueFullError を送出する。
+    """
+
+    def __init__(self, max_concurrency: int = 4, requests_per_minute: int = 10, max_wait: float = 840.0):
+        """
+        Args:
+            max_concurrency: 同時に実行するリクエストの最大数
+            requests_per_minute: 1分あたりに開始するリクエストの最大数
+            max_wait: 待機時間の上限（秒）
+        """
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.max_wait = max_wait
+        self._running = 0
+        self._started: Deque[float] = deque()  # 直近1分間に開始したリクエストの時刻
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._wake_handle = None
+        self._average_duration = 5.0  # リクエスト1件の処理時間の移動平均（秒）
+
+    @property
+    def queue_length(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def _prune(self, now: float):
+        while self._started and now - self._started[0] >= 60.0:
+            self._started.popleft()
+
+    def _can_start(self, now: float) -> bool:
+        self._prune(now)
+        return self._running < self.max_concurrency and len(self._started) < self.requests_per_minute
+
+    def estimate_wait(self, priority: int) -> float:
+        """この優先度のリクエストを今追加した場合の待ち時間を推定する（秒）"""
+        now = time.monotonic()
+        self._prune(now)
+        ahead = sum(1 for p, _, future in self._waiters if p <= priority and not future.done())
+        if ahead == 0 and self._can_start(now):
+            return 0.0
+
+        # 同時実行数による待ち時間
+        concurrency_wait = (ahead // self.max_concurrency + 1) * self._average_duration
+        # 1分あたりの上限による待ち時間（空き枠を超えた分は1分ごとに順に開始される）
+        over_budget = ahead + 1 - (self.requests_per_minute - len(self._started))
+        rate_wait = 0.0
+        if over_budget > 0:
+            oldest = self._started[0] if self._started else now
+            rate_wait = max(0.0, oldest + 60.0 - now) + (over_budget - 1) // self.requests_per_minute * 60.0
+        return max(concurrency_wait, rate_wait)
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE) -> float:
+        """実行枠を確保するまで待ち、待機した時間（秒）を返す"""
+        estimated = self.estimate_wait(priority)
+        if estimated > self.max_wait:
+            metrics.observe("gemini.queue_rejected", estimated)
+            raise GeminiQueueFullError(estimated)
+
+        queued_at = time.monotonic()
+        if not self._waiters and self._can_start(queued_at):
+            self._start(queued_at)
+            metrics.observe("gemini.queue_wait", 0.0)
+            return 0.0
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._wake()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                metrics.observe("gemini.queue_rejected", time.monotonic() - queued_at)
+                raise GeminiQueueFullError(time.monotonic() - queued_at)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 枠を割り当てられた直後にキャンセルされた
+                self.release()
+            else:
+                future.cancel()
+            raise
+
+        waited = time.monotonic() - queued_at
+        metrics.observe("gemini.queue_wait", waited)
+        if waited >= 1.0:
+            print(f"Gemini APIの実行待ち: {waited:.1f}秒（待機中 {self.queue_length}件）")
+        return waited
+
+    def release(self, duration: float | None = None):
+        """実行枠を返却する（duration は処理時間の移動平均に使用する）"""
+        self._running = max(0, self._running - 1)
+        if duration is not None:
+            self._average_duration = self._average_duration * 0.8 + duration * 0.2
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE):
+        """実行枠を確保してから処理を行うためのコンテキストマネージャ"""
+        await self.acquire(priority)
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started_at)
+
+    def _start(self, now: float):
+        self._running += 1
+        self._started.append(now)
+
+    def _wake(self):
+        """空いた枠を優先度順に待機中のリクエストへ割り当てる"""
+        now = time.monotonic()
+        while self._waiters and self._can_start(now):
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue  # タイムアウト・キャンセル済み
+            self._start(now)
+            future.set_result(None)
+
+        # 1分あたりの上限で止まっている場合は、枠が空く時刻に再度割り当てる
+        if self._waiters and self._running < self.max_concurrency and self._started and self._wake_handle is None:
+            delay = max(0.0, self._started[0] + 60.0 - now)
+            self._wake_handle = asyncio.get_running_loop().call_later(delay, self._on_wake_timer)
+
+    def _on_wake_timer(self):
+        self._wake_handle = None
+        self._wake()
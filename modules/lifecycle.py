@@ -0,0 +1,101 @@
+import asyncio
+import signal
+from typing import Awaitable, Callable, List, Set
+import discord
+from config import SHUTDOWN_DRAIN_TIMEOUT
+from modules.voice_session import VoiceSessionManager
+
+class LifecycleManager:
+    """SIGTERM/SIGINTを受けてBotを安全に停止させるクラス
+
+    停止時は新しいコマンドの受付を止め、実行中のコマンド（音声合成を含む）と再生中の音声を
+    期限まで待ってから、キャッシュ等を書き出し、ボイス接続を切断してクライアントを閉じる。
+    """
+
+    def __init__(self, bot: discord.Client, drain_timeout: float = SHUTDOWN_DRAIN_TIMEOUT,
+                 voice_sessions: VoiceSessionManager | None = None):
+        self.bot = bot
+        self.voice_sessions = voice_sessions
+        self.drain_timeout = drain_timeout
+        self.accepting = True
+        self._in_flight: Set[asyncio.Task] = set()
+        self._shutdown_hooks: List[Callable[[], Awaitable[None]]] = []
+        self._shutdown_task = None
+
+    def add_shutdown_hook(self, hook: Callable[[], Awaitable[None]]):
+        """停止時（ボイス切断前）に呼び出す非同期関数を登録する"""
+        self._shutdown_hooks.append(hook)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        """CommandTree.interaction_checkとして使用し、実行中のコマンドを追跡する"""
+        if not self.accepting:
+            try:
+                await interaction.response.send_message("つむぎは再起動の準備中です。少し待ってから再度お試しください。", ephemeral=True)
+            except discord.errors.HTTPException:
+                pass
+            return False
+
+        # CommandTreeはインタラクションごとにタスクを作成してコマンドを実行する
+        task = asyncio.current_task()
+        if task:
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+        return True
+
+    def install_signal_handlers(self):
+        """SIGTERM/SIGINTで安全な停止処理を開始するように設定する"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.request_shutdown, sig.name)
+            except (NotImplementedError, RuntimeError):
+                # Windowsなどシグナルハンドラを設定できない環境
+                pass
+
+    def request_shutdown(self, reason: str = "shutdown"):
+        """停止処理を開始する（複数回呼ばれても一度だけ実行する）"""
+        if self._shutdown_task is None:
+            self._shutdown_task = asyncio.create_task(self.shutdown(reason))
+
+    async def shutdown(self, reason: str = "shutdown"):
+        """実行中の処理を期限まで待ってからBotを停止する"""
+        print(f"{reason} を受信しました。新しいコマンドの受付を停止し、実行中の処理を待機します...")
+        self.accepting = False
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.drain_timeout
+
+        # 実行中のコマンド（Gemini応答・音声合成・読み上げ）を待つ
+        pending = {task for task in self._in_flight if not task.done()}
+        if pending:
+            print(f"実行中のコマンド {len(pending)}件の完了を待っています...")
+            _, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - loop.time()))
+
+        # コマンド外で再生中の音声があれば終わるまで待つ
+        while any(vc.is_playing() for vc in self.bot.voice_clients) and loop.time() < deadline:
+            await asyncio.sleep(0.2)
+
+        if pending:
+            print(f"期限までに完了しなかったコマンド {len(pending)}件をキャンセルします。")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        # キャッシュ等を書き出す
+        for hook in self._shutdown_hooks:
+            try:
+                await hook()
+            except Exception as e:
+                print(f"停止処理中にエラーが発生しました: {e}")
+
+        # ボイス接続を切断する（再生中のFFmpegプロセスとバッファもここで解放される）
+        for voice_client in list(self.bot.voice_clients):
+            if self.voice_sessions and voice_client.guild:
+                # 読み上げが接続の復帰を待たないように、意図した切断として扱う
+                self.voice_sessions.release(voice_client.guild.id)
+            try:
+                await voice_client.disconnect(force=True)
+            except Exception as e:
+                print(f"ボイスチャンネルからの切断中にエラーが発生しました: {e}")
+
+        print("Botを停止します。")
+        await self.bot.close()
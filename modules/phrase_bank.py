@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import struct
+from typing import Dict, Optional
+import discord
+from modules.audio_sources import OpusPacketAudio, PCMBufferAudio, encode_opus_packets, opus_available
+from modules.audio_mixer import PRIORITY_NOTIFICATION
+from modules.voicevox import VoiceVoxHandler
+
+class PhraseBank:
+    """定型文をあらかじめ合成し、1つのファイルにまとめてmmapで保持するクラス
+
+    ファイルは「マジック + インデックス長 + インデックス(JSON) + 各定型文のPCMとOpusパケット」の形式で、
+    定型文・話者・モデルが変わっていなければ再起動時は合成せずにそのまま読み込む。
+    mmapはページキャッシュを共有するため、複数プロセスで同じファイルを開いてもメモリは増えない。
+    Opusパケットはエンコード済みのまま送信できるため、再生スレッドでのエンコードが不要になる。
+    """
+
+    MAGIC = b"AISPB02\x00"
+    _HEADER = struct.Struct("<8sI")
+    _PACKET_LENGTH = struct.Struct("<H")
+
+    def __init__(self, voice_handler: VoiceVoxHandler, path: str):
+        self.voice_handler = voice_handler
+        self.path = path
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._view: Optional[memoryview] = None
+        self._index: Dict[str, tuple] = {}
+        self._opus_packets: Dict[str, list] = {}
+        self._build_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self._view is not None
+
+    def _manifest_key(self, phrases: Dict[str, str]) -> str:
+        """定型文・話者・モデルから、ファイルを再利用できるか判定するためのキーを作る"""
+        source = json.dumps(
+            {
+                "phrases": phrases,
+                "model_id": self.voice_handler.model_id,
+                "style_id": self.voice_handler.style_id,
+                "sampling_rate": VoiceVoxHandler.PCM_SAMPLING_RATE,
+                "profile": self.voice_handler.default_profile._asdict(),
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    def start_build(self, phrases: Dict[str, str]):
+        """バックグラウンドでフレーズバンクを作成する（作成中・作成済みなら何もしない）"""
+        if self.is_ready or (self._build_task and not self._build_task.done()):
+            return
+        self._build_task = asyncio.create_task(self.build(phrases))
+
+    async def build(self, phrases: Dict[str, str]):
+        """既存のファイルが使えれば読み込み、なければ定型文を合成してファイルを作成する"""
+        key = self._manifest_key(phrases)
+        try:
+            if await self._load(key):
+                print(f"フレーズバンク {self.path} を読み込みました（{len(self._index)}件）。")
+                return
+
+            print(f"フレーズバンクを作成しています（{len(phrases)}件）...")
+            pcm_by_name = {}
+            opus_by_name = {}
+            # Opusが使えない環境ではPCMのみを保存する
+            encode_opus = opus_available()
+            if not encode_opus:
+                print("libopusを読み込めないため、定型文はPCMのみで保存します。")
+            for name, text in phrases.items():
+                pcm_data = await self.voice_handler.synthesize_pcm(text)
+                if not pcm_data:
+                    print(f"警告: 定型文「{name}」の合成に失敗しました。")
+                    continue
+                pcm_by_name[name] = pcm_data
+                if not encode_opus:
+                    continue
+                try:
+                    opus_by_name[name] = await asyncio.to_thread(encode_opus_packets, pcm_data)
+                except Exception as e:
+                    print(f"警告: 定型文「{name}」のOpusエンコードに失敗しました: {e!r}")
+
+            await asyncio.to_thread(self._write, key, pcm_by_name, opus_by_name)
+            if await self._load(key):
+                print(f"フレーズバンク {self.path} を作成しました（{len(self._index)}件）。")
+        except Exception as e:
+            print(f"フレーズバンクの作成中にエラーが発生しました: {e}")
+
+    def _write(self, key: str, pcm_by_name: Dict[str, bytes], opus_by_name: Dict[str, list]):
+        """一時ファイルに書き出してから置き換える（読み込み中のプロセスを壊さないため）"""
+        index = {}
+        blobs = []
+        offset = 0
+        for name, pcm_data in pcm_by_name.items():
+            # Opusパケットは「長さ(2バイト) + パケット」を並べて保存する
+            opus_data = b"".join(
+                self._PACKET_LENGTH.pack(len(packet)) + packet
+                for packet in opus_by_name.get(name, [])
+            )
+            index[name] = [offset, len(pcm_data), offset + len(pcm_data), len(opus_data)]
+            blobs.extend((pcm_data, opus_data))
+            offset += len(pcm_data) + len(opus_data)
+        index_bytes = json.dumps({"key": key, "phrases": index}, ensure_ascii=False).encode("utf-8")
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(self._HEADER.pack(self.MAGIC, len(index_bytes)))
+            f.write(index_bytes)
+            for blob in blobs:
+                f.write(blob)
+        os.replace(temp_path, self.path)
+
+    def _open_mapping(self, key: str):
+        """ファイルをmmapで開いて (ファイル, mmap, インデックス) を返す（キーが一致しなければNone）"""
+        if not os.path.exists(self.path):
+            return None
+
+        file = open(self.path, "rb")
+        try:
+            magic, index_length = self._HEADER.unpack(file.read(self._HEADER.size))
+            if magic != self.MAGIC:
+                raise ValueError("フレーズバンクの形式が異なります")
+            index = json.loads(file.read(index_length).decode("utf-8"))
+            if index.get("key") != key:
+                file.close()
+                return None
+
+            data_offset = self._HEADER.size + index_length
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception as e:
+            print(f"フレーズバンクの読み込みに失敗しました: {e}")
+            file.close()
+            return None
+
+        phrases = {
+            name: (data_offset + pcm_offset, pcm_length, data_offset + opus_offset, opus_length)
+            for name, (pcm_offset, pcm_length, opus_offset, opus_length) in index["phrases"].items()
+        }
+        return file, mapped, phrases
+
+    async def _load(self, key: str) -> bool:
+        """ファイルが使えればmmapに切り替える"""
+        opened = await asyncio.to_thread(self._open_mapping, key)
+        if opened is None:
+            return False
+
+        self._close_mapping()
+        self._file, self._mmap, self._index = opened
+        self._view = memoryview(self._mmap)
+        # Opusパケットの位置は読み込み時に一度だけ解析しておく（パケット自体はmmap上のまま）
+        self._opus_packets = {
+            name: self._split_packets(opus_offset, opus_length)
+            for name, (_, _, opus_offset, opus_length) in self._index.items()
+            if opus_length
+        }
+        return True
+
+    def _split_packets(self, offset: int, length: int) -> list:
+        packets = []
+        end = offset + length
+        while offset < end:
+            (packet_length,) = self._PACKET_LENGTH.unpack_from(self._view, offset)
+            offset += self._PACKET_LENGTH.size
+            packets.append(self._view[offset:offset + packet_length])
+            offset += packet_length
+        return packets
+
+    def get_source(self, name: str) -> Optional[discord.AudioSource]:
+        """定型文の再生用AudioSourceを返す（Opusパケットがあれば優先し、未作成・未登録ならNone）"""
+        if not self.is_ready or name not in self._index:
+            return None
+        packets = self._opus_packets.get(name)
+        if packets:
+            return OpusPacketAudio(packets)
+        offset, length, _, _ = self._index[name]
+        return PCMBufferAudio(self._view[offset:offset + length])
+
+    async def play(self, voice_client: discord.VoiceClient, name: str) -> bool:
+        """ボイスチャンネルで定型文を再生する（読み上げ中でも音量を下げて重ねて再生する）"""
+        if not voice_client or not voice_client.is_connected():
+            return False
+
+        source = self.get_source(name)
+        if source is None:
+            return False
+
+        track = await self.voice_handler.play_source(voice_client, source, priority=PRIORITY_NOTIFICATION)
+        return track is not None
+
+    async def close(self):
+        """作成中であれば中止し、mmapとファイルを閉じる"""
+        if self._build_task and not self._build_task.done():
+            self._build_task.cancel()
+        self._close_mapping()
+
+    def _close_mapping(self):
+        self._opus_packets = {}
+        if self._view is not None:
+            try:
+                self._view.release()
+            except BufferError:
+                pass  # 再生中のAudioSourceがバッファを参照している
+            self._view = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._index = {}
@@ -0,0 +1,304 @@
+import hashlib
+import re
+import time
+import unicodedata
+import uuid
+from typing import Dict, List, Optional, Sequence
+from modules.gemini_scheduler import PRIORITY_INTERACTIVE, GeminiScheduler
+from utils.state_store import StateStore
+
+class HashingEmbedder:
+    """語をハッシュして固定長ベクトルにするローカルの埋め込み（APIを使わない・テスト用）
+
+    漢字・カタカナ・英数字の並び（内容語）に重みを置き、ひらがな（助詞・語尾）と「何」は軽く扱う。
+    内容語が同じ言い換え（「好きな食べ物は？」「好きな食べ物なに？」）は近く、
+    内容語が違う質問（「好きな食べ物は？」「嫌いな食べ物は？」）は離れたベクトルになる。
+    意味を理解するわけではないため、内容語が異なる言い換え（「何歳？」「年齢は？」）は一致しない。
+    """
+
+    # 内容語（漢字・カタカナ・英数字の並び。疑問の「何」は除く）と、それ以外のひらがな
+    CONTENT_PATTERN = re.compile(r'(?:(?!何)[々\u4E00-\u9FFF\u30A0-\u30FFa-z0-9])+')
+    FUNCTION_PATTERN = re.compile(r'[\u3040-\u309F何]+')
+
+    def __init__(self, dim: int = 512, content_weight: float = 1.0, word_weight: float = 2.0,
+                 function_weight: float = 0.2):
+        """
+        Args:
+            dim: ベクトルの次元
+            content_weight: 内容語の1文字・2文字に付ける重み（2文字は2倍）
+            word_weight: 内容語の並び全体に付ける1文字あたりの重み
+            function_weight: ひらがなの1文字・2文字に付ける重み（2文字は2倍）
+        """
+        self.dim = dim
+        self.content_weight = content_weight
+        self.word_weight = word_weight
+        self.function_weight = function_weight
+        self.name = f"hashing-words-{dim}"
+
+    def _index(self, gram: str) -> tuple[int, float]:
+        digest = hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dim, 1.0 if value >> 63 else -1.0
+
+    def _features(self, text: str):
+        """(特徴, 重み) を順に返す"""
+        for match in self.CONTENT_PATTERN.finditer(text):
+            word = match.group(0)
+            yield word, self.word_weight * len(word)
+            for start in range(len(word)):
+                yield word[start], self.content_weight
+                if start + 1 < len(word):
+                    yield word[start:start + 2], self.content_weight * 2
+        for match in self.FUNCTION_PATTERN.finditer(text):
+            run = match.group(0)
+            for size in (1, 2):
+                for start in range(len(run) - size + 1):
+                    # 内容語と同じ文字列でも別の特徴として扱う
+                    yield "~" + run[start:start + size], self.function_weight * size
+
+    async def embed(self, texts: List[str]):
+        import numpy as np
+
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                index, sign = self._index(feature)
+                vectors[row, index] += sign * weight
+        return vectors
+
+
+class GeminiEmbedder:
+    """Gemini APIの埋め込みモデル（genai.configure済みであること）
+
+    scheduler を指定すると、その同時実行数・1分あたりのリクエスト数の上限内で呼び出す
+    （待ち時間が上限を超えそうなら GeminiQueueFullError を送出する）。
+    """
+
+    def __init__(self, model: str = "models/text-embedding-004", scheduler: Optional[GeminiScheduler] = None):
+        self.model = model
+        self.scheduler = scheduler
+        self.name = f"gemini-{model}"
+
+    async def embed(self, texts: List[str]):
+        import google.generativeai as genai
+        import numpy as np
+
+        if self.scheduler:
+            async with self.scheduler.slot(PRIORITY_INTERACTIVE):
+                result = await genai.embed_content_async(model=self.model, content=texts, task_type="semantic_similarity")
+        else:
+            result = await genai.embed_content_async(model=self.model, content=texts, task_type="semantic_similarity")
+        return np.asarray(result["embedding"], dtype=np.float32).reshape(len(texts), -1)
+
+
+class _GuildIndex:
+    """1つのギルドの埋め込みを連続した行列に保持する索引"""
+
+    def __init__(self, dim: int, capacity: int = 16):
+        import numpy as np
+
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.created_at = np.zeros(capacity, dtype=np.float64)
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.entries: List[Dict[str, str]] = []  # {"id", "query", "answer"}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def search(self, vector, now: float, ttl: float) -> tuple[int, float]:
+        """期限内のエントリから最も類似度の高い (行番号, 類似度) を返す（なければ (-1, 0.0)）"""
+        import numpy as np
+
+        count = len(self.entries)
+        if count == 0:
+            return -1, 0.0
+        # 正規化済みのベクトル同士の内積をまとめて計算する（コサイン類似度）
+        similarities = self.vectors[:count] @ vector
+        similarities[now - self.created_at[:count] > ttl] = -np.inf
+        row = int(np.argmax(similarities))
+        return row, float(similarities[row])
+
+    def add(self, vector, entry: Dict[str, str], now: float, created_at: float | None = None):
+        import numpy as np
+
+        count = len(self.entries)
+        if count == len(self.vectors):
+            capacity = len(self.vectors) * 2
+            self.vectors = np.resize(self.vectors, (capacity, self.vectors.shape[1]))
+            self.created_at = np.resize(self.created_at, capacity)
+            self.last_used = np.resize(self.last_used, capacity)
+        self.vectors[count] = vector
+        self.created_at[count] = now if created_at is None else created_at
+        self.last_used[count] = now
+        self.entries.append(entry)
+
+    def remove(self, row: int) -> Dict[str, str]:
+        """行を削除し、そのエントリを返す（最後の行で埋めて行列を連続したまま保つ）"""
+        removed = self.entries[row]
+        last = len(self.entries) - 1
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.created_at[row] = self.created_at[last]
+            self.last_used[row] = self.last_used[last]
+            self.entries[row] = self.entries[last]
+        self.entries.pop()
+        return removed
+
+    def evict(self, now: float, ttl: float, max_entries: int) -> List[Dict[str, str]]:
+        """期限切れのエントリと、上限を超えた分の最も使われていないエントリを削除し、削除したエントリを返す"""
+        removed = []
+        for row in range(len(self.entries) - 1, -1, -1):
+            if now - self.created_at[row] > ttl:
+                removed.append(self.remove(row))
+        while len(self.entries) > max_entries:
+            removed.append(self.remove(int(self.last_used[:len(self.entries)].argmin())))
+        return removed
+
+
+class SemanticCache:
+    """質問の意味が近ければ以前の回答を返すキャッシュ（ギルドごと）
+
+    質問を正規化して埋め込み、ギルドごとの行列との内積1回で最近傍を探す。
+    類似度がしきい値以上で期限内なら、Geminiを呼ばずにその回答を返す。
+    エントリは1件ずつ状態ストアに保存し（追加・削除した行だけを書き込む）、再起動後も利用する。
+    """
+
+    NAMESPACE = "semantic_cache"
+    _PUNCTUATION_PATTERN = re.compile(r'[\s\W_]+')
+    # 呼びかけの直後に続く助詞（「つむぎの好きな…」の「の」など）
+    _NAME_PARTICLES = r'(?:って|の|は|が|も|に|、)?'
+
+    def __init__(self, embedder, state_store: StateStore, threshold: float = 0.9, ttl: float = 86400.0,
+                 max_entries: int = 500, ignored_words: Sequence[str] = ()):
+        """
+        Args:
+            embedder: embed(texts) で正規化前のベクトル行列を返すオブジェクト（HashingEmbedder・GeminiEmbedderなど）
+            state_store: エントリを保存する状態ストア
+            threshold: 同じ質問とみなすコサイン類似度
+            ttl: エントリの有効期間（秒）
+            max_entries: ギルドごとのエントリ数の上限
+            ignored_words: 比較時に取り除く語（呼びかけなど）
+        """
+        self.embedder = embedder
+        self.state_store = state_store
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # 長い語から取り除く（「つむぎちゃん」を「つむぎ」より先に）。直後の助詞（「つむぎの」「つむぎって」）も取り除く
+        self.ignored_words = sorted(ignored_words, key=len, reverse=True)
+        self._ignored_pattern = re.compile(
+            "(?:" + "|".join(map(re.escape, self.ignored_words)) + ")" + self._NAME_PARTICLES
+        ) if self.ignored_words else None
+        self._indexes: Dict[int, _GuildIndex] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def normalize(self, query: str) -> str:
+        """比較用に質問を正規化する（表記ゆれ・記号・呼びかけを取り除く）"""
+        text = unicodedata.normalize("NFKC", query).lower()
+        if self._ignored_pattern:
+            text = self._ignored_pattern.sub("", text)
+        return self._PUNCTUATION_PATTERN.sub("", text)
+
+    async def _embed(self, text: str):
+        import numpy as np
+
+        vector = (await self.embedder.embed([text]))[0]
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    async def _get_index(self, guild_id: int, dim: int) -> _GuildIndex:
+        index = self._indexes.get(guild_id)
+        if index is None:
+            index = await self._load(guild_id, dim)
+        elif index.vectors.shape[1] != dim:
+            index = _GuildIndex(dim)  # 埋め込みの次元が変わった
+        self._indexes[guild_id] = index
+        return index
+
+    async def lookup(self, guild_id: int, query: str):
+        """意味が近い質問の回答と、質問の埋め込みを (回答, ベクトル) で返す
+
+        一致しなければ回答はNone。ベクトルはstoreに渡すと埋め込みを再計算せずに済む。
+        """
+        text = self.normalize(query)
+        if not text:
+            return None, None
+        try:
+            vector = await self._embed(text)
+            index = await self._get_index(guild_id, len(vector))
+        except Exception as e:
+            print(f"意味キャッシュの検索中にエラーが発生しました: {e!r}")
+            return None, None
+
+        now = time.time()
+        row, similarity = index.search(vector, now, self.ttl)
+        if row < 0 or similarity < self.threshold:
+            self.misses += 1
+            return None, vector
+
+        index.last_used[row] = now
+        self.hits += 1
+        print(f"意味キャッシュに一致しました（類似度 {similarity:.3f}）: 「{query}」≒「{index.entries[row]['query']}」")
+        return index.entries[row]["answer"], vector
+
+    async def store(self, guild_id: int, query: str, answer: str, vector=None):
+        """質問と回答を保存する（lookupが返したベクトルがあれば、それを使う）"""
+        text = self.normalize(query)
+        if not text or not answer:
+            return
+        try:
+            if vector is None:
+                vector = await self._embed(text)
+            index = await self._get_index(guild_id, len(vector))
+        except Exception as e:
+            print(f"意味キャッシュへの保存中にエラーが発生しました: {e!r}")
+            return
+
+        now = time.time()
+        removed = []
+        row, similarity = index.search(vector, now, self.ttl)
+        if row >= 0 and similarity >= self.threshold:
+            removed.append(index.remove(row))  # ほぼ同じ質問は新しい回答で置き換える
+        entry = {"id": uuid.uuid4().hex, "query": query, "answer": answer}
+        index.add(vector, entry, now)
+        removed.extend(index.evict(now, self.ttl, self.max_entries))
+        self._save_entry(guild_id, entry, vector, now)
+        self._delete_entries(guild_id, removed)
+
+    def _namespace(self, guild_id: int) -> str:
+        return f"{self.NAMESPACE}:{guild_id}"
+
+    def _save_entry(self, guild_id: int, entry: Dict[str, str], vector, created_at: float):
+        """追加した1件のメタデータとベクトル（バイト列）を書き込む（書き込みはバッチでまとめて行われる）"""
+        namespace = self._namespace(guild_id)
+        meta = dict(entry, embedder=self.embedder.name, dim=int(len(vector)), created_at=created_at)
+        self.state_store.set(namespace, f"{entry['id']}:meta", meta, ttl=self.ttl)
+        self.state_store.set(namespace, f"{entry['id']}:vector", vector.astype("float32").tobytes(), ttl=self.ttl)
+
+    def _delete_entries(self, guild_id: int, entries: List[Dict[str, str]]):
+        namespace = self._namespace(guild_id)
+        for entry in entries:
+            self.state_store.delete(namespace, f"{entry['id']}:meta")
+            self.state_store.delete(namespace, f"{entry['id']}:vector")
+
+    async def _load(self, guild_id: int, dim: int) -> _GuildIndex:
+        """状態ストアから索引を読み込む（埋め込みの種類・次元が異なるエントリは削除する）"""
+        import numpy as np
+
+        stored = await self.state_store.load_namespace(self._namespace(guild_id))
+        index = _GuildIndex(dim)
+        stale = []
+        for key, meta in stored.items():
+            if not key.endswith(":meta"):
+                continue
+            entry = {"id": meta["id"], "query": meta["query"], "answer": meta["answer"]}
+            data = stored.get(f"{meta['id']}:vector")
+            if data is None or meta.get("embedder") != self.embedder.name or meta.get("dim") != dim:
+                stale.append(entry)
+                continue
+            vector = np.frombuffer(data, dtype=np.float32)
+            index.add(vector, entry, meta["created_at"], created_at=meta["created_at"])
+        stale.extend(index.evict(time.time(), self.ttl, self.max_entries))
+        self._delete_entries(guild_id, stale)
+        return index
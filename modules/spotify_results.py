@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+from utils.state_store import StateStore
+
+class TrackRecord:
+    """ボタンの処理に必要な項目だけを持つ曲の情報（Spotify APIの応答全体は保持しない）"""
+
+    __slots__ = ("track_id", "title", "artists", "url")
+
+    def __init__(self, track_id: str, title: str, artists: str, url: str):
+        self.track_id = track_id
+        self.title = title
+        self.artists = artists
+        self.url = url
+
+    @classmethod
+    def from_api(cls, track: Dict[str, Any]) -> "TrackRecord":
+        """Spotify APIの曲の情報から作る"""
+        return cls(
+            track_id=track.get("id") or "",
+            title=track["name"],
+            artists=", ".join(artist["name"] for artist in track["artists"]),
+            url=track["external_urls"]["spotify"],
+        )
+
+    def to_list(self) -> List[str]:
+        return [self.track_id, self.title, self.artists, self.url]
+
+
+class SearchResult:
+    """1件の検索結果メッセージに対応する状態"""
+
+    __slots__ = ("tracks", "visible_to_others")
+
+    def __init__(self, tracks: Sequence[TrackRecord], visible_to_others: bool):
+        self.tracks = tuple(tracks)
+        self.visible_to_others = visible_to_others
+
+
+class SpotifyResultStore:
+    """検索結果をメッセージIDごとに保持するストア
+
+    メモリ上には最近の max_messages 件だけを保持し、状態ストアにも書き込むことで、
+    再起動後や古いメッセージのボタンが押された場合も状態を復元できるようにする。
+    """
+
+    NAMESPACE = "spotify_results"
+
+    def __init__(self, state_store: Optional[StateStore] = None, max_messages: int = 1000, ttl: float = 7 * 24 * 3600):
+        """
+        Args:
+            state_store: 検索結果を保存する状態ストア（Noneならメモリ上だけに保持する）
+            max_messages: メモリ上に保持する検索結果の上限
+            ttl: 状態ストアに保存した検索結果の有効期間（秒）
+        """
+        self.state_store = state_store
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self._results: "OrderedDict[int, SearchResult]" = OrderedDict()
+
+    def _remember(self, message_id: int, result: SearchResult):
+        self._results[message_id] = result
+        self._results.move_to_end(message_id)
+        while len(self._results) > self.max_messages:
+            self._results.popitem(last=False)
+
+    def put(self, message_id: int, tracks: Sequence[TrackRecord], visible_to_others: bool):
+        result = SearchResult(tracks, visible_to_others)
+        self._remember(message_id, result)
+        if self.state_store:
+            value = {"visible": visible_to_others, "tracks": [track.to_list() for track in result.tracks]}
+            self.state_store.set(self.NAMESPACE, str(message_id), value, ttl=self.ttl)
+
+    async def get(self, message_id: int) -> Optional[SearchResult]:
+        result = self._results.get(message_id)
+        if result is not None:
+            self._results.move_to_end(message_id)
+            return result
+        if not self.state_store:
+            return None
+
+        value = await self.state_store.get(self.NAMESPACE, str(message_id))
+        if not value:
+            return None
+        result = SearchResult([TrackRecord(*fields) for fields in value["tracks"]], value["visible"])
+        self._remember(message_id, result)
+        return result
+
+    def __len__(self) -> int:
+        return len(self._results)
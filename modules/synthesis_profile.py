@@ -0,0 +1,63 @@
+from typing import Any, Dict, NamedTuple
+from modules.audio_sources import FRAME_SIZE
+
+# Discordの再生形式（48kHz・ステレオ・16bit）。VOICEVOX側でこの形式を出力させ、再生時の変換をなくす
+OUTPUT_SAMPLING_RATE = 48000
+OUTPUT_STEREO = True
+_BYTES_PER_SAMPLE_FRAME = 4  # ステレオ・16bitの1サンプル分
+
+class SynthesisProfile(NamedTuple):
+    """読み上げの速さと間の取り方をまとめた合成設定"""
+
+    name: str
+    speed_scale: float  # 話速
+    pre_phoneme_length: float  # 音声の前の無音（秒）
+    post_phoneme_length: float  # 音声の後の無音（秒）
+    pause_length_scale: float  # 句読点などの間の長さの倍率
+    segment_gap: float  # セグメント間の間隔（秒）
+    trim_silence: bool = False  # 合成した音声の前後に残る無音を取り除くか
+
+    @classmethod
+    def from_config(cls, name: str, settings: Dict[str, Any]) -> "SynthesisProfile":
+        return cls(name=name, **settings)
+
+    def apply(self, audio_query):
+        """AudioQueryに話速・無音の長さと、再生形式に合わせた出力形式を設定する"""
+        audio_query.speed_scale = self.speed_scale
+        audio_query.pre_phoneme_length = self.pre_phoneme_length
+        audio_query.post_phoneme_length = self.post_phoneme_length
+        audio_query.pause_length_scale = self.pause_length_scale
+        audio_query.output_sampling_rate = OUTPUT_SAMPLING_RATE
+        audio_query.output_stereo = OUTPUT_STEREO
+        return audio_query
+
+
+def load_profiles(config: Dict[str, Dict[str, Any]]) -> Dict[str, SynthesisProfile]:
+    """config.pyの SYNTHESIS_PROFILES から名前ごとの合成設定を作る"""
+    return {name: SynthesisProfile.from_config(name, settings) for name, settings in config.items()}
+
+
+def trim_silence(pcm_data: bytes, threshold: int = 256, margin_seconds: float = 0.02) -> bytes:
+    """48kHz・ステレオ・16bitのPCMから、前後の振幅が threshold 以下の区間を取り除く
+
+    語頭・語尾が切れないよう margin_seconds 分は残す。全体が無音の場合はそのまま返す。
+    """
+    import numpy as np
+
+    samples = np.frombuffer(pcm_data, dtype="<i2")
+    if samples.size == 0:
+        return pcm_data
+    # 左右どちらかのチャンネルが閾値を超えるサンプル位置
+    loud = np.flatnonzero(np.abs(samples.reshape(-1, 2).astype(np.int32)).max(axis=1) > threshold)
+    if loud.size == 0:
+        return pcm_data
+
+    margin = int(margin_seconds * OUTPUT_SAMPLING_RATE)
+    start = max(0, int(loud[0]) - margin)
+    stop = min(samples.size // 2, int(loud[-1]) + 1 + margin)
+    return pcm_data[start * _BYTES_PER_SAMPLE_FRAME:stop * _BYTES_PER_SAMPLE_FRAME]
+
+
+def pcm_seconds(pcm_data: bytes) -> float:
+    """48kHz・ステレオ・16bitのPCMの再生時間（秒）"""
+    return len(pcm_data) / (FRAME_SIZE * 50)
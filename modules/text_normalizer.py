@@ -0,0 +1,100 @@
+import re
+import unicodedata
+
+class TextNormalizer:
+    """音声合成前にテキストを読み上げやすい形に整形するクラス"""
+
+    # コードブロック・インラインコード・URL
+    CODE_BLOCK_PATTERN = re.compile(r'```.*?(?:```|$)', re.DOTALL)
+    INLINE_CODE_PATTERN = re.compile(r'`[^`\n]+`')
+    URL_PATTERN = re.compile(r'https?://[^\s<>()（）「」]+')
+    # Discordのメンション・カスタム絵文字（<:name:id>, <@123> など）
+    DISCORD_TOKEN_PATTERN = re.compile(r'<a?:\w+:\d+>|<[@#][!&]?\d+>')
+    # Markdownの装飾記号（見出し・引用・箇条書き・強調・表）
+    MARKDOWN_LINE_PATTERN = re.compile(r'^\s*[-|: ]{3,}\s*$|^\s{0,3}(?:#{1,6}|>|[-*+])\s+', re.MULTILINE)
+    MARKDOWN_INLINE_PATTERN = re.compile(r'\*\*|__|~~|\|\||\|')
+    # 絵文字1つ分（肌の色・異体字セレクタ・ZWJ結合を含む）と、その連続
+    _EMOJI = r'[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF]'
+    _EMOJI_MODIFIERS = r'[\uFE0F\u20E3\U0001F3FB-\U0001F3FF\U000E0020-\U000E007F]*'
+    _EMOJI_CLUSTER = f'{_EMOJI}{_EMOJI_MODIFIERS}(?:\u200D{_EMOJI}{_EMOJI_MODIFIERS})*'
+    EMOJI_RUN_PATTERN = re.compile(f'({_EMOJI_CLUSTER})(?:\\s*{_EMOJI_CLUSTER})+')
+    # カンマ区切りを含む数値（小数を含む）。1.2.3 のようなバージョン番号は先に一致させてそのまま残す
+    NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+){2,}|\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?')
+
+    # 読み上げ用の置き換え文言
+    CODE_PLACEHOLDER = "コードは省略します。"
+    INLINE_CODE_PLACEHOLDER = "コード"
+    URL_PLACEHOLDER = "リンク"
+
+    # これ以上長い整数は桁ごとの読み上げになるため、まとめて置き換える
+    MAX_NUMBER_DIGITS = 16
+    LONG_NUMBER_PLACEHOLDER = "長い数字"
+
+    _DIGITS = "〇一二三四五六七八九"
+    _SMALL_UNITS = ["", "十", "百", "千"]
+    _LARGE_UNITS = ["", "万", "億", "兆"]
+
+    def normalize(self, text: str) -> str:
+        """読み上げ不要な要素を置き換え、数値や絵文字を整形したテキストを返す"""
+        if not text:
+            return ""
+
+        text = unicodedata.normalize("NFKC", text)
+        text = self.CODE_BLOCK_PATTERN.sub(f" {self.CODE_PLACEHOLDER} ", text)
+        text = self.INLINE_CODE_PATTERN.sub(self.INLINE_CODE_PLACEHOLDER, text)
+        text = self.URL_PATTERN.sub(self.URL_PLACEHOLDER, text)
+        text = self.DISCORD_TOKEN_PATTERN.sub("", text)
+        text = self.MARKDOWN_LINE_PATTERN.sub("", text)
+        text = self.MARKDOWN_INLINE_PATTERN.sub(" ", text)
+        text = self._collapse_emoji(text)
+        text = self.NUMBER_PATTERN.sub(self._expand_number_match, text)
+
+        # 連続する空白を1つにまとめる
+        return re.sub(r'\s+', ' ', text).strip()
+
+    def _collapse_emoji(self, text: str) -> str:
+        """連続する絵文字を先頭の1つにまとめる"""
+        return self.EMOJI_RUN_PATTERN.sub(r'\1', text)
+
+    def _expand_number_match(self, match: re.Match) -> str:
+        number = match.group(0).replace(",", "")
+        if number.count(".") >= 2:
+            return match.group(0)  # バージョン番号などは数値として読まない
+        integer_part, _, decimal_part = number.partition(".")
+        if len(integer_part) > self.MAX_NUMBER_DIGITS:
+            return self.LONG_NUMBER_PLACEHOLDER
+
+        if len(integer_part) > 1 and integer_part.startswith("0"):
+            # 007 や 0120 のようなゼロ埋めの番号は1桁ずつ読む
+            spoken = "".join(self._DIGITS[int(d)] for d in integer_part)
+        else:
+            spoken = self.integer_to_kanji(int(integer_part))
+        if decimal_part:
+            spoken += "点" + "".join(self._DIGITS[int(d)] for d in decimal_part)
+        return spoken
+
+    @classmethod
+    def integer_to_kanji(cls, value: int) -> str:
+        """整数を漢数字表記に変換する（例: 12345 -> 一万二千三百四十五）"""
+        if value == 0:
+            return "零"
+
+        parts = []
+        for large_index in range(len(cls._LARGE_UNITS)):
+            chunk = value % 10000
+            value //= 10000
+            if chunk:
+                chunk_text = ""
+                for small_index in range(3, -1, -1):
+                    digit = (chunk // (10 ** small_index)) % 10
+                    if not digit:
+                        continue
+                    # 「一十」「一百」「一千」は「十」「百」「千」と読む
+                    if digit == 1 and small_index > 0:
+                        chunk_text += cls._SMALL_UNITS[small_index]
+                    else:
+                        chunk_text += cls._DIGITS[digit] + cls._SMALL_UNITS[small_index]
+                parts.append(chunk_text + cls._LARGE_UNITS[large_index])
+            if not value:
+                break
+        return "".join(reversed(parts))
@@ -0,0 +1,34 @@
+import re
+from typing import Dict, Optional
+
+# 英数字はおおよそ4文字で1トークン、日本語などは1文字で約1トークンになる
+_ASCII_PATTERN = re.compile(r'[\x00-\x7f]')
+
+def estimate_tokens(text: str) -> int:
+    """APIを呼ばずにトークン数を推定する（日本語が多いため、やや多めに見積もる）"""
+    if not text:
+        return 0
+    ascii_chars = len(_ASCII_PATTERN.findall(text))
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+class TokenUsageTracker:
+    """ギルドごとのGemini入力・出力トークン数を集計するクラス"""
+
+    def __init__(self):
+        self._totals: Dict[Optional[int], Dict[str, int]] = {}
+
+    def record(self, guild_id: Optional[int], command: str, input_tokens: int, output_tokens: int):
+        """1回分のリクエストのトークン数を加算してログに出力する"""
+        totals = self._totals.setdefault(guild_id, {"input": 0, "output": 0, "requests": 0})
+        totals["input"] += input_tokens
+        totals["output"] += output_tokens
+        totals["requests"] += 1
+        print(
+            f"Geminiトークン使用量 (ギルド: {guild_id}, コマンド: {command}): "
+            f"入力 {input_tokens} / 出力 {output_tokens} "
+            f"(累計 入力 {totals['input']} / 出力 {totals['output']} / {totals['requests']}回)"
+        )
+
+    def get_totals(self, guild_id: Optional[int]) -> Dict[str, int]:
+        return dict(self._totals.get(guild_id, {"input": 0, "output": 0, "requests": 0}))
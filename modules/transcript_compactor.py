@@ -0,0 +1,109 @@
+import re
+from typing import Iterable, List, Mapping
+from modules.token_accounting import estimate_tokens
+
+class TranscriptCompactor:
+    """YouTube字幕をGeminiに送る前に短くするクラス
+
+    字幕の行ごとの時刻を一定間隔の目印にまとめ、連続して重複した行・効果音の表記・つなぎ言葉を取り除く。
+    それでもトークンの上限を超える場合は、動画全体を均等に残すよう各区間の後半を省略する。
+    """
+
+    # 字幕に付く既知の効果音表記（[音楽] [拍手] [Music] (笑) など）。それ以外の括弧書きは本文として残す
+    CAPTION_TAGS = ("音楽", "拍手", "笑", "笑い", "笑い声", "歓声", "効果音", "BGM", "Music", "Applause", "Laughter", "Cheering")
+    SOUND_TAG_PATTERN = re.compile(
+        r'[\[［(（]\s*(?:' + "|".join(map(re.escape, CAPTION_TAGS)) + r')\s*[\]］)）]', re.IGNORECASE
+    )
+    # 行頭に付いた時刻（"0:12 ..." "01:02:03 ..."）。本文中の「12:30に集合」などは残す
+    TIMESTAMP_PATTERN = re.compile(r'^\s*\d{1,2}:\d{2}(?::\d{2})?(?=\s|$)')
+    # 意味を持たないつなぎ言葉（文の区切りに単独で現れるものだけ）
+    FILLER_PATTERN = re.compile(
+        r'(?:(?<=^)|(?<=[\s、。,.!?！？]))'
+        r'(?:え[えー〜]*っと|え[ー〜]+|あ[ー〜]+|あの[ー〜]+|うー+ん|ま[ー〜]+|um+|uh+|erm*)'
+        r'(?:[、,…\s]+|(?=[。.!?！？])|$)',
+        re.IGNORECASE,
+    )
+    OMITTED_MARK = "…（中略）"
+
+    def __init__(self, timestamp_interval: float = 300):
+        """
+        Args:
+            timestamp_interval: 時刻の目印を入れる間隔（秒）
+        """
+        self.timestamp_interval = timestamp_interval
+
+    def compact(self, entries: Iterable[Mapping], max_tokens: int | None = None) -> str:
+        """字幕（text・startを持つ要素の並び）を短いテキストにする"""
+        sections = self._build_sections(entries)
+        if max_tokens is not None:
+            sections = self._fit_to_budget(sections, max_tokens)
+        return "\n".join(
+            f"[{self._format_time(start)}] {' '.join(lines)}" for start, lines in sections if lines
+        )
+
+    def clean_line(self, text: str) -> str:
+        """1行分の字幕から効果音表記・時刻・つなぎ言葉を取り除く"""
+        text = self.SOUND_TAG_PATTERN.sub(" ", text)
+        text = self.TIMESTAMP_PATTERN.sub(" ", text)
+        text = self.FILLER_PATTERN.sub("", text)
+        return re.sub(r'\s+', ' ', text).strip(" 、,")
+
+    def _build_sections(self, entries: Iterable[Mapping]) -> List[tuple]:
+        """字幕を時刻の目印ごとの区間にまとめる（区間の開始時刻, 行のリスト）"""
+        sections = []
+        previous = ""
+        next_marker = 0.0
+        for entry in entries:
+            text = self.clean_line(str(entry.get("text", "")))
+            if not text:
+                continue
+
+            # 自動字幕は前の行を繰り返してから続きを表示するため、前の行と重なった部分を取り除く
+            # （「はい」「うん」など短い相づちが繰り返されることもあるため、完全に同じ連続行以外は残す）
+            if text == previous:
+                continue
+            if previous and text.startswith(previous):
+                text = text[len(previous):].strip()
+                if not text:
+                    continue
+            previous = text
+
+            start = float(entry.get("start", 0.0))
+            if not sections or start >= next_marker:
+                sections.append((start, []))
+                next_marker = (start // self.timestamp_interval + 1) * self.timestamp_interval
+            sections[-1][1].append(text)
+        return sections
+
+    def _fit_to_budget(self, sections: List[tuple], max_tokens: int) -> List[tuple]:
+        """上限を超える場合、各区間を同じ割合で先頭から残して動画全体を網羅する"""
+        section_tokens = [sum(estimate_tokens(line) + 1 for line in lines) + 4 for _, lines in sections]
+        total = sum(section_tokens)
+        if total <= max_tokens:
+            return sections
+
+        ratio = max_tokens / total
+        fitted = []
+        for (start, lines), tokens in zip(sections, section_tokens):
+            allowance = tokens * ratio - 4
+            kept = []
+            used = 0
+            for line in lines:
+                cost = estimate_tokens(line) + 1
+                if used + cost > allowance:
+                    break
+                kept.append(line)
+                used += cost
+            if len(kept) < len(lines):
+                kept.append(self.OMITTED_MARK)
+            fitted.append((start, kept))
+        return fitted
+
+    @staticmethod
+    def _format_time(seconds: float) -> str:
+        seconds = int(seconds)
+        hours, remainder = divmod(seconds, 3600)
+        minutes, secs = divmod(remainder, 60)
+        if hours:
+            return f"{hours}:{minutes:02d}:{secs:02d}"
+        return f"{minutes}:{secs:02d}"
@@ -0,0 +1,111 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+# (成功したか, 圧縮した字幕またはエラーメッセージ)
+TranscriptResult = Tuple[bool, str]
+
+class TranscriptCache:
+    """動画IDごとの字幕の取得結果を保持するLRUキャッシュ（合計サイズと有効期間で制限する）"""
+
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024, ttl: float = 3600.0):
+        """
+        Args:
+            max_bytes: 保持する字幕の合計サイズの上限（UTF-8のバイト数）
+            ttl: 取得結果の有効期間（秒）
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[TranscriptResult, float, int]]" = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, video_id: str) -> Optional[TranscriptResult]:
+        entry = self._entries.get(video_id)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            if entry is not None:
+                self._pop(video_id)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(video_id)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, video_id: str, result: TranscriptResult):
+        size = len(result[1].encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._pop(video_id)
+        self._entries[video_id] = (result, time.monotonic(), size)
+        self._total_bytes += size
+        # 上限を超えた分は古いものから削除する
+        while self._total_bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._total_bytes -= evicted_size
+
+    def _pop(self, video_id: str):
+        entry = self._entries.pop(video_id, None)
+        if entry is not None:
+            self._total_bytes -= entry[2]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TranscriptPrefetcher:
+    """YouTubeのリンクが投稿された時点で、字幕をバックグラウンドで取得しておくクラス
+
+    同時に取得する数と待機中の件数に上限を設け、取得中の動画が要約された場合はその取得の完了を待つ。
+    """
+
+    def __init__(self, fetch: Callable[[str], Awaitable[TranscriptResult]], cache: TranscriptCache,
+                 max_concurrency: int = 2, max_pending: int = 20):
+        """
+        Args:
+            fetch: 動画IDから字幕を取得するコルーチン関数（一時的な失敗は例外を送出し、その結果はキャッシュしない）
+            cache: 取得結果を保存するキャッシュ
+            max_concurrency: 同時に取得する数
+            max_pending: 取得中・待機中の件数の上限（超えた分は先読みしない）
+        """
+        self.fetch = fetch
+        self.cache = cache
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.prefetched = 0
+        self.dropped = 0
+
+    def schedule(self, video_id: str) -> bool:
+        """字幕の先読みを予約する（キャッシュ済み・取得中・上限超過の場合はFalse）"""
+        if video_id in self._inflight or self.cache.get(video_id) is not None:
+            return False
+        if len(self._inflight) >= self.max_pending:
+            self.dropped += 1
+            return False
+        task = asyncio.create_task(self._prefetch(video_id))
+        self._inflight[video_id] = task
+        task.add_done_callback(lambda _: self._inflight.pop(video_id, None))
+        return True
+
+    async def _prefetch(self, video_id: str) -> Optional[TranscriptResult]:
+        async with self._semaphore:
+            try:
+                result = await self.fetch(video_id)
+            except Exception as e:
+                print(f"字幕の先読み中にエラーが発生しました（動画ID: {video_id}）: {e}")
+                return None
+        self.cache.put(video_id, result)
+        self.prefetched += 1
+        return result
+
+    async def get(self, video_id: str) -> Optional[TranscriptResult]:
+        """キャッシュ済み、または取得中の字幕があれば返す（なければNone）"""
+        result = self.cache.get(video_id)
+        if result is not None:
+            return result
+        task = self._inflight.get(video_id)
+        if task is None:
+            return None
+        return await asyncio.shield(task)
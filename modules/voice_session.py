@@ -0,0 +1,143 @@
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+import discord
+from utils.metrics import metrics
+
+class VoiceConnectError(Exception):
+    """再試行してもボイスチャンネルに接続できなかった"""
+
+
+class VoiceSessionManager:
+    """ギルドごとのボイス接続を管理するクラス
+
+    接続はタイムアウト付きで再試行し、既存の接続があれば再利用・移動する。
+    通信の瞬断からの復帰は discord.py（reconnect=True）に任せ、キックやチャンネル削除など
+    外部から切断された場合は再接続しない。
+    接続にかかった時間はリージョンごとに "voice.connect.{リージョン}" として記録する。
+    """
+
+    def __init__(self, connect_timeout: float = 10.0, connect_attempts: int = 3, retry_backoff: float = 1.0,
+                 reconnect_wait: float = 15.0):
+        """
+        Args:
+            connect_timeout: 1回の接続（ハンドシェイク）の待ち時間の上限（秒）
+            connect_attempts: 接続を試みる回数
+            retry_backoff: 再試行までの待ち時間（秒。試行回数に比例して伸ばす）
+            reconnect_wait: 読み上げ中に discord.py が再接続している場合に、復帰を待つ時間の上限（秒）
+        """
+        self.connect_timeout = connect_timeout
+        self.connect_attempts = connect_attempts
+        self.retry_backoff = retry_backoff
+        self.reconnect_wait = reconnect_wait
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._channels: Dict[int, int] = {}  # ギルドID -> 接続しているべきチャンネルID
+
+    def _get_lock(self, guild_id: int) -> asyncio.Lock:
+        lock = self._locks.get(guild_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[guild_id] = lock
+        return lock
+
+    @staticmethod
+    def region_of(channel) -> str:
+        """チャンネルのボイスリージョン（自動選択の場合は "auto"）"""
+        return getattr(channel, "rtc_region", None) or "auto"
+
+    async def join(self, channel) -> Tuple[discord.VoiceClient, str]:
+        """チャンネルに接続し、(ボイスクライアント, "connected" / "moved" / "already") を返す
+
+        Raises:
+            VoiceConnectError: 再試行しても接続できなかった場合
+        """
+        guild = channel.guild
+        async with self._get_lock(guild.id):
+            self._channels[guild.id] = channel.id
+            voice_client = guild.voice_client
+            if voice_client and voice_client.is_connected():
+                if voice_client.channel and voice_client.channel.id == channel.id:
+                    return voice_client, "already"
+                try:
+                    await asyncio.wait_for(voice_client.move_to(channel), timeout=self.connect_timeout)
+                    return voice_client, "moved"
+                except (asyncio.TimeoutError, discord.DiscordException) as e:
+                    # 移動できなければ接続し直す
+                    print(f"{channel.name} への移動に失敗したため、接続し直します: {e!r}")
+                    await voice_client.disconnect(force=True)
+            try:
+                return await self._connect(channel), "connected"
+            except VoiceConnectError:
+                self.release(guild.id)
+                raise
+
+    async def _connect(self, channel) -> discord.VoiceClient:
+        """タイムアウト付きで接続を試み、失敗したら間隔を空けて再試行する（ロックを取得した状態で呼び出す）"""
+        guild = channel.guild
+        region = self.region_of(channel)
+        last_error: Optional[BaseException] = None
+        for attempt in range(1, self.connect_attempts + 1):
+            # 再接続中のまま残っている接続は破棄してから接続する
+            stale = guild.voice_client
+            if stale and not stale.is_connected():
+                await stale.disconnect(force=True)
+
+            started = time.perf_counter()
+            try:
+                voice_client = await channel.connect(timeout=self.connect_timeout, reconnect=True)
+            except (asyncio.TimeoutError, discord.DiscordException, OSError) as e:
+                last_error = e
+                metrics.observe(f"voice.connect_failed.{region}", time.perf_counter() - started)
+                print(f"{channel.name} への接続に失敗しました（{attempt}/{self.connect_attempts}回目, リージョン: {region}）: {e!r}")
+                if attempt < self.connect_attempts:
+                    await asyncio.sleep(self.retry_backoff * attempt)
+                continue
+
+            elapsed = time.perf_counter() - started
+            metrics.observe(f"voice.connect.{region}", elapsed)
+            print(f"{channel.name} に接続しました（{elapsed:.2f}秒, リージョン: {region}）")
+            return voice_client
+
+        raise VoiceConnectError(f"{channel.name} に接続できませんでした: {last_error!r}")
+
+    def release(self, guild_id: int):
+        """接続しているべきギルドから外す（/leave・自動切断・停止処理の前に呼び出し、読み上げが復帰を待たないようにする）"""
+        self._channels.pop(guild_id, None)
+
+    async def leave(self, guild) -> bool:
+        """ボイスチャンネルから切断する（接続していなければFalse）"""
+        self.release(guild.id)
+        voice_client = guild.voice_client
+        if not voice_client:
+            return False
+        await voice_client.disconnect()
+        return True
+
+    def on_moved(self, guild_id: int, channel_id: int):
+        """Bot自身が別のチャンネルに移動した（移動先を再接続先にする）"""
+        if guild_id in self._channels:
+            self._channels[guild_id] = channel_id
+
+    def on_disconnected(self, guild):
+        """Bot自身がボイスチャンネルから切断された（キック・チャンネル削除を含め、再接続はしない）"""
+        if guild.id in self._channels:
+            print(f"ボイスチャンネルから切断されました（ギルド: {guild.id}）。自動での再接続は行いません。")
+        self.release(guild.id)
+
+    async def wait_until_connected(self, guild, timeout: Optional[float] = None) -> Optional[discord.VoiceClient]:
+        """discord.py が再接続している間は、接続が戻るまで待ってボイスクライアントを返す
+
+        ボイスクライアントが残っていない（切断済み）場合や、接続しているべきでない場合、
+        timeout 秒以内に戻らなかった場合はNoneを返す。
+        """
+        voice_client = guild.voice_client
+        if voice_client is None or guild.id not in self._channels:
+            return None
+        if voice_client.is_connected():
+            return voice_client
+        # VoiceClient.wait_until_connected はスレッドをブロックするため、イベントループの外で待つ
+        connected = await asyncio.to_thread(voice_client.wait_until_connected,
+                                            self.reconnect_wait if timeout is None else timeout)
+        if not connected or guild.voice_client is not voice_client:
+            return None
+        return voice_client
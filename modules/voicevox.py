@@ -1,10 +1,38 @@
-from voicevox_core.asyncio import Onnxruntime, OpenJtalk, Synthesizer, VoiceModelFile
 import os
 import io
+import json
+import time
+import wave
+import asyncio
 import discord
 import traceback
+from typing import AsyncIterator
+from modules.text_normalizer import TextNormalizer
+from modules.audio_sources import OpusPacketAudio, PCMBufferAudio, StreamingPCMAudio, encode_opus_packets, opus_available
+from modules.audio_cache import OpusPacketCache
+from modules.audio_mixer import MixerTrack, VoiceMixer, PRIORITY_READOUT
+from modules.synthesis_profile import OUTPUT_SAMPLING_RATE, SynthesisProfile, load_profiles, trim_silence
+from config import (
+    MIXER_DUCK_GAIN,
+    OPUS_CACHE_MAX_BYTES,
+    READING_DICT_CHECK_INTERVAL,
+    SYNTHESIS_DEFAULT_PROFILE,
+    SYNTHESIS_PROFILES,
+    SYNTHESIS_SILENCE_THRESHOLD,
+    VOICE_MAX_SPEECH_SECONDS,
+    VOICEVOX_STREAMING,
+    VOICEVOX_STREAM_CHUNK_FRAMES,
+    VOICEVOX_STREAM_FIRST_CHUNK_FRAMES,
+)
 
 class VoiceVoxHandler:
+    # 読み上げの打ち切り位置として扱う文末記号
+    SENTENCE_ENDINGS = ("。", "！", "？", "!", "?", ".")
+    # Discordの再生形式に合わせたサンプリングレート
+    PCM_SAMPLING_RATE = OUTPUT_SAMPLING_RATE
+    # 合成プロファイルを選択しているかどうかのギルド設定
+    PROFILE_SETTING = "synthesis_profile"
+
     def __init__(self):
         self.synthesizer = None
         # 環境変数から設定を読み込む（検証付き）
@@ -16,10 +44,29 @@ class VoiceVoxHandler:
         except (ValueError, TypeError):
             print("警告: VOICEVOX_STYLE_IDが無効な値です。デフォルト値8を使用します。")
             self.style_id = 8
+
+        # 読み上げ前処理と読み辞書（ユーザー辞書）の設定
+        self.text_normalizer = TextNormalizer()
+        self.open_jtalk = None
+        self.reading_dict_path = os.getenv("VOICEVOX_READING_DICT_PATH", "/app/voicevox_files/reading_dict.json")
+        self._reading_dict_mtime = None  # 最後に適用した辞書ファイルの更新時刻
+        self._reading_dict_checked_at = 0.0
+        self._reading_dict_lock = asyncio.Lock()
+        self._background_tasks = set()  # 実行中のストリーミング合成・エンコードのタスク
+        self.opus_cache = OpusPacketCache(max_bytes=OPUS_CACHE_MAX_BYTES)
+        self._opus_available = None  # libopusが使えるか（最初にキャッシュするときに一度だけ確認する）
+        self.mixer = VoiceMixer(duck_gain=MIXER_DUCK_GAIN)
+        self.voice_sessions = None  # VoiceSessionManager（設定されていれば、discord.pyの再接続中は復帰を待って読み上げを続ける）
+        self.state_store = None  # StateStore（設定されていれば、ギルドごとに選択した合成プロファイルを使う）
+        self.profiles = load_profiles(SYNTHESIS_PROFILES)
+        self.default_profile = self.profiles[SYNTHESIS_DEFAULT_PROFILE]
     
     async def initialize(self):
         """VoiceVox Synthesizerを初期化する"""
         try:
+            # voicevox_coreは読み込みに時間がかかるため、ゲートウェイ接続後の初期化時に読み込む
+            from voicevox_core.asyncio import Onnxruntime, OpenJtalk, Synthesizer, VoiceModelFile
+
             # Dockerfileでコピーされた固定パスを使用
             open_jtalk_dict_dir = "/app/voicevox_files/open_jtalk_dic"
             print(f"Open JTalk辞書を {open_jtalk_dict_dir} から読み込みます。")
@@ -37,11 +84,15 @@ class VoiceVoxHandler:
             try:
                 print("OpenJTalkを初期化します...")
                 ojt = await OpenJtalk.new(open_jtalk_dict_dir)
+                self.open_jtalk = ojt
                 print("OpenJTalkの初期化に成功しました")
             except Exception as e:
                 print(f"OpenJTalkの初期化に失敗しました: {e}")
                 raise
-                
+
+            # 読み辞書があればSynthesizer作成前にOpenJTalkへ適用する
+            await self._refresh_reading_dict(force=True)
+
             # Synthesizerの作成
             self.synthesizer = Synthesizer(ort, ojt)
             
@@ -63,23 +114,174 @@ class VoiceVoxHandler:
             self.synthesizer = None
             return False
     
-    async def synthesize_voice(self, text: str) -> bytes | None:
-        """VOICEVOXを使用してテキストから音声データを生成する"""
+    def _load_reading_dict_words(self) -> list:
+        """読み辞書ファイル（JSON）からユーザー辞書の単語リストを作成する
+
+        形式: {"表記": "ヨミ"} または {"表記": {"pronunciation": "ヨミ", "accent_type": 1}}
+        """
+        from voicevox_core import UserDictWord
+
+        with open(self.reading_dict_path, encoding="utf-8") as f:
+            entries = json.load(f)
+
+        words = []
+        for surface, entry in entries.items():
+            if isinstance(entry, str):
+                entry = {"pronunciation": entry}
+            try:
+                words.append(UserDictWord(
+                    surface=surface,
+                    pronunciation=entry["pronunciation"],
+                    accent_type=int(entry.get("accent_type", 0)),
+                    priority=int(entry.get("priority", 5)),
+                ))
+            except Exception as e:
+                print(f"警告: 読み辞書の単語「{surface}」を読み込めませんでした: {e}")
+        return words
+
+    async def _refresh_reading_dict(self, force: bool = False):
+        """読み辞書ファイルが更新されていれば再コンパイルしてOpenJTalkに適用する"""
+        if not self.open_jtalk:
+            return
+
+        now = time.monotonic()
+        if not force and now - self._reading_dict_checked_at < READING_DICT_CHECK_INTERVAL:
+            return
+        self._reading_dict_checked_at = now
+
+        try:
+            mtime = os.path.getmtime(self.reading_dict_path)
+        except OSError:
+            return  # 辞書ファイルがなければ何もしない
+
+        if mtime == self._reading_dict_mtime:
+            return
+
+        async with self._reading_dict_lock:
+            if mtime == self._reading_dict_mtime:
+                return
+            try:
+                from voicevox_core.asyncio import UserDict
+
+                words = await asyncio.to_thread(self._load_reading_dict_words)
+                user_dict = UserDict()
+                for word in words:
+                    user_dict.add_word(word)
+                # ユーザー辞書のコンパイルは変更時の一度だけ行い、以降はOpenJTalk側に保持される
+                await self.open_jtalk.use_user_dict(user_dict)
+                self._reading_dict_mtime = mtime
+                print(f"読み辞書 {self.reading_dict_path} を適用しました（{len(words)}語）。")
+            except Exception as e:
+                # 壊れた辞書で再試行し続けないよう、更新時刻は記録しておく
+                self._reading_dict_mtime = mtime
+                print(f"読み辞書の適用中にエラーが発生しました: {e}")
+
+    def profile_for(self, guild_id: int | None) -> SynthesisProfile:
+        """ギルドで選択されている合成プロファイル（未選択・不明な名前なら既定のプロファイル）"""
+        if guild_id is None or not self.state_store:
+            return self.default_profile
+        name = self.state_store.get_guild_setting(guild_id, self.PROFILE_SETTING)
+        return self.profiles.get(name, self.default_profile)
+
+    async def create_audio_query(self, text: str, profile: SynthesisProfile | None = None):
+        """テキストを整形してAudioQueryを作成し、合成プロファイルを適用する（失敗時はNone）"""
         if not self.synthesizer:
             print("エラー: VOICEVOX Synthesizerが初期化されていません。")
             return None
-        
+
+        # URL・コード・絵文字・数値などを読み上げ用に整形する
+        text = self.text_normalizer.normalize(text)
         if not text:
             print("エラー: 読み上げるテキストが空です。")
             return None
 
         try:
+            await self._refresh_reading_dict()
             # 環境変数から取得した固定のスタイルIDを使用
-            style_id_to_use = self.style_id
-            
-            audio_query = await self.synthesizer.create_audio_query(text, style_id=style_id_to_use)
-            wave_bytes = await self.synthesizer.synthesis(audio_query, style_id_to_use)
+            audio_query = await self.synthesizer.create_audio_query(text, style_id=self.style_id)
+            return (profile or self.default_profile).apply(audio_query)
+        except Exception as e:
+            print(f"VOICEVOX AudioQuery作成エラー: {e}")
+            print(f"Traceback: {traceback.format_exc()}")
+            return None
+
+    @staticmethod
+    def estimate_duration(audio_query) -> float:
+        """AudioQueryのモーラ長から読み上げ時間（秒）を推定する"""
+        total = 0.0
+        for accent_phrase in audio_query.accent_phrases:
+            for mora in accent_phrase.moras:
+                total += (mora.consonant_length or 0.0) + mora.vowel_length
+            if accent_phrase.pause_mora:
+                total += accent_phrase.pause_mora.vowel_length * getattr(audio_query, "pause_length_scale", 1.0)
+
+        speed_scale = audio_query.speed_scale or 1.0
+        return total / speed_scale + audio_query.pre_phoneme_length + audio_query.post_phoneme_length
+
+    def _truncate_to_fit(self, text: str, duration: float, max_seconds: float) -> str:
+        """上限に収まると見込まれる長さまで、文末（なければ読点）で切り詰めた文章を返す"""
+        head = text[:max(1, int(len(text) * max_seconds / duration))]
+        cut = max(head.rfind(ending) for ending in self.SENTENCE_ENDINGS + ("、",))
+        return head[:cut + 1] if cut > 0 else head
+
+    async def plan_speech(self, segments: list, max_seconds: float = VOICE_MAX_SPEECH_SECONDS,
+                          profile: SynthesisProfile | None = None) -> AsyncIterator:
+        """読み上げ時間の上限に収まるセグメントとAudioQueryの組を順に返す非同期ジェネレーター
+
+        文末（。！？など）で終わるセグメントまでAudioQueryを作成した時点で返すため、
+        speak_segmentsは先頭の文を再生しながら残りのAudioQueryを作成できる。
+        上限を超える場合は直前の文末で打ち切り、AudioQueryの作成も止める。
+        まだ何も返していなければ、上限内の部分だけでも読み上げる（先頭のセグメントだけで上限を超える場合は切り詰める）。
+        読み上げ時間は合成プロファイルの話速・無音の長さを反映して推定する。
+        """
+        pending = []  # 文末に達していないセグメント
+        planned_count = 0
+        total_seconds = 0.0
+
+        for segment in segments:
+            audio_query = await self.create_audio_query(segment, profile=profile)
+            if audio_query is None:
+                continue
+
+            duration = self.estimate_duration(audio_query)
+            if total_seconds + duration > max_seconds:
+                if planned_count == 0 and pending:
+                    # 文の途中でも、上限内の部分は読み上げる
+                    for item in pending:
+                        yield item
+                    planned_count = len(pending)
+                elif planned_count == 0:
+                    truncated = self._truncate_to_fit(segment, duration, max_seconds - total_seconds)
+                    truncated_query = await self.create_audio_query(truncated, profile=profile)
+                    if truncated_query is not None:
+                        yield truncated, truncated_query
+                        planned_count = 1
+                print(f"読み上げ時間の上限（{max_seconds:.0f}秒）に達したため、{planned_count}セグメントで打ち切ります。")
+                return
+
+            pending.append((segment, audio_query))
+            total_seconds += duration
+            if segment.rstrip().endswith(self.SENTENCE_ENDINGS):
+                for item in pending:
+                    yield item
+                planned_count += len(pending)
+                pending = []
+
+        for item in pending:
+            yield item
+
+    async def synthesize_voice(self, text: str, audio_query=None) -> bytes | None:
+        """VOICEVOXを使用してテキストから音声データを生成する
 
+        plan_speechなどで作成済みのAudioQueryがあれば、それを使って合成する。
+        """
+        if audio_query is None:
+            audio_query = await self.create_audio_query(text)
+            if audio_query is None:
+                return None
+
+        try:
+            wave_bytes = await self.synthesizer.synthesis(audio_query, self.style_id)
             return wave_bytes
         except Exception as e:
             # エラーの詳細情報をログに出力
@@ -87,40 +289,262 @@ class VoiceVoxHandler:
             print(f"Traceback: {traceback.format_exc()}")
             return None
 
-    async def play_audio_in_vc(self, voice_client: discord.VoiceClient, audio_data: bytes):
-        """ボイスチャンネルで音声データを再生する"""
+    async def synthesize_pcm(self, text: str, audio_query=None, profile: SynthesisProfile | None = None) -> bytes | None:
+        """Discordの再生形式（48kHz・ステレオ・16bit PCM）の音声データを生成する
+
+        VOICEVOX側で出力形式を合わせるため、FFmpegによる変換なしでそのまま再生できる。
+        プロファイルで指定されていれば、前後に残る無音を取り除く。
+        """
+        profile = profile or self.default_profile
+        if audio_query is None:
+            audio_query = await self.create_audio_query(text, profile=profile)
+            if audio_query is None:
+                return None
+
+        audio_query.output_sampling_rate = self.PCM_SAMPLING_RATE
+        audio_query.output_stereo = True
+        wave_bytes = await self.synthesize_voice(text, audio_query=audio_query)
+        if wave_bytes is None:
+            return None
+
+        try:
+            pcm_data = self.wav_to_pcm(wave_bytes)
+        except Exception as e:
+            print(f"WAVデータの変換中にエラーが発生しました: {e}")
+            return None
+        if profile.trim_silence:
+            pcm_data = trim_silence(pcm_data, threshold=SYNTHESIS_SILENCE_THRESHOLD)
+        return pcm_data
+
+    @classmethod
+    def wav_to_pcm(cls, wave_bytes: bytes) -> bytes:
+        """WAVデータからヘッダを取り除き、PCMのフレームを返す"""
+        with wave.open(io.BytesIO(wave_bytes), "rb") as wav:
+            if wav.getframerate() != cls.PCM_SAMPLING_RATE or wav.getnchannels() != 2 or wav.getsampwidth() != 2:
+                raise ValueError(
+                    f"想定外のWAV形式です（{wav.getframerate()}Hz, {wav.getnchannels()}ch, {wav.getsampwidth() * 8}bit）"
+                )
+            return wav.readframes(wav.getnframes())
+
+    @property
+    def supports_streaming(self) -> bool:
+        """分割レンダリング（precompute_render/render）が使えるか"""
+        return self.synthesizer is not None and hasattr(self.synthesizer, "precompute_render")
+
+    async def stream_voice(self, voice_client: discord.VoiceClient, text: str, audio_query=None,
+                           priority: int = PRIORITY_READOUT, after_track: MixerTrack | None = None,
+                           cache_key: str | None = None, profile: SynthesisProfile | None = None) -> MixerTrack | None:
+        """音声を少しずつレンダリングしながら再生する
+
+        音響特徴量（音素長・ピッチ）の推論だけを先に行い、波形は先頭から順にチャンク単位で生成する。
+        最初のチャンクができた時点で再生を開始し、残りはバックグラウンドで追加していく。
+        after_track を指定すると、最初のチャンクまで準備してから、その音声の再生終了とセグメント間の間隔を待って再生を始める。
+        前後の無音は合成プロファイルの無音の長さで短くする（レンダリング済みのチャンクは削らない）。
+        cache_key を指定すると、最後までレンダリングできた音声をOpusパケットとしてキャッシュする。
+        """
         if not voice_client or not voice_client.is_connected():
             print("エラー: ボイスクライアントが無効です。")
-            return False
+            return None
+
+        profile = profile or self.default_profile
+        if audio_query is None:
+            audio_query = await self.create_audio_query(text, profile=profile)
+            if audio_query is None:
+                return None
+
+        audio_query.output_sampling_rate = self.PCM_SAMPLING_RATE
+        audio_query.output_stereo = True
+
+        try:
+            audio_feature = await self.synthesizer.precompute_render(audio_query, self.style_id)
+            total_frames = audio_feature.frame_length
+            first_stop = min(VOICEVOX_STREAM_FIRST_CHUNK_FRAMES, total_frames)
+            first_chunk = self.wav_to_pcm(await self.synthesizer.render(audio_feature, 0, first_stop))
+        except Exception as e:
+            print(f"VOICEVOXストリーミング合成エラー: {e}")
+            print(f"Traceback: {traceback.format_exc()}")
+            return None
+
+        source = StreamingPCMAudio()
+        source.feed(first_chunk)
+        chunks = [first_chunk] if cache_key else None
+        if first_stop >= total_frames:
+            source.finish()
+            if cache_key:
+                self._cache_pcm(cache_key, first_chunk)
+
+        if after_track:
+            await self._wait_for_previous(after_track, profile.segment_gap)
+        track = await self.play_source(voice_client, source, priority=priority)
+        if track is None:
+            return None
+
+        if first_stop < total_frames:
+            task = asyncio.create_task(
+                self._feed_stream(source, audio_feature, first_stop, total_frames, chunks=chunks, cache_key=cache_key)
+            )
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+        return track
+
+    async def _feed_stream(self, source: StreamingPCMAudio, audio_feature, start: int, total_frames: int,
+                           chunks: list | None = None, cache_key: str | None = None):
+        """残りのフレームをチャンク単位でレンダリングしてAudioSourceに追加する"""
+        try:
+            while start < total_frames and not source.closed:
+                stop = min(start + VOICEVOX_STREAM_CHUNK_FRAMES, total_frames)
+                chunk = self.wav_to_pcm(await self.synthesizer.render(audio_feature, start, stop))
+                source.feed(chunk)
+                if chunks is not None:
+                    chunks.append(chunk)
+                start = stop
+            if cache_key and start >= total_frames:
+                self._cache_pcm(cache_key, b"".join(chunks))
+        except Exception as e:
+            print(f"VOICEVOXストリーミング合成エラー: {e}")
+        finally:
+            source.finish()
+
+    def cache_key(self, text: str, profile: SynthesisProfile | None = None) -> str:
+        """合成済み音声キャッシュのキー（モデル・話者・合成プロファイル・整形後のテキスト）"""
+        profile = profile or self.default_profile
+        return f"{self.model_id}:{self.style_id}:{profile.name}:{self.text_normalizer.normalize(text)}"
+
+    def _cache_pcm(self, cache_key: str, pcm_data: bytes):
+        """PCMをバックグラウンドでOpusにエンコードしてキャッシュする（libopusが使えなければ何もしない）"""
+        if self._opus_available is None:
+            self._opus_available = opus_available()
+            if not self._opus_available:
+                print("libopusを読み込めないため、合成済み音声のキャッシュを無効にします。")
+        if not self._opus_available:
+            return
+
+        async def encode():
+            try:
+                packets = await asyncio.to_thread(encode_opus_packets, pcm_data)
+                self.opus_cache.put(cache_key, packets)
+            except Exception as e:
+                print(f"Opusエンコード中にエラーが発生しました: {e!r}")
+
+        task = asyncio.create_task(encode())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def play_cached(self, voice_client: discord.VoiceClient, cache_key: str, priority: int = PRIORITY_READOUT,
+                          after_track: MixerTrack | None = None, gap: float | None = None) -> MixerTrack | None:
+        """キャッシュ済みのOpusパケットを再生する（キャッシュになければNone）"""
+        packets = self.opus_cache.get(cache_key)
+        if packets is None:
+            return None
+        if after_track:
+            await self._wait_for_previous(after_track, gap)
+        return await self.play_source(voice_client, OpusPacketAudio(packets), priority=priority)
+
+    async def speak_text(self, voice_client: discord.VoiceClient, text: str, priority: int = PRIORITY_READOUT,
+                         profile: SynthesisProfile | None = None) -> MixerTrack | None:
+        """テキストを読み上げる（同じ文章はキャッシュ済みのOpusパケットを再生する）"""
+        cache_key = self.cache_key(text, profile)
+        track = await self.play_cached(voice_client, cache_key, priority=priority)
+        if track:
+            return track
+
+        pcm_data = await self.synthesize_pcm(text, profile=profile)
+        if not pcm_data:
+            return None
+        self._cache_pcm(cache_key, pcm_data)
+        return await self.play_source(voice_client, PCMBufferAudio(pcm_data), priority=priority)
+
+    async def _wait_for_previous(self, track: MixerTrack, gap: float | None = None):
+        """前のセグメントの再生終了と、セグメント間の間隔（未指定なら既定のプロファイルの間隔）を待つ"""
+        await track.wait()
+        await asyncio.sleep(self.default_profile.segment_gap if gap is None else gap)
+
+    async def play_source(self, voice_client: discord.VoiceClient, source: discord.AudioSource,
+                          priority: int = PRIORITY_READOUT, gain: float = 1.0, after=None) -> MixerTrack | None:
+        """ミキサー経由でAudioSourceを再生する（他の音声の再生中でも重ねて再生できる）"""
+        return await self.mixer.play(voice_client, source, gain=gain, priority=priority, after=after)
+
+    async def play_audio_in_vc(self, voice_client: discord.VoiceClient, audio_data: bytes,
+                               priority: int = PRIORITY_READOUT, after_track: MixerTrack | None = None) -> MixerTrack | None:
+        """ボイスチャンネルで音声データ（WAV）を再生する
+
+        after_track を指定すると、その音声の再生終了とセグメント間の間隔を待ってから再生を始める。
+        """
+        if not voice_client or not voice_client.is_connected():
+            print("エラー: ボイスクライアントが無効です。")
+            return None
 
         try:
             # 音声データをBytesIOに変換
             audio_stream = io.BytesIO(audio_data)
             audio_source = discord.FFmpegPCMAudio(audio_stream, pipe=True)
-            
-            if not voice_client.is_playing():
-                def after_playing(error):
-                    if error:
-                        print(f'再生エラー: {error}')
-                    else:
-                        print('再生終了')
-                    # リソースのクリーンアップ
-                    try:
-                        audio_source.cleanup()
-                        audio_stream.close()
-                    except Exception as cleanup_error:
-                        print(f'リソースクリーンアップエラー: {cleanup_error}')
-                
-                voice_client.play(audio_source, after=after_playing)
-                return True
-            else:
-                # すでに再生中の場合はリソースをクリーンアップ
-                try:
-                    audio_source.cleanup()
-                    audio_stream.close()
-                except Exception as cleanup_error:
-                    print(f'リソースクリーンアップエラー: {cleanup_error}')
-                return False
         except Exception as e:
             print(f"音声再生中にエラーが発生しました: {e}")
-            return False 
\ No newline at end of file
+            return None
+
+        if after_track:
+            await self._wait_for_previous(after_track)
+        # BytesIOは再生終了時（または再生できなかった時点）に閉じる
+        return await self.play_source(voice_client, audio_source, priority=priority, after=audio_stream.close)
+
+    async def speak_segments(self, guild: discord.Guild, planned_segments: AsyncIterator, priority: int = PRIORITY_READOUT,
+                             on_failure=None, profile: SynthesisProfile | None = None) -> bool:
+        """plan_speechが返すセグメントを順に読み上げる
+
+        前のセグメントの再生中に次のセグメントのAudioQueryを作成・合成しておき、再生が終わり次第つなげて再生する。
+        途中でdiscord.pyが再接続している間は、接続が戻るまで待ってから残りのセグメントを読み上げる。
+        on_failure(segment, reason) を指定すると、合成・再生に失敗したときに呼び出す。
+        profile はplan_speechに渡したものと同じ合成プロファイル（未指定ならギルドで選択されているもの）。
+        """
+        profile = profile or self.profile_for(guild.id)
+        try:
+            return await self._speak_planned(guild, planned_segments, priority, on_failure, profile)
+        finally:
+            if hasattr(planned_segments, "aclose"):
+                # 途中で終了した場合は、残りのAudioQueryを作成しない
+                await planned_segments.aclose()
+
+    async def _speak_planned(self, guild: discord.Guild, planned_segments: AsyncIterator, priority: int, on_failure,
+                             profile: SynthesisProfile) -> bool:
+        previous_track = None
+        async for segment, audio_query in planned_segments:
+            voice_client = guild.voice_client
+            # ボイス接続状態を再確認（再接続中なら、接続が戻るまで待つ）
+            if (not voice_client or not voice_client.is_connected()) and self.voice_sessions:
+                voice_client = await self.voice_sessions.wait_until_connected(guild)
+            if not voice_client or not voice_client.is_connected():
+                print("読み上げ中にボイスチャンネルから切断されました。")
+                return False
+
+            # 同じ文章を読み上げたことがあれば、合成せずにキャッシュ済みのパケットを再生する
+            cache_key = self.cache_key(segment, profile)
+            track = await self.play_cached(voice_client, cache_key, priority=priority, after_track=previous_track,
+                                           gap=profile.segment_gap)
+            if track is None and VOICEVOX_STREAMING and self.supports_streaming:
+                # 合成しながら再生する（先頭のチャンクができた時点で再生が始まる）
+                track = await self.stream_voice(voice_client, segment, audio_query=audio_query, priority=priority,
+                                                after_track=previous_track, cache_key=cache_key, profile=profile)
+                if track is None:
+                    if on_failure:
+                        await on_failure(segment, "音声合成・再生")
+                    return False
+            elif track is None:
+                pcm_data = await self.synthesize_pcm(segment, audio_query=audio_query, profile=profile)
+                if not pcm_data:
+                    if on_failure:
+                        await on_failure(segment, "音声生成")
+                    return False
+                self._cache_pcm(cache_key, pcm_data)
+                if previous_track:
+                    await self._wait_for_previous(previous_track, profile.segment_gap)
+                track = await self.play_source(voice_client, PCMBufferAudio(pcm_data), priority=priority)
+                if track is None:
+                    if on_failure:
+                        await on_failure(segment, "音声再生")
+                    return False
+
+            previous_track = track
+
+        if previous_track:
+            await previous_track.wait()
+        return True
@@ -0,0 +1,87 @@
+from typing import Dict, List, Optional
+import discord
+from utils.rate_limiter import discord_message_limiter
+
+class MessageRenderer:
+    """長いテキストをできるだけ少ないメッセージにまとめて送信するためのユーティリティクラス
+
+    2000文字以内ならそのまま本文として、それより長い場合はEmbedの説明文（4096文字）に分け、
+    1メッセージにEmbedを最大10個・合計6000文字まで詰める。
+    最初のメッセージはインタラクションの元の応答（「考え中...」の表示）を編集して送る。
+    """
+
+    CONTENT_LIMIT = 2000  # メッセージ本文の最大文字数
+    EMBED_DESCRIPTION_LIMIT = 4096  # Embedの説明文の最大文字数
+    EMBED_TOTAL_LIMIT = 6000  # 1メッセージ内のEmbedの合計文字数
+    EMBEDS_PER_MESSAGE = 10  # 1メッセージに付けられるEmbedの数
+    MIN_CHUNK_LENGTH = 200  # 残りの文字数がこれ未満なら次のメッセージに回す
+
+    # 分割位置として優先する区切り（段落 → 行 → 文 → 空白）
+    _BREAKS = ("\n\n", "\n", "。", ". ", "、", " ")
+
+    @staticmethod
+    def split_first(text: str, limit: int) -> tuple[str, str]:
+        """limit文字以内で、できるだけ段落や文の区切りで分けた (先頭, 残り) を返す"""
+        if len(text) <= limit:
+            return text, ""
+        for delimiter in MessageRenderer._BREAKS:
+            position = text.rfind(delimiter, limit // 2, limit)
+            if position != -1:
+                cut = position + len(delimiter)
+                return text[:cut].rstrip(), text[cut:].lstrip()
+        return text[:limit], text[limit:]
+
+    @staticmethod
+    def render(text: str, embed: Optional[discord.Embed] = None,
+               color: discord.Color | None = None) -> List[Dict]:
+        """送信する各メッセージの引数（content または embeds）のリストを返す
+
+        embed を指定すると、そのタイトル・画像・フッターを付けた最初のEmbedに text を入れ、
+        収まらない分は同じ色の続きのEmbedに入れる。
+        """
+        if embed is None and len(text) <= MessageRenderer.CONTENT_LIMIT:
+            return [{"content": text}]
+
+        color = embed.color if embed is not None else (color or discord.Color.blurple())
+        messages = []
+        remaining = text
+        first = True
+        while remaining or first:
+            embeds = []
+            budget = MessageRenderer.EMBED_TOTAL_LIMIT
+            while (remaining or first) and len(embeds) < MessageRenderer.EMBEDS_PER_MESSAGE:
+                current = embed.copy() if first and embed is not None else discord.Embed(color=color)
+                current.description = None
+                available = min(MessageRenderer.EMBED_DESCRIPTION_LIMIT, budget - len(current))
+                if embeds and available < min(MessageRenderer.MIN_CHUNK_LENGTH, len(remaining)):
+                    break
+                chunk, remaining = MessageRenderer.split_first(remaining, available)
+                current.description = chunk
+                budget -= len(current)
+                embeds.append(current)
+                first = False
+            messages.append({"embeds": embeds})
+        return messages
+
+    @staticmethod
+    async def send(interaction: discord.Interaction, text: str, embed: Optional[discord.Embed] = None,
+                   color: discord.Color | None = None):
+        """インタラクションへの応答として送信する
+
+        応答を保留（defer）している場合は元の応答を編集し、残りをフォローアップとして送る。
+        インタラクションの有効期限が切れている場合はチャンネルに直接送信する。
+        """
+        messages = MessageRenderer.render(text, embed=embed, color=color)
+        for index, message in enumerate(messages):
+            # レート制限を適用
+            await discord_message_limiter.acquire()
+            try:
+                if index == 0 and interaction.response.is_done():
+                    await interaction.edit_original_response(**message)
+                elif index == 0:
+                    await interaction.response.send_message(**message)
+                else:
+                    await interaction.followup.send(**message)
+            except discord.errors.NotFound:
+                # Interactionが無効な場合は直接チャンネルに送信
+                await interaction.channel.send(**message)
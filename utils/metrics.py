@@ -0,0 +1,60 @@
+from collections import deque
+from typing import Deque, Dict
+
+class Metric:
+    """1つの指標の件数・合計・最大値と、直近の値（パーセンタイル計算用）を保持するクラス"""
+
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent: Deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self._recent.append(value)
+
+    def percentile(self, ratio: float) -> float:
+        """直近の値のパーセンタイル（ratio は0〜1）"""
+        if not self._recent:
+            return 0.0
+        values = sorted(self._recent)
+        return values[min(len(values) - 1, int(ratio * len(values)))]
+
+    def summary(self) -> str:
+        mean = self.total / self.count if self.count else 0.0
+        return (
+            f"{self.count}件 平均 {mean:.3f} / p50 {self.percentile(0.5):.3f} / "
+            f"p95 {self.percentile(0.95):.3f} / 最大 {self.max:.3f}"
+        )
+
+
+class MetricsRegistry:
+    """名前付きの指標を集計し、ログに出力するクラス"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def observe(self, name: str, value: float):
+        """指標に値を1つ記録する"""
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = Metric()
+        metric.observe(value)
+
+    def get(self, name: str) -> Metric | None:
+        return self._metrics.get(name)
+
+    def log_summary(self):
+        """すべての指標の集計結果をログに出力する"""
+        for name, metric in sorted(self._metrics.items()):
+            print(f"メトリクス {name}: {metric.summary()}")
+
+    async def flush(self):
+        """停止時に集計結果を出力する（LifecycleManagerのフックとして登録する）"""
+        self.log_summary()
+
+# グローバルなメトリクスインスタンス
+metrics = MetricsRegistry()
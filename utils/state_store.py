@@ -0,0 +1,253 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+class StateStore:
+    """キャッシュ・ギルド設定をSQLite（WALモード）に永続化するクラス
+
+    SQLiteへのアクセスは専用スレッド1本で直列に行い、イベントループをブロックしない。
+    書き込みはメモリ上に溜めて一定間隔（または一定件数）ごとに1トランザクションでまとめて反映する。
+    """
+
+    _DELETED = object()  # 削除予定を表す番兵
+
+    def __init__(self, path: str, flush_interval: float = 1.0, batch_size: int = 200):
+        """
+        Args:
+            path: SQLiteデータベースファイルのパス
+            flush_interval: 書き込みをまとめて反映する間隔（秒）
+            batch_size: この件数に達したら間隔を待たずに反映する
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_event: Optional[asyncio.Event] = None
+        self._flush_lock = asyncio.Lock()
+
+        # 未反映の書き込み
+        self._pending_kv: Dict[Tuple[str, str], Tuple[Any, Optional[float]]] = {}
+
+        # ギルド設定は小さいため、起動時に全件読み込んでメモリ上で参照する
+        self._guild_settings: Dict[int, Dict[str, Any]] = {}
+
+    @property
+    def is_open(self) -> bool:
+        return self._conn is not None
+
+    async def _run(self, func, *args):
+        """専用スレッドで関数を実行する"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def open(self):
+        """データベースを開き、ギルド設定を読み込んでバックグラウンドの書き込みを開始する"""
+        if self.is_open:
+            return
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-store")
+        self._conn = await self._run(self._open_db)
+        self._flush_event = asyncio.Event()
+
+        for key, value in (await self.load_namespace("guild_settings")).items():
+            self._guild_settings[int(key)] = value
+
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        print(f"状態ストア {self.path} を開きました（ギルド設定 {len(self._guild_settings)}件）。")
+
+    def _open_db(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS kv (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB,
+                is_json INTEGER NOT NULL DEFAULT 1,
+                expires_at REAL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )"""
+        )
+        # 期限切れのキャッシュは起動時に掃除しておく
+        conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+        conn.commit()
+        return conn
+
+    @staticmethod
+    def _encode(value: Any) -> Tuple[Any, int]:
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return bytes(value), 0
+        return json.dumps(value, ensure_ascii=False), 1
+
+    @staticmethod
+    def _decode(value: Any, is_json: int) -> Any:
+        return json.loads(value) if is_json else value
+
+    # --- キー・バリュー ---
+
+    async def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        """値を取得する（未反映の書き込みも考慮する）"""
+        pending = self._pending_kv.get((namespace, key))
+        if pending is not None:
+            value, expires_at = pending
+            if value is self._DELETED or (expires_at is not None and expires_at < time.time()):
+                return default
+            return value
+
+        if not self.is_open:
+            return default
+
+        row = await self._run(self._select_one, namespace, key)
+        if row is None:
+            return default
+        value, is_json, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            return default
+        return self._decode(value, is_json)
+
+    def _select_one(self, namespace: str, key: str):
+        return self._conn.execute(
+            "SELECT value, is_json, expires_at FROM kv WHERE namespace = ? AND key = ?",
+            (namespace, key),
+        ).fetchone()
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        """値を書き込む（実際の反映はバッチでまとめて行う）"""
+        expires_at = time.time() + ttl if ttl else None
+        self._pending_kv[(namespace, key)] = (value, expires_at)
+        self._notify_pending()
+
+    def delete(self, namespace: str, key: str):
+        """値を削除する（実際の反映はバッチでまとめて行う）"""
+        self._pending_kv[(namespace, key)] = (self._DELETED, None)
+        self._notify_pending()
+
+    async def load_namespace(self, namespace: str) -> Dict[str, Any]:
+        """名前空間の全エントリを1回のクエリで読み込む（ウォームスタート用）"""
+        result: Dict[str, Any] = {}
+        if self.is_open:
+            rows = await self._run(self._select_namespace, namespace)
+            now = time.time()
+            for key, value, is_json, expires_at in rows:
+                if expires_at is None or expires_at >= now:
+                    result[key] = self._decode(value, is_json)
+
+        # 未反映の書き込みを上書きで反映する
+        for (pending_namespace, key), (value, _) in self._pending_kv.items():
+            if pending_namespace != namespace:
+                continue
+            if value is self._DELETED:
+                result.pop(key, None)
+            else:
+                result[key] = value
+        return result
+
+    def _select_namespace(self, namespace: str):
+        return self._conn.execute(
+            "SELECT key, value, is_json, expires_at FROM kv WHERE namespace = ?",
+            (namespace,),
+        ).fetchall()
+
+    # --- ギルド設定 ---
+
+    def get_guild_setting(self, guild_id: int, key: str, default: Any = None) -> Any:
+        """ギルド設定を取得する（メモリ上のコピーを参照するため待機しない）"""
+        return self._guild_settings.get(guild_id, {}).get(key, default)
+
+    def set_guild_setting(self, guild_id: int, key: str, value: Any):
+        """ギルド設定を更新する"""
+        settings = self._guild_settings.setdefault(guild_id, {})
+        if settings.get(key) == value:
+            return
+        settings[key] = value
+        self.set("guild_settings", str(guild_id), dict(settings))
+
+    # --- 書き込みの反映 ---
+
+    def _notify_pending(self):
+        if self._flush_event and len(self._pending_kv) >= self.batch_size:
+            self._flush_event.set()
+
+    async def _flush_loop(self):
+        """一定間隔、またはバッチサイズに達したときに書き込みを反映する"""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"状態ストアへの書き込み中にエラーが発生しました: {e}")
+
+    async def flush(self):
+        """未反映の書き込みを1トランザクションでデータベースに反映する"""
+        if not self.is_open:
+            return
+
+        async with self._flush_lock:
+            if not self._pending_kv:
+                return
+            kv_batch, self._pending_kv = self._pending_kv, {}
+            try:
+                await self._run(self._write_batch, kv_batch)
+            except Exception:
+                # 失敗した分は次回に持ち越す（その間に書かれた新しい値を優先する）
+                kv_batch.update(self._pending_kv)
+                self._pending_kv = kv_batch
+                raise
+
+    def _write_batch(self, kv_batch):
+        now = time.time()
+        with self._conn:
+            upserts = []
+            deletes = []
+            for (namespace, key), (value, expires_at) in kv_batch.items():
+                if value is self._DELETED:
+                    deletes.append((namespace, key))
+                else:
+                    encoded, is_json = self._encode(value)
+                    upserts.append((namespace, key, encoded, is_json, expires_at, now))
+            if upserts:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO kv (namespace, key, value, is_json, expires_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    upserts,
+                )
+            if deletes:
+                self._conn.executemany("DELETE FROM kv WHERE namespace = ? AND key = ?", deletes)
+
+    async def close(self):
+        """未反映の書き込みを反映してデータベースを閉じる"""
+        if not self.is_open:
+            return
+
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+
+        try:
+            await self.flush()
+        finally:
+            conn, self._conn = self._conn, None
+            await asyncio.get_running_loop().run_in_executor(self._executor, conn.close)
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            print("状態ストアを閉じました。")